@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: benchmark.py
+# @Time: 2023/09/30 10:00:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+'''
+性能基准测试，用固定随机种子生成的Excel文件分别测量各阶段的用时
+    python benchmark.py run --sizes 10000 100000 1000000 -o bench.json
+    python benchmark.py compare base.json bench.json --threshold 0.1
+阶段：
+    generate    生成测试文件（不计入对比）
+    read_excel  逐行读取Excel文件
+    insert      创建表并插入数据
+    query_*     代表性的查询：过滤、分组、两个表连接，执行并取出全部结果
+    display     在offscreen的Qt平台中显示查询结果（没有安装PyQt5时跳过）
+    export_*    查询结果追加到xlsx文件、导出为csv文件
+    import_csv      导入和orders表格相同数据的csv文件（检测格式、推断类型、插入）
+    import_csv_raw  csv模块读取后直接插入文本，不推断类型，作为csv导入速度的上限
+    peak_rss_mb     内存峰值（MB），每个大小在单独的子进程中测试，用--memory-threshold对比
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import multiprocessing
+import csv
+import datetime
+import platform
+import statistics
+import sqlite3
+import tempfile
+from pathlib import Path
+from sql_engine import SqlEngine, StorageProfile, iter_cursor_batches, export_batches
+from result_writers import XlsxResultWriter, CsvResultWriter
+from excel_reader import iter_excel_sheets
+from result_store import ResultStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+DEFAULT_SEED = 20230930
+GENERATE_BATCH_SIZE = 5000
+CATEGORIES = ('电子', '服装', '食品', '图书', '家居', '运动', '美妆', '母婴')
+
+QUERIES = {
+    'query_filter': 'select * from orders where amount > 500 and category = \'食品\'',
+    'query_group_by': 'select category, count(*), sum(amount), avg(quantity) from orders group by category',
+    'query_join': 'select c.region, count(*), sum(o.amount) from orders o join customers c on o.customer_id = c.customer_id group by c.region',
+}
+EXPORT_SQL = QUERIES['query_filter']
+# 不参与对比的阶段
+IGNORED_PHASES = ('generate',)
+# 内存（MB）而不是用时的阶段
+MEMORY_PHASES = ('peak_rss_mb',)
+
+
+def peak_rss_mb() -> float:
+    '''
+    进程的内存峰值，取不到时返回None
+    '''
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # linux是KB，macOS是字节
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 ** 2
+    except (ImportError, AttributeError):
+        return None
+
+
+def _iter_orders(rows: int, customers: int, seed: int):
+    rng = random.Random(seed)
+    start_date = datetime.date(2020, 1, 1)
+    for index in range(rows):
+        yield (
+            index + 1, # INTEGER
+            rng.randint(1, customers), # INTEGER 连接列
+            rng.choice(CATEGORIES), # TEXT 分组列
+            round(rng.uniform(1, 1000), 2), # REAL
+            rng.randint(1, 20), # INTEGER
+            (start_date + datetime.timedelta(days=rng.randint(0, 1460))).isoformat(), # DATE
+            f'{rng.randint(0, 99999):06d}', # 0开头的编号，TEXT
+            None if rng.random() < 0.05 else f'备注{rng.randint(1, 1000)}', # 有空值的TEXT
+        )
+
+
+def _iter_customers(customers: int, seed: int):
+    rng = random.Random(seed + 1)
+    for index in range(customers):
+        yield (index + 1, f'客户{index + 1}', rng.choice(('华东', '华南', '华北', '西南', '西北', '东北')))
+
+
+ORDERS_COLUMNS = ['order_id', 'customer_id', 'category', 'amount', 'quantity', 'order_date', 'code', 'remark']
+CUSTOMERS_COLUMNS = ['customer_id', 'name', 'region']
+
+
+def _batched(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_workbook(pname: Path, rows: int, seed: int) -> None:
+    '''
+    生成有orders和customers两个表格的xlsx文件，customers的行数是orders的1/10
+    '''
+    customers = max(rows // 10, 1)
+    writer = XlsxResultWriter(pname, ORDERS_COLUMNS, 'orders', append=False)
+    try:
+        for batch in _batched(_iter_orders(rows, customers, seed), GENERATE_BATCH_SIZE):
+            writer.write_rows(batch)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    writer = XlsxResultWriter(pname, CUSTOMERS_COLUMNS, 'customers', append=True)
+    try:
+        for batch in _batched(_iter_customers(customers, seed), GENERATE_BATCH_SIZE):
+            writer.write_rows(batch)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def generate_csv(pname: Path, rows: int, seed: int) -> None:
+    '''
+    生成和xlsx文件中orders表格相同数据的csv文件
+    '''
+    writer = CsvResultWriter(pname, ORDERS_COLUMNS)
+    try:
+        for batch in _batched(_iter_orders(rows, max(rows // 10, 1), seed), GENERATE_BATCH_SIZE):
+            writer.write_rows(batch)
+    finally:
+        writer.close()
+
+
+def _timed(phases: dict, name: str, func):
+    t1 = time.perf_counter()
+    try:
+        result = func()
+    except ImportError as ex:
+        phases[name] = None
+        logging.warning(f'跳过[{name}]：{str(ex)}')
+        return None
+    phases[name] = time.perf_counter() - t1
+    return result
+
+
+def _read_sheets(pname: Path) -> dict:
+    return {sheet.name: (sheet.columns, list(sheet.rows)) for sheet in iter_excel_sheets(pname)}
+
+
+def _import_csv_raw(engine: SqlEngine, pname: Path) -> None:
+    with open(pname, encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        with engine.bulk_load():
+            engine.conn.execute('BEGIN')
+            engine.conn.execute(f'CREATE TABLE csv_raw ({", ".join([f"[{col}]" for col in columns])})')
+            engine.conn.executemany(f'INSERT INTO csv_raw VALUES ({", ".join(["?"] * len(columns))})', reader)
+            engine.conn.commit()
+
+
+def _display(engine: SqlEngine, sql: str) -> None:
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication, QTableView
+    from query_result_model import QueryResultModel
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    view = QTableView()
+    model = QueryResultModel(view)
+    view.setModel(model)
+    view.resize(1200, 800)
+    view.show()
+    cursor = engine.conn.execute(sql)
+    columns = [desc[0] for desc in cursor.description]
+    model.set_result(columns, ResultStore(columns), cursor)
+    app.processEvents()
+    # 模拟滚动到底部，所有数据都经过模型
+    while model.canFetchMore():
+        model.fetchMore()
+    view.scrollToBottom()
+    app.processEvents()
+    view.close()
+
+
+def run_once(pname: Path, csv_pname: Path, work_dir: Path, seed: int, rows: int, disk: bool = False) -> dict:
+    phases = {}
+    if disk:
+        engine = SqlEngine(profile=StorageProfile(True, str(work_dir)))
+    else:
+        engine = SqlEngine()
+    try:
+        sheets = _timed(phases, 'read_excel', lambda: _read_sheets(pname))
+        if sheets is None:
+            # 没有安装openpyxl时用生成器的数据测试插入
+            customers = max(rows // 10, 1)
+            sheets = {'orders': (ORDERS_COLUMNS, list(_iter_orders(rows, customers, seed))),
+                      'customers': (CUSTOMERS_COLUMNS, list(_iter_customers(customers, seed)))}
+
+        def insert():
+            with engine.bulk_load():
+                engine.conn.execute('BEGIN')
+                for sheet_name, (columns, sheet_rows) in sheets.items():
+                    engine.import_sheet(sheet_name, columns, sheet_rows)
+                engine.conn.commit()
+        _timed(phases, 'insert', insert)
+        sheets = None
+        for name, sql in QUERIES.items():
+            _timed(phases, name, lambda: engine.conn.execute(sql).fetchall())
+        _timed(phases, 'display', lambda: _display(engine, QUERIES['query_filter']))
+
+        def export(target: Path, append: bool):
+            cursor = engine.conn.execute(EXPORT_SQL)
+            columns = [desc[0] for desc in cursor.description]
+            export_batches(engine.conn, iter_cursor_batches(cursor, engine.FETCH_BATCH_SIZE), target, columns, 'result', append)
+        xlsx_target = work_dir / 'export.xlsx'
+        shutil.copyfile(pname, xlsx_target)
+        _timed(phases, 'export_xlsx', lambda: export(xlsx_target, True))
+        _timed(phases, 'export_csv', lambda: export(work_dir / 'export.csv', False))
+        _timed(phases, 'import_csv', lambda: engine.import_excel(csv_pname))
+        _timed(phases, 'import_csv_raw', lambda: _import_csv_raw(engine, csv_pname))
+    finally:
+        engine.close()
+    return phases
+
+
+def _run_size(pname: Path, csv_pname: Path, seed: int, rows: int, repeat: int, disk: bool) -> tuple[list[dict], float]:
+    '''
+    在子进程中执行一个大小的所有测试，返回(每次的结果, 内存峰值)
+    ru_maxrss只增不减，每个大小用新的进程，内存峰值才不包括前面测试的其他大小
+    '''
+    runs = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for index in range(repeat):
+            logging.info(f'[{rows}行] 第[{index + 1}/{repeat}]次')
+            runs.append(run_once(pname, csv_pname, Path(work_dir), seed, rows, disk))
+    return runs, peak_rss_mb()
+
+
+def run_benchmark(sizes: list[int], repeat: int, seed: int, data_dir: Path, disk: bool = False) -> dict:
+    data_dir.mkdir(parents=True, exist_ok=True)
+    report = {
+        'meta': {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+            'workspace': 'disk' if disk else 'memory',
+        },
+        'results': {},
+    }
+    for rows in sizes:
+        pname = data_dir / f'benchmark_{rows}_{seed}.xlsx'
+        csv_pname = pname.with_suffix('.csv')
+        phases = {}
+        if not pname.is_file():
+            _timed(phases, 'generate', lambda: generate_workbook(pname, rows, seed))
+        if not csv_pname.is_file():
+            generate_csv(csv_pname, rows, seed)
+        # spawn的子进程不继承当前进程的内存，fork时子进程的峰值从当前进程的内存开始算
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            runs, peak = pool.apply(_run_size, (pname, csv_pname, seed, rows, repeat, disk))
+        for name in runs[0]:
+            values = [run[name] for run in runs if run[name] is not None]
+            # 多次运行取中位数
+            phases[name] = statistics.median(values) if values else None
+        phases['peak_rss_mb'] = peak
+        report['results'][str(rows)] = phases
+        logging.info(f'[{rows}行] ' + '，'.join([f'{name}[{value:.3f}]' for name, value in phases.items() if value is not None]))
+    return report
+
+
+def compare_reports(base: dict, new: dict, threshold: float, min_seconds: float, memory_threshold: float = 0.2) -> list[str]:
+    '''
+    对比两次结果，返回变慢超过threshold的阶段，用时都小于min_seconds的阶段不比较（误差太大）
+    内存峰值是MB，不和min_seconds比较，增加超过memory_threshold时报告
+    '''
+    regressions = []
+    print(f'{"rows":>10} {"phase":<16} {"base":>10} {"new":>10} {"change":>8}')
+    for rows, phases in new['results'].items():
+        base_phases = base['results'].get(rows)
+        if not base_phases:
+            continue
+        for name, value in phases.items():
+            base_value = base_phases.get(name)
+            if name in IGNORED_PHASES or value is None or base_value is None:
+                continue
+            change = (value - base_value) / base_value if base_value else 0.0
+            flag = ''
+            if name in MEMORY_PHASES:
+                if change > memory_threshold:
+                    flag = ' <-- 内存增加'
+            elif change > threshold and max(value, base_value) >= min_seconds:
+                flag = ' <-- 变慢'
+            if flag:
+                regressions.append(f'[{rows}行] {name}: {base_value:.3f} -> {value:.3f} (+{change:.0%})')
+            print(f'{rows:>10} {name:<16} {base_value:>10.3f} {value:>10.3f} {change:>+8.0%}{flag}')
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='benchmark', description='sql_for_excel 性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='执行基准测试')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='测试文件的行数')
+    run_parser.add_argument('--repeat', type=int, default=3, help='每个大小重复的次数，结果取中位数')
+    run_parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='生成测试数据的随机种子')
+    run_parser.add_argument('--data-dir', type=Path, default=Path(tempfile.gettempdir()) / 'sql_for_excel_benchmark', help='测试文件的目录，已生成的文件会复用')
+    run_parser.add_argument('--disk', action='store_true', help='数据库放在临时文件中，测试大于内存的数据')
+    run_parser.add_argument('-o', '--output', type=Path, help='结果JSON文件')
+    compare_parser = subparsers.add_parser('compare', help='对比两次测试结果')
+    compare_parser.add_argument('base', type=Path)
+    compare_parser.add_argument('new', type=Path)
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='变慢超过这个比例时报告')
+    compare_parser.add_argument('--min-seconds', type=float, default=0.05, help='用时都小于这个值的阶段不比较')
+    compare_parser.add_argument('--memory-threshold', type=float, default=0.2, help='内存峰值增加超过这个比例时报告')
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        report = run_benchmark(args.sizes, args.repeat, args.seed, args.data_dir, args.disk)
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            args.output.write_text(text, encoding='utf-8')
+        else:
+            print(text)
+        return 0
+    base = json.loads(args.base.read_text(encoding='utf-8'))
+    new = json.loads(args.new.read_text(encoding='utf-8'))
+    regressions = compare_reports(base, new, args.threshold, args.min_seconds, args.memory_threshold)
+    if regressions:
+        print('\n变慢的阶段：\n' + '\n'.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: column_profile.py
+# @Time: 2023/11/18 15:40:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import sys
+import heapq
+import sqlite3
+from collections import Counter, namedtuple
+from functools import partial
+from itertools import repeat
+from operator import is_not
+from typing import Callable
+
+PROFILE_BATCH_SIZE = 5000
+DISTINCT_SKETCH_SIZE = 2048 # KMV保留的最小哈希值个数，估算的误差大约是1/sqrt(k)，2%
+TOP_VALUES_CAPACITY = 10000 # 统计常见值时最多保留的不同值个数
+TOP_VALUES_COUNT = 5
+_HASH_SALT = 0x5f3759df # 和值组成tuple再取哈希，小整数的哈希值也能均匀分布
+_HASH_RANGE = 2 ** sys.hash_info.width
+
+# 一列的统计信息
+# rows: 总行数，nulls: 空值个数
+# min_value, max_value: 按sqlite的规则比较（数字 < 文本 < blob），全是空值时为None
+# distinct: 不同值的个数，distinct_exact为False时是估算值
+# top: [(值, 次数)]，top_exact为False时次数是下限
+ColumnProfile = namedtuple('ColumnProfile', ['name', 'rows', 'nulls', 'min_value', 'max_value', 'distinct', 'distinct_exact', 'top', 'top_exact'])
+
+
+def _type_rank(value) -> int:
+    return 2 if isinstance(value, bytes) else 1 if isinstance(value, str) else 0
+
+
+def _min_max(values: list) -> tuple:
+    '''
+    一批非空值的最小值和最大值，大多数列只有一种类型，直接用min、max
+    '''
+    types = set(map(type, values))
+    if len(types) == 1 or types == {int, float}:
+        return min(values), max(values)
+    groups = {}
+    for value in values:
+        groups.setdefault(_type_rank(value), []).append(value)
+    return min(groups[min(groups)]), max(groups[max(groups)])
+
+
+class DistinctSketch:
+    '''
+    估算不同值的个数（K Minimum Values），只保留最小的k个哈希值，内存和行数无关
+    不同值少于k个时就是准确值
+    '''
+    def __init__(self, k: int = DISTINCT_SKETCH_SIZE) -> None:
+        self._k = k
+        self._hashes = set()
+        self._truncated = False
+
+    def update(self, values: list) -> None:
+        self._hashes.update(map(hash, zip(values, repeat(_HASH_SALT))))
+        if len(self._hashes) > self._k * 4:
+            # 积累一些再截断，nsmallest在C代码中完成
+            self._hashes = set(heapq.nsmallest(self._k, self._hashes))
+            self._truncated = True
+
+    @property
+    def exact(self) -> bool:
+        return not self._truncated and len(self._hashes) <= self._k
+
+    def estimate(self) -> int:
+        if self.exact:
+            return len(self._hashes)
+        kth = heapq.nsmallest(self._k, self._hashes)[-1]
+        # 哈希值是有符号整数，转换成(0, 1]之间的位置
+        return round((self._k - 1) / ((kth + _HASH_RANGE // 2 + 1) / _HASH_RANGE))
+
+
+class TopValues:
+    '''
+    统计出现次数最多的值（Misra-Gries），不同值超过容量时所有的计数减去一个阈值，去掉减到0的值
+    保留下来的计数最多少算了error次
+    '''
+    def __init__(self, capacity: int = TOP_VALUES_CAPACITY) -> None:
+        self._capacity = capacity
+        self._counter = Counter()
+        self._error = 0
+
+    def update(self, values: list) -> None:
+        self._counter.update(values)
+        if len(self._counter) > self._capacity:
+            kept = self._counter.most_common(self._capacity // 2 + 1)
+            threshold = kept[-1][1]
+            self._counter = Counter({value: count - threshold for value, count in kept if count > threshold})
+            self._error += threshold
+
+    @property
+    def exact(self) -> bool:
+        return self._error == 0
+
+    def top(self, count: int = TOP_VALUES_COUNT) -> list[tuple]:
+        '''
+        出现了多次的值，每个值都不同的列（编号、金额）没有常见值
+        '''
+        return [(value, count) for value, count in self._counter.most_common(count) if count > 1]
+
+
+class ColumnProfiler:
+    '''
+    一列的统计，数据分批传入，每一批都在C代码中完成大部分计算（count、filter、min、max、set、Counter）
+    '''
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._rows = 0
+        self._nulls = 0
+        self._min = None
+        self._max = None
+        self._distinct = DistinctSketch()
+        self._top = TopValues()
+
+    def update(self, values: tuple) -> None:
+        self._rows += len(values)
+        nulls = values.count(None)
+        if nulls == len(values):
+            self._nulls += nulls
+            return
+        if nulls:
+            self._nulls += nulls
+            values = list(filter(partial(is_not, None), values))
+        low, high = _min_max(values)
+        if self._min is None or (_type_rank(low), low) < (_type_rank(self._min), self._min):
+            self._min = low
+        if self._max is None or (_type_rank(high), high) > (_type_rank(self._max), self._max):
+            self._max = high
+        self._distinct.update(values)
+        self._top.update(values)
+
+    def result(self) -> ColumnProfile:
+        return ColumnProfile(self._name, self._rows, self._nulls, self._min, self._max, self._distinct.estimate(), self._distinct.exact,
+                             self._top.top(), self._top.exact)
+
+
+def profile_table(conn: sqlite3.Connection, table_name: str, batch_size: int = PROFILE_BATCH_SIZE,
+                  progress: Callable[[int], None] = None, cancelled: Callable[[], bool] = None) -> list[ColumnProfile]:
+    '''
+    扫描一遍表，统计每一列的空值、最小值、最大值、不同值个数和常见值，取消时返回None
+    '''
+    cursor = conn.execute(f'SELECT * FROM [{table_name}]')
+    profilers = [ColumnProfiler(desc[0]) for desc in cursor.description]
+    rows_count = 0
+    while True:
+        if cancelled and cancelled():
+            return None
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for profiler, values in zip(profilers, zip(*rows)):
+            profiler.update(values)
+        rows_count += len(rows)
+        if progress:
+            progress(rows_count)
+    return [profiler.result() for profiler in profilers]
+
+
+def _format_value(value, max_length: int = 30) -> str:
+    text = value.hex() if isinstance(value, bytes) else str(value)
+    return text if len(text) <= max_length else text[:max_length] + '...'
+
+
+def format_profile(profile: ColumnProfile) -> str:
+    '''
+    显示在字段节点的提示中
+    '''
+    lines = [f'共[{profile.rows}行]，空值[{profile.nulls}]，不同值[{"" if profile.distinct_exact else "约"}{profile.distinct}]']
+    if profile.min_value is not None:
+        lines.append(f'最小值：{_format_value(profile.min_value)}')
+        lines.append(f'最大值：{_format_value(profile.max_value)}')
+    if profile.top:
+        lines.append('常见值' + ('' if profile.top_exact else '（次数是下限）') + '：')
+        lines.extend([f'  {_format_value(value)} [{count}次]' for value, count in profile.top])
+    return '\n'.join(lines)
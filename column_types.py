@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: column_types.py
+# @Time: 2023/08/26 16:05:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import re
+import math
+import itertools
+import datetime
+from typing import Iterable, Iterator
+
+# 导入时支持的字段类型
+# DATE在sqlite中是NUMERIC亲和性，日期按 YYYY-MM-DD [HH:MM:SS] 格式的文本存储，可以直接比较和排序
+COLUMN_TYPES = ('INTEGER', 'REAL', 'DATE', 'TEXT')
+INFER_SAMPLE_SIZE = 1000 # 推断类型时采样的行数
+_CONVERT_BATCH_SIZE = 1000 # 按列转换时每批的行数
+
+# 0开头的数字（编号、邮编等）按文本处理
+_INTEGER_PATTERN = re.compile(r'^[+-]?(?:0|[1-9]\d*)$')
+_REAL_PATTERN = re.compile(r'^[+-]?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?$')
+_DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}:\d{2}(?:\.\d+)?)?$')
+# Excel数字的精度只有15位，超过15位的数字（身份证号等）一定是按文本录入的
+_MAX_NUMBER_DIGITS = 15
+# 一批文本用换行连接起来，一次匹配整批的值，和上面逐个值匹配的规则相同
+_INTEGER_BATCH_PATTERN = re.compile(r'(?:[+-]?(?:0|[1-9]\d{0,14})\n)*')
+_REAL_BATCH_PATTERN = re.compile(r'(?:[+-]?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?\n)*')
+_DATE_BATCH_PATTERN = re.compile(r'(?:\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}:\d{2}(?:\.\d+)?)?\n)*')
+
+
+def _digits_count(text: str) -> int:
+    return sum(1 for char in text if char.isdigit())
+
+
+def _within_number_digits(text: str) -> bool:
+    # 不超过15个字符时不用逐个字符统计数字个数，大部分的值都是这种情况
+    return len(text) <= _MAX_NUMBER_DIGITS or _digits_count(text) <= _MAX_NUMBER_DIGITS
+
+
+def _value_kind(value) -> str:
+    '''
+    单个值的类型：None 表示空值，否则为 int real date text
+    '''
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'text'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        return 'int' if value.is_integer() and abs(value) < 2 ** 53 else 'real'
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return 'date'
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+        if _within_number_digits(value):
+            if _INTEGER_PATTERN.match(value):
+                return 'int'
+            if _REAL_PATTERN.match(value):
+                return 'real'
+        if _DATE_PATTERN.match(value):
+            return 'date'
+    return 'text'
+
+
+def _column_type(kinds: set) -> str:
+    '''
+    一列中所有值的类型对应的字段类型，全是空值或者混有不同类型的列为TEXT
+    '''
+    if kinds == {'int'}:
+        return 'INTEGER'
+    if kinds and kinds <= {'int', 'real'}:
+        return 'REAL'
+    if kinds == {'date'}:
+        return 'DATE'
+    return 'TEXT'
+
+
+# 每种字段类型可以存放的值的类型，放宽类型时使用
+_TYPE_KINDS = {
+    'INTEGER': {'int'},
+    'REAL': {'int', 'real'},
+    'DATE': {'date'},
+    'TEXT': {'text'},
+}
+
+
+def infer_column_types(columns_count: int, rows: Iterable[tuple]) -> list[str]:
+    '''
+    根据样本数据推断每一列的类型，全是空值或者混有不同类型的列为TEXT
+    '''
+    kinds = [set() for _ in range(columns_count)]
+    for row in rows:
+        for index, value in enumerate(row):
+            kind = _value_kind(value)
+            if kind:
+                kinds[index].add(kind)
+    return [_column_type(column_kinds) for column_kinds in kinds]
+
+
+def widen_column_type(column_type: str, values: Iterable) -> str:
+    '''
+    能同时存放column_type类型的值和values的最窄的字段类型，例如INTEGER列遇到小数时为REAL，遇到文本时为TEXT
+    '''
+    kinds = set(_TYPE_KINDS.get(column_type, {'text'}))
+    kinds.update(kind for kind in map(_value_kind, values) if kind)
+    return _column_type(kinds)
+
+
+def _to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return str(value)
+
+
+def _to_integer(value):
+    if value is None:
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return None
+        if _within_number_digits(text) and _INTEGER_PATTERN.match(text):
+            return int(text)
+    # 采样之外不符合类型的值，存到INTEGER列中会被sqlite转换（0012变成12），由convert_rows放宽这一列的类型
+    raise ValueError(value)
+
+
+def _to_real(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return None if math.isnan(value) else float(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return None
+        if _within_number_digits(text) and _REAL_PATTERN.match(text):
+            return float(text)
+    raise ValueError(value)
+
+
+def _to_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time():
+            return value.strftime('%Y-%m-%d')
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return None
+        if _DATE_PATTERN.match(text):
+            # 和datetime的格式保持一致，零点的时间部分去掉
+            return text[:10] if text[10:] in ('', ' 00:00:00') else text
+    raise ValueError(value)
+
+
+_CONVERTERS = {
+    'INTEGER': _to_integer,
+    'REAL': _to_real,
+    'DATE': _to_date,
+    'TEXT': _to_text,
+}
+
+
+def _convert_text_batch(column_type: str, values: tuple) -> list:
+    '''
+    一批只有文本和空值的数据，所有的文本都符合column_type的格式时一次转换整批，
+    正则匹配、int、float都在C代码中完成，有不符合格式的值时返回None，再逐个值转换
+    '''
+    texts = [value for value in values if value is not None]
+    text = '\n'.join(texts) + '\n'
+    # 值本身有换行时不能按换行区分
+    if text.count('\n') != len(texts):
+        return None
+    if column_type == 'INTEGER':
+        if _INTEGER_BATCH_PATTERN.fullmatch(text):
+            return [None if value is None else int(value) for value in values]
+    elif column_type == 'REAL':
+        if _REAL_BATCH_PATTERN.fullmatch(text) and max(map(len, texts), default=0) <= _MAX_NUMBER_DIGITS:
+            return [None if value is None else float(value) for value in values]
+    elif column_type == 'DATE':
+        if _DATE_BATCH_PATTERN.fullmatch(text):
+            return [value[:10] if value is not None and value[10:] == ' 00:00:00' else value for value in values]
+    return None
+
+
+def _convert_column(column_type: str, values: tuple):
+    if set(map(type, values)) <= {str, type(None)}:
+        converted = values if column_type == 'TEXT' else _convert_text_batch(column_type, values)
+        if converted is not None:
+            return converted
+    return list(map(_CONVERTERS[column_type], values))
+
+
+def convert_rows(column_types: list[str], rows: Iterable[tuple]) -> Iterator[tuple]:
+    '''
+    把每一行的值转换成对应类型的sqlite原生值，每一行的长度都和column_types相同
+    按批转置成列，只有文本和空值的列（csv文件）整批转换，其他的列用map逐个值调用转换函数
+    推断类型的样本之后遇到不符合类型的值时，直接修改column_types放宽这一列的类型（见widen_column_type），
+    调用方插入数据前对比column_types，变化时先修改表的字段类型，已经转换的值放到放宽后的列中不会丢失内容
+    '''
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, _CONVERT_BATCH_SIZE))
+        if not batch:
+            return
+        columns = []
+        for index, values in enumerate(zip(*batch)):
+            try:
+                columns.append(_convert_column(column_types[index], values))
+            except ValueError:
+                column_types[index] = widen_column_type(column_types[index], values)
+                columns.append(_convert_column(column_types[index], values))
+        yield from zip(*columns)
+
+
+def typed_rows(columns: list[str], rows: Iterable[tuple], sample_size: int = INFER_SAMPLE_SIZE) -> tuple[list[str], Iterator[tuple]]:
+    '''
+    用前sample_size行推断每一列的类型，返回(类型列表, 转换后的行迭代器)
+    类型列表和convert_rows共用，迭代过程中可能被放宽
+    '''
+    rows = iter(rows)
+    sample = list(itertools.islice(rows, sample_size))
+    column_types = infer_column_types(len(columns), sample)
+    return column_types, convert_rows(column_types, itertools.chain(sample, rows))
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: completion_index.py
+# @Time: 2023/12/09 10:30:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import re
+from collections import namedtuple
+from typing import Iterable
+from sql_tokenizer import KEYWORDS, Token, tokenize, significant_tokens, is_identifier, is_keyword
+
+MAX_COMPLETIONS = 50 # 最多显示的候选个数
+
+# 一个补全候选
+# kind: keyword table column
+# text: 插入到SQL中的文本，不是普通标识符的名称加上[]
+Completion = namedtuple('Completion', ['name', 'kind', 'text'])
+
+# 后面跟表名的关键词
+_TABLE_KEYWORDS = ('FROM', 'JOIN', 'INTO', 'UPDATE', 'TABLE')
+# 子句开头的关键词，逗号后面是表名还是列名由前面最近的子句决定
+_CLAUSE_KEYWORDS = ('SELECT', 'FROM', 'WHERE', 'GROUP', 'ORDER', 'HAVING', 'LIMIT', 'ON', 'SET', 'VALUES', 'BY') + _TABLE_KEYWORDS
+_PLAIN_NAME_PATTERN = re.compile(r'[A-Za-z_\u0080-\U0010ffff][\w$\u0080-\U0010ffff]*')
+_CLOSING_QUOTES = {'[': ']', '"': '"', '`': '`'}
+
+
+def quote_identifier(name: str, quote: str = None) -> str:
+    '''
+    插入到SQL中的标识符，quote是用户已经输入的左引号，没有输入时只有包含空格、符号或者是关键词的名称才加[]
+    '''
+    if quote is None:
+        if _PLAIN_NAME_PATTERN.fullmatch(name) and name.upper() not in KEYWORDS:
+            return name
+        quote = '['
+    closing = _CLOSING_QUOTES[quote]
+    if quote != '[':
+        name = name.replace(quote, quote * 2)
+    return f'{quote}{name}{closing}'
+
+
+def _is_open_quoted(token: Token) -> bool:
+    '''
+    还没有输入右引号的标识符，只有左引号时也是
+    '''
+    return token.kind == 'quoted' and (len(token.text) == 1 or not token.text.endswith(_CLOSING_QUOTES[token.text[0]]))
+
+
+def _is_keyword_name(token: Token) -> bool:
+    return token.kind == 'name' and token.value.upper() in KEYWORDS
+
+
+class _TrieNode:
+    __slots__ = ('label', 'children', 'words')
+
+    def __init__(self, label: str) -> None:
+        self.label = label # 从父节点到这个节点的边上的字符串（小写）
+        self.children = None # {边的第一个字符: 子节点}，没有子节点时为None
+        self.words = None # {在这个节点结束的词（原始大小写）: 引用次数}，没有词时为None
+
+
+def _common_prefix_length(label: str, key: str, start: int) -> int:
+    length = min(len(label), len(key) - start)
+    for index in range(length):
+        if label[index] != key[start + index]:
+            return index
+    return length
+
+
+class PrefixTrie:
+    '''
+    不区分大小写的压缩前缀树（radix tree），只有一个子节点的路径合并成一条边，节点数不超过词数的两倍
+    同一个词可以加入多次（多个表有同名的列），按引用次数删除，增删一个词只修改它路径上的节点
+    查找时从前缀对应的节点开始按字符顺序遍历，找到limit个词就停止，耗时和词的总数无关
+    '''
+    def __init__(self, words: Iterable[str] = ()) -> None:
+        self._root = _TrieNode('')
+        self._count = 0 # 不同的词数
+        for word in words:
+            self.add(word)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, word: str) -> None:
+        key = word.lower()
+        node = self._root
+        index = 0
+        while index < len(key):
+            child = node.children.get(key[index]) if node.children else None
+            if child is None:
+                child = _TrieNode(key[index:])
+                if node.children is None:
+                    node.children = {}
+                node.children[key[index]] = child
+                node = child
+                break
+            # 大部分时候整条边都是公共前缀
+            common = len(child.label) if key.startswith(child.label, index) else _common_prefix_length(child.label, key, index)
+            if common < len(child.label):
+                # 在公共前缀处拆分这条边
+                middle = _TrieNode(child.label[:common])
+                child.label = child.label[common:]
+                middle.children = {child.label[0]: child}
+                node.children[key[index]] = middle
+                child = middle
+            node = child
+            index += common
+        if node.words is None:
+            node.words = {}
+        if word not in node.words:
+            self._count += 1
+        node.words[word] = node.words.get(word, 0) + 1
+
+    def remove(self, word: str) -> bool:
+        '''
+        引用次数减1，减到0时删除这个词，不存在时返回False
+        '''
+        key = word.lower()
+        path = [] # [(父节点, 子节点)]
+        node = self._root
+        index = 0
+        while index < len(key):
+            child = node.children.get(key[index]) if node.children else None
+            if child is None or not key.startswith(child.label, index):
+                return False
+            path.append((node, child))
+            node = child
+            index += len(child.label)
+        if not node.words or word not in node.words:
+            return False
+        node.words[word] -= 1
+        if node.words[word]:
+            return True
+        del node.words[word]
+        self._count -= 1
+        if not node.words:
+            node.words = None
+        # 删除没有词的叶子节点，没有词又只剩一个子节点的节点和子节点合并
+        while path:
+            parent, child = path.pop()
+            if child.words is None and not child.children:
+                del parent.children[child.label[0]]
+                if not parent.children:
+                    parent.children = None
+                continue
+            if child.words is None and len(child.children) == 1:
+                grandchild, = child.children.values()
+                grandchild.label = child.label + grandchild.label
+                parent.children[child.label[0]] = grandchild
+            break
+        return True
+
+    def search(self, prefix: str, limit: int = MAX_COMPLETIONS) -> list[str]:
+        '''
+        以prefix开头的词（不区分大小写），按小写的字母顺序，最多limit个
+        '''
+        key = prefix.lower()
+        node = self._root
+        index = 0
+        while index < len(key):
+            child = node.children.get(key[index]) if node.children else None
+            if child is None:
+                return []
+            if key.startswith(child.label, index):
+                node = child
+                index += len(child.label)
+            elif child.label.startswith(key[index:]):
+                # 前缀在一条边的中间结束
+                node = child
+                break
+            else:
+                return []
+        words = []
+        stack = [node] if limit > 0 else []
+        while stack and len(words) < limit:
+            node = stack.pop()
+            if node.words:
+                words.extend(sorted(node.words))
+            if node.children:
+                stack.extend([node.children[char] for char in sorted(node.children, reverse=True)])
+        return words[:limit]
+
+
+class CompletionIndex:
+    '''
+    SQL自动补全的候选：关键词、表名、列名各一个前缀树，表的增删只修改变化的表的词
+    补全时只对光标所在的语句分词，按光标前面的内容决定候选：
+        FROM、JOIN等关键词后面（包括FROM后面的逗号）只补全表名
+        表名或别名加点号后面只补全这个表的列
+        其他位置先补全语句中引用的表的列，再补全关键词和表名，语句中还没有表时也补全所有的列
+    '''
+    def __init__(self, keywords: Iterable[str] = KEYWORDS) -> None:
+        self._keywords = PrefixTrie(keywords)
+        self._tables = PrefixTrie()
+        self._columns = PrefixTrie() # 所有表的列，同名的列按引用次数只保留一个
+        self._table_columns: dict[str, tuple[str, tuple[str, ...]]] = {} # 小写表名: (表名, 列名)
+
+    def __len__(self) -> int:
+        return len(self._keywords) + len(self._tables) + len(self._columns)
+
+    def add_table(self, table_name: str, columns: Iterable[str]) -> None:
+        self.remove_table(table_name)
+        columns = tuple(columns)
+        self._table_columns[table_name.lower()] = (table_name, columns)
+        self._tables.add(table_name)
+        for column in columns:
+            self._columns.add(column)
+
+    def remove_table(self, table_name: str) -> None:
+        table = self._table_columns.pop(table_name.lower(), None)
+        if table is None:
+            return
+        self._tables.remove(table[0])
+        for column in table[1]:
+            self._columns.remove(column)
+
+    def update_tables(self, table_columns: dict[str, list[str]]) -> None:
+        '''
+        table_columns是当前所有的表 {表名: 列名}，和上次对比，只增删变化了的表
+        '''
+        tables = {table_name.lower(): (table_name, tuple(columns)) for table_name, columns in table_columns.items()}
+        for key in [key for key in self._table_columns if key not in tables]:
+            self.remove_table(self._table_columns[key][0])
+        for key, table in tables.items():
+            if self._table_columns.get(key) != table:
+                self.add_table(*table)
+
+    def _statement_tables(self, tokens: list[Token]) -> dict[str, str]:
+        '''
+        语句中引用的表 {小写的表名或别名: 小写的表名}，和表名相同的标识符都算，表名后面的标识符（可以有AS）是别名
+        和关键词同名的表必须加引号，没有引号的关键词不算表名
+        '''
+        tables = {}
+        for index, token in enumerate(tokens):
+            if not is_identifier(token) or token.value.lower() not in self._table_columns or _is_keyword_name(token):
+                continue
+            table = token.value.lower()
+            tables[table] = table
+            alias_index = index + 2 if index + 1 < len(tokens) and is_keyword(tokens[index + 1], 'AS') else index + 1
+            if alias_index < len(tokens):
+                alias = tokens[alias_index]
+                if is_identifier(alias) and not _is_keyword_name(alias):
+                    tables.setdefault(alias.value.lower(), table)
+        return tables
+
+    def complete(self, sql: str, position: int, force: bool = False, limit: int = MAX_COMPLETIONS) -> tuple[int, list[Completion]]:
+        '''
+        光标在position时的候选，返回(替换的起始位置, 候选)，从起始位置到光标的文本替换成候选的text
+        没有输入任何字符时只在表名和列名的位置补全，force为True时（手动弹出）都补全
+        '''
+        # 只用分号粗略地确定当前语句，字符串中的分号只影响上下文的判断
+        statement_start = sql.rfind(';', 0, position) + 1
+        statement_end = sql.find(';', position)
+        statement_end = len(sql) if statement_end < 0 else statement_end
+        before = [token for token in tokenize(sql[statement_start:position]) if token.kind != 'space']
+        prefix, quote, start = '', None, position
+        if before and before[-1].start + len(before[-1].text) == position - statement_start:
+            last = before[-1]
+            if last.kind in ('string', 'comment'):
+                # 字符串和注释中不补全
+                return position, []
+            if last.kind == 'name' or _is_open_quoted(last):
+                prefix, start = last.value, statement_start + last.start
+                quote = last.text[0] if last.kind == 'quoted' else None
+                before.pop()
+        before = [token for token in before if token.kind != 'comment']
+        qualifier = None
+        if len(before) >= 2 and before[-1].text == '.' and is_identifier(before[-2]):
+            qualifier = before[-2].value
+        elif before and before[-1].text == '.':
+            return position, []
+        table_context = bool(before) and (is_keyword(before[-1], *_TABLE_KEYWORDS) or before[-1].text == ',' and self._last_clause(before) == 'FROM')
+        if not prefix and quote is None and not force and qualifier is None and not table_context:
+            return position, []
+        prefix_lower = prefix.lower()
+        if qualifier is not None:
+            statement_tables = self._statement_tables(significant_tokens(sql[statement_start:statement_end]))
+            table = statement_tables.get(qualifier.lower(), qualifier.lower())
+            columns = self._table_columns.get(table, (None, ()))[1]
+            names = [column for column in columns if column.lower().startswith(prefix_lower)]
+            return start, [Completion(name, 'column', quote_identifier(name, quote)) for name in names[:limit]]
+        completions = []
+        if table_context:
+            completions.extend(Completion(name, 'table', quote_identifier(name, quote)) for name in self._tables.search(prefix, limit))
+            return start, completions
+        statement_tables = self._statement_tables(significant_tokens(sql[statement_start:statement_end]))
+        seen = set()
+        for table in dict.fromkeys(statement_tables.values()):
+            for column in self._table_columns[table][1]:
+                if column.lower().startswith(prefix_lower) and column not in seen:
+                    seen.add(column)
+                    completions.append(Completion(column, 'column', quote_identifier(column, quote)))
+        del completions[limit:]
+        if quote is None:
+            for keyword in self._keywords.search(prefix, limit - len(completions)):
+                # 和输入的大小写保持一致
+                keyword = keyword.lower() if prefix[:1].islower() else keyword
+                completions.append(Completion(keyword, 'keyword', keyword))
+        completions.extend(Completion(name, 'table', quote_identifier(name, quote)) for name in self._tables.search(prefix, limit - len(completions)))
+        if not statement_tables:
+            completions.extend(Completion(name, 'column', quote_identifier(name, quote)) for name in self._columns.search(prefix, limit - len(completions)))
+        return start, completions
+
+    @staticmethod
+    def _last_clause(tokens: list[Token]) -> str:
+        for token in reversed(tokens):
+            if is_keyword(token, *_CLAUSE_KEYWORDS):
+                return token.value.upper()
+        return None
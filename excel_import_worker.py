@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: excel_import_worker.py
+# @Time: 2023/08/19 15:40:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import os
+import queue
+import logging
+import sqlite3
+import time
+import multiprocessing
+from pathlib import Path
+from collections import namedtuple
+from PyQt5.QtCore import QThread, pyqtSignal
+from excel_reader import list_sheet_names, read_sheet_headers, init_reader_process, read_sheet_to_queue
+from import_cache import ImportCache, CachedSheet
+from index_advisor import get_indexed_columns, get_table_columns, create_index
+from sql_engine import SqlEngine, make_table_name, replace_table, rebuild_table
+from schema_catalog import TableNames, TableInfo
+from workbook_fingerprint import WorkbookFingerprint, SheetChanges, fingerprint_workbook, diff_workbook
+
+# 一个表格的解析任务
+ImportTask = namedtuple('ImportTask', ['file_index', 'pname', 'sheet_index', 'sheet_name'])
+
+# 导入成功的表格
+# columns: list[(列名称, 类型)]
+# from_cache: 是否从导入缓存中加载
+# lazy: 延迟加载，只创建了空表，rows_count为None
+ImportedSheet = namedtuple('ImportedSheet', ['pname', 'sheet_name', 'table_name', 'columns', 'rows_count',
+                                             'file_index', 'sheet_index', 'from_cache', 'lazy'], defaults=[False])
+
+
+def _create_sheet_table(conn: sqlite3.Connection, table_name: str, db_columns: list[tuple[str, str]]) -> str:
+    '''
+    按表格的列创建表，返回插入数据的SQL
+    '''
+    fields = ', '.join([f'"{col}" {col_type}' for col, col_type in db_columns])
+    conn.execute(f'''CREATE TABLE [{table_name}] ({fields})''')
+    return f'''insert into [{table_name}] values({','.join(['?'] * len(db_columns))})'''
+
+
+class ExcelImportWorker(QThread):
+    '''
+    多个Excel文件并行导入
+    每个表格交给进程池中的一个进程解析，当前线程是唯一写数据库的线程，
+    用自己的连接把解析出来的数据分批插入engine的数据库，整个导入在一个事务中完成，导入期间使用批量导入的设置
+    传入import_cache时，命中缓存的文件直接从缓存加载，解析完成的文件写入缓存
+    lazy为True时，没有命中缓存的xlsx、csv文件只读取表头创建空表，数据由SheetLoadWorker在用到时加载
+    csv文件整个文件是一个表格，由一个进程流式解析，数据和Excel表格一样分批插入
+    '''
+    CHUNK_SIZE = 5000 # 子进程每次发送的行数
+    QUEUE_SIZE = 64 # 队列中最多缓存的批数，限制内存占用
+    PROGRESS_INTERVAL = 0.3 # 进度通知的最小间隔，秒
+
+    import_progress = pyqtSignal(object) # dict
+    import_finished = pyqtSignal(object, object) # list[ImportedSheet], list[str] 失败信息
+    import_failed = pyqtSignal(str)
+
+    def __init__(self, engine: SqlEngine, pnames: list[Path], import_cache: ImportCache = None, bypass_cache: bool = False,
+                 lazy: bool = False, parent=None) -> None:
+        super(__class__, self).__init__(parent)
+        self._engine = engine
+        self._pnames = [Path(pname) for pname in pnames]
+        self._import_cache = import_cache
+        self._bypass_cache = bypass_cache # 不读取缓存，解析完成后仍然更新缓存
+        self._lazy = lazy
+        self._fingerprints = {} # file_index: 文件指纹
+        self._workbook_fingerprints = {} # pname: 按表格对比用的指纹，重新加载时使用
+        self._tables_name = engine.catalog.table_names() # 在界面线程中复制已有的表名，分配新表名时不冲突
+        self._cancelled = False
+
+    @property
+    def workbook_fingerprints(self) -> dict[Path, WorkbookFingerprint]:
+        return self._workbook_fingerprints
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    def _fingerprint_workbooks(self) -> None:
+        # 在解析之前计算，解析期间文件被修改时，下次重新加载能发现变化
+        for pname in self._pnames:
+            try:
+                self._workbook_fingerprints[pname] = fingerprint_workbook(pname)
+            except Exception as ex:
+                # 没有指纹时重新加载会导入所有表格
+                logging.warning(f'计算文件指纹失败【{pname}】 {str(ex)}')
+
+    def _new_table_name(self, task: ImportTask, tables_name: TableNames) -> str:
+        return make_table_name(task.sheet_name, tables_name)
+
+    def _existing_table(self, task: ImportTask) -> str:
+        '''
+        数据插入到已经存在的表中时返回表名，否则为None（新建表）
+        '''
+        return None
+
+    def _make_tasks(self, pnames: list[tuple[int, Path]], errors: list[str]) -> list[ImportTask]:
+        tasks = []
+        for file_index, pname in pnames:
+            try:
+                sheet_names = list_sheet_names(pname)
+            except Exception as ex:
+                errors.append(f'【{pname.name}】{str(ex)}')
+                continue
+            for sheet_index, sheet_name in enumerate(sheet_names):
+                tasks.append(ImportTask(file_index, pname, sheet_index, sheet_name))
+        return tasks
+
+    def run(self) -> None:
+        try:
+            self._run()
+        except Exception as ex:
+            self.import_failed.emit(str(ex))
+
+    def _run(self) -> None:
+        t1 = time.time()
+        errors = []
+        conn = self._engine.connect()
+        try:
+            with self._engine.bulk_load(conn):
+                self._fingerprint_workbooks()
+                tables_name = self._tables_name
+                imported, parse_pnames = self._load_from_cache(conn, tables_name)
+                if self._lazy:
+                    registered, parse_pnames = self._register_headers(conn, parse_pnames, tables_name, errors)
+                    if registered is None:
+                        self.import_failed.emit('已取消导入！')
+                        return
+                    imported += registered
+                tasks = self._make_tasks(parse_pnames, errors)
+                parsed = []
+                failed_files = set()
+                if tasks:
+                    parsed = self._parse_files(conn, tasks, tables_name, errors, failed_files, t1)
+                    if parsed is None:
+                        self.import_failed.emit('已取消导入！')
+                        return
+                imported = sorted(imported + parsed, key=lambda sheet: (sheet.file_index, sheet.sheet_index))
+                self.import_finished.emit(imported, errors)
+                # 表格已经可以使用了，再把新解析的文件写到缓存
+                self._save_to_cache(conn, tasks, parsed, failed_files)
+        finally:
+            conn.close()
+
+    def _load_from_cache(self, conn: sqlite3.Connection, tables_name: TableNames) -> tuple[list[ImportedSheet], list[tuple[int, Path]]]:
+        '''
+        从缓存加载命中的文件，返回(加载的表格, 需要解析的文件)
+        '''
+        def new_table_name(sheet_name: str) -> str:
+            table_name = make_table_name(sheet_name, tables_name)
+            tables_name.add(table_name)
+            return table_name
+        imported = []
+        parse_pnames = []
+        for file_index, pname in enumerate(self._pnames):
+            if self._import_cache is None:
+                parse_pnames.append((file_index, pname))
+                continue
+            try:
+                fingerprint = self._import_cache.fingerprint(pname)
+                self._fingerprints[file_index] = fingerprint
+                cache_file = None if self._bypass_cache else self._import_cache.get(fingerprint)
+                if cache_file:
+                    for sheet in self._import_cache.load(conn, cache_file, new_table_name):
+                        imported.append(ImportedSheet(pname, sheet.sheet_name, sheet.table_name, sheet.columns, sheet.rows_count,
+                                                      file_index, sheet.sheet_index, True))
+                    continue
+            except Exception as ex:
+                # 缓存不可用时正常解析文件
+                logging.warning(f'读取导入缓存失败【{pname}】 {str(ex)}')
+            parse_pnames.append((file_index, pname))
+        return imported, parse_pnames
+
+    def _register_headers(self, conn: sqlite3.Connection, pnames: list[tuple[int, Path]], tables_name: TableNames,
+                          errors: list[str]) -> tuple[list[ImportedSheet], list[tuple[int, Path]]]:
+        '''
+        延迟加载：xlsx、csv文件只读取表头和推断类型用的前几行，创建空表
+        xls文件只能整个解析，仍然完整导入，返回(注册的表格, 需要解析的文件)，取消时注册的表格为None
+        '''
+        registered = []
+        parse_pnames = []
+        conn.execute('BEGIN')
+        for file_index, pname in pnames:
+            if self._cancelled:
+                conn.rollback()
+                return None, parse_pnames
+            if pname.suffix.lower() == '.xls':
+                parse_pnames.append((file_index, pname))
+                continue
+            try:
+                headers = read_sheet_headers(pname)
+            except Exception as ex:
+                errors.append(f'【{pname.name}】{str(ex)}')
+                continue
+            for sheet_index, header in enumerate(headers):
+                table_name = make_table_name(header.name, tables_name)
+                tables_name.add(table_name)
+                db_columns = list(zip(header.columns, header.column_types))
+                _create_sheet_table(conn, table_name, db_columns)
+                registered.append(ImportedSheet(pname, header.name, table_name, db_columns, None, file_index, sheet_index, False, True))
+        conn.commit()
+        return registered, parse_pnames
+
+    def _save_to_cache(self, conn: sqlite3.Connection, tasks: list[ImportTask], parsed: list[ImportedSheet], failed_files: set) -> None:
+        if self._import_cache is None:
+            return
+        for file_index in sorted(set(task.file_index for task in tasks) - failed_files):
+            if file_index not in self._fingerprints:
+                continue
+            sheets = [CachedSheet(sheet.sheet_index, sheet.sheet_name, sheet.table_name, sheet.columns, sheet.rows_count)
+                      for sheet in parsed if sheet.file_index == file_index]
+            try:
+                self._import_cache.save(conn, self._fingerprints[file_index], sheets)
+            except Exception as ex:
+                logging.warning(f'写入导入缓存失败【{self._pnames[file_index]}】 {str(ex)}')
+
+    def _parse_files(self, conn: sqlite3.Connection, tasks: list[ImportTask], tables_name: TableNames, errors: list[str], failed_files: set, t1: float) -> list[ImportedSheet]:
+        '''
+        用进程池解析所有的表格，返回导入的表格，取消时返回None
+        '''
+        result_queue = multiprocessing.Queue(self.QUEUE_SIZE)
+        processes = min(len(tasks), os.cpu_count() or 1)
+        pool = multiprocessing.Pool(processes, init_reader_process, (result_queue,))
+        try:
+            for task_id, task in enumerate(tasks):
+                # 子进程自己会捕获异常，这里处理进程异常退出等情况，保证每个任务都有结束消息
+                pool.apply_async(read_sheet_to_queue, (task_id, str(task.pname), task.sheet_name, self.CHUNK_SIZE),
+                    error_callback=lambda ex, task_id=task_id: result_queue.put(('error', task_id, str(ex))))
+            pool.close()
+            return self._write_results(conn, tasks, result_queue, tables_name, errors, failed_files, t1)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _write_results(self, conn: sqlite3.Connection, tasks: list[ImportTask], result_queue, tables_name: TableNames,
+                       errors: list[str], failed_files: set, t1: float) -> list[ImportedSheet]:
+        running = {} # task_id: [table_name, columns, insert_sql, rows_count, estimated_rows]
+        imported = {}
+        pending = len(tasks)
+        total_rows = 0
+        last_report = 0.0
+        conn.execute('BEGIN')
+        while pending:
+            if self._cancelled:
+                conn.rollback()
+                return None
+            try:
+                message = result_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            kind, task_id, *payload = message
+            task = tasks[task_id]
+            if kind == 'begin':
+                columns, column_types, estimated_rows = payload
+                db_columns = list(zip(columns, column_types))
+                table_name = self._existing_table(task)
+                if table_name is None:
+                    table_name = self._new_table_name(task, tables_name)
+                    tables_name.add(table_name)
+                    insert_sql = _create_sheet_table(conn, table_name, db_columns)
+                else:
+                    insert_sql = f'''insert into [{table_name}] values({','.join(['?'] * len(db_columns))})'''
+                running[task_id] = [table_name, db_columns, insert_sql, 0, estimated_rows]
+            elif kind == 'retype':
+                column_types, = payload
+                state = running[task_id]
+                # 放宽字段类型，已经插入的数据在重建的表中保留，延迟加载的表上已经创建的索引也保留
+                state[1] = [(col, col_type) for (col, _), col_type in zip(state[1], column_types)]
+                rebuild_table(conn, state[0], state[1], tables_name)
+            elif kind == 'rows':
+                rows, = payload
+                state = running[task_id]
+                conn.executemany(state[2], rows)
+                state[3] += len(rows)
+                total_rows += len(rows)
+            elif kind == 'end':
+                pending -= 1
+                state = running.pop(task_id, None)
+                if state:
+                    imported[task_id] = ImportedSheet(task.pname, task.sheet_name, state[0], state[1], state[3],
+                                                      task.file_index, task.sheet_index, False)
+            elif kind == 'error':
+                pending -= 1
+                failed_files.add(task.file_index)
+                errors.append(f'【{task.pname.name}】表[{task.sheet_name}]：{payload[0]}')
+                state = running.pop(task_id, None)
+                if state and self._existing_table(task):
+                    # 延迟加载的表恢复成空表
+                    conn.execute(f'DELETE FROM [{state[0]}]')
+                elif state:
+                    conn.execute(f'DROP TABLE [{state[0]}]')
+                    tables_name.discard(state[0])
+            now = time.time()
+            if now - last_report >= self.PROGRESS_INTERVAL or not pending:
+                last_report = now
+                # 已完成的表格算1，正在导入的表格按预估行数算完成比例
+                done = len(tasks) - pending - len(running)
+                for state in running.values():
+                    if state[4]:
+                        done += min(state[3] / state[4], 1.0)
+                self.import_progress.emit({
+                    'finished_sheets': len(tasks) - pending,
+                    'total_sheets': len(tasks),
+                    'rows': total_rows,
+                    'rows_per_second': total_rows / max(now - t1, 1e-6),
+                    'percent': int(done * 100 / len(tasks)),
+                })
+        conn.commit()
+        return [imported[task_id] for task_id in sorted(imported)]
+
+
+class SheetLoadWorker(ExcelImportWorker):
+    '''
+    加载延迟加载的表的数据，解析方式和导入相同，数据插入到注册时创建的空表中，表上已经创建的索引保留
+    所有表格在一个事务中完成，取消或者失败时回滚，表仍然是空表
+    prefetch为True时是空闲时的预加载，界面需要加载其他表或者导入文件时会取消
+    '''
+    load_finished = pyqtSignal(object) # dict 加载的表格、失败的表名、失败信息、用时
+
+    def __init__(self, engine: SqlEngine, tables: list[TableInfo], prefetch: bool = False, parent=None) -> None:
+        super(__class__, self).__init__(engine, list(dict.fromkeys(Path(table.source[0]) for table in tables)), parent=parent)
+        self._tables = {(Path(table.source[0]), table.source[1]): table.name for table in tables} # {(文件, 表格名称): 表名}
+        self._prefetch = prefetch
+
+    @property
+    def prefetch(self) -> bool:
+        return self._prefetch
+
+    @property
+    def tables_name(self) -> list[str]:
+        return list(self._tables.values())
+
+    def _existing_table(self, task: ImportTask) -> str:
+        return self._tables.get((task.pname, task.sheet_name))
+
+    def _run(self) -> None:
+        t1 = time.time()
+        errors = []
+        tasks = [ImportTask(self._pnames.index(pname), pname, index, sheet_name) for index, (pname, sheet_name) in enumerate(self._tables)]
+        conn = self._engine.connect()
+        try:
+            with self._engine.bulk_load(conn):
+                parsed = self._parse_files(conn, tasks, self._tables_name, errors, set(), t1)
+                if parsed is None:
+                    self.import_failed.emit('已取消加载！')
+                    return
+                loaded = {sheet.table_name for sheet in parsed}
+                self.load_finished.emit({'loaded': parsed, 'failed': [name for name in self._tables.values() if name not in loaded],
+                                         'errors': errors, 'time': time.time() - t1})
+        finally:
+            conn.close()
+
+
+class ExcelReloadWorker(ExcelImportWorker):
+    '''
+    重新加载一个已经导入的Excel文件，只重新导入内容变化的表格
+    和导入时的文件指纹对比找出变化的表格，解析到临时表后在一个事务中替换原来的表，
+    表名不变，原来表上的索引在新表上重新创建，没有变化的表格不做任何操作
+    '''
+    reload_finished = pyqtSignal(object) # dict 替换、新增、删除的表格，没有变化的表格数量
+
+    def __init__(self, engine: SqlEngine, pname: Path, fingerprint: WorkbookFingerprint, sheet_tables: dict[str, str], parent=None) -> None:
+        super(__class__, self).__init__(engine, [pname], parent=parent)
+        self._fingerprint = fingerprint # 导入时的指纹，None时所有表格都重新导入
+        self._sheet_tables = sheet_tables # {表格名称: 表名} 已经导入的表格
+
+    @property
+    def pname(self) -> Path:
+        return self._pnames[0]
+
+    def _new_table_name(self, task: ImportTask, tables_name: TableNames) -> str:
+        if task.sheet_name in self._sheet_tables:
+            # 先导入到临时表，全部成功后再替换
+            return make_table_name(f'{self._sheet_tables[task.sheet_name]}_reload', tables_name)
+        return make_table_name(task.sheet_name, tables_name)
+
+    def _diff(self) -> SheetChanges:
+        self._fingerprint_workbooks()
+        fingerprint = self._workbook_fingerprints.get(self.pname)
+        if fingerprint is None:
+            raise ValueError('文件不可读取，可能正在保存中')
+        changes = diff_workbook(self._fingerprint, fingerprint, self.pname)
+        if changes is None:
+            sheet_names = list(fingerprint.sheets) if fingerprint.sheets is not None else list_sheet_names(self.pname)
+            changes = SheetChanges([], sheet_names, [name for name in self._sheet_tables if name not in sheet_names], [])
+        return changes
+
+    def _run(self) -> None:
+        t1 = time.time()
+        errors = []
+        conn = self._engine.connect()
+        try:
+            with self._engine.bulk_load(conn):
+                changes = self._diff()
+                fingerprint = self._workbook_fingerprints[self.pname]
+                sheet_names = list(fingerprint.sheets) if fingerprint.sheets is not None else changes.added
+                tasks = [ImportTask(0, self.pname, sheet_names.index(name), name) for name in changes.changed + changes.added]
+                parsed = []
+                failed_files = set()
+                if tasks:
+                    parsed = self._parse_files(conn, tasks, self._tables_name, errors, failed_files, t1)
+                    if parsed is None:
+                        self.import_failed.emit('已取消重新加载！')
+                        return
+                # 原来导入过、现在没有数据了的表格也删除，有表格解析失败时保留原来的表
+                parsed_names = {sheet.sheet_name for sheet in parsed}
+                removed = [name for name in changes.removed if name in self._sheet_tables]
+                if not failed_files:
+                    removed += [task.sheet_name for task in tasks if task.sheet_name in self._sheet_tables and task.sheet_name not in parsed_names]
+                result = self._replace_tables(conn, parsed, removed)
+                result.update({'unchanged': len(changes.unchanged), 'errors': errors, 'time': time.time() - t1})
+                self.reload_finished.emit(result)
+        finally:
+            conn.close()
+
+    def _replace_tables(self, conn: sqlite3.Connection, parsed: list[ImportedSheet], removed: list[str]) -> dict:
+        result = {'pname': self.pname, 'fingerprint': self._workbook_fingerprints[self.pname],
+                  'replaced': [], 'added': [], 'removed': [self._sheet_tables[name] for name in removed], 'indexes': []}
+        indexes = {}
+        conn.execute('BEGIN')
+        try:
+            for sheet in parsed:
+                table_name = self._sheet_tables.get(sheet.sheet_name)
+                if table_name is None:
+                    result['added'].append(sheet)
+                    continue
+                indexes[table_name] = get_indexed_columns(conn, table_name)
+                replace_table(conn, table_name, sheet.table_name)
+                result['replaced'].append(sheet._replace(table_name=table_name))
+            for table_name in result['removed']:
+                conn.execute(f'DROP TABLE IF EXISTS [{table_name}]')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            for sheet in parsed:
+                if sheet.sheet_name in self._sheet_tables:
+                    conn.execute(f'DROP TABLE IF EXISTS [{sheet.table_name}]')
+            conn.commit()
+            raise
+        # 还有这些列时重新创建原来的索引
+        for table_name, table_indexes in indexes.items():
+            columns = set(get_table_columns(conn, table_name))
+            for index_columns in table_indexes:
+                if set(index_columns) <= columns:
+                    result['indexes'].append((table_name, index_columns, create_index(conn, table_name, index_columns)))
+        return result
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: excel_reader.py
+# @Time: 2023/08/12 10:20:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import csv
+import codecs
+import itertools
+from pathlib import Path
+from typing import Iterator, Iterable
+from collections import namedtuple
+from column_types import typed_rows, infer_column_types, INFER_SAMPLE_SIZE
+
+# 逐行读取的表格
+# columns: 列名称列表
+# rows: 行数据的迭代器，每行是和columns等长的tuple
+# rows_count: 预估的行数，不知道时为None
+SheetReader = namedtuple('SheetReader', ['name', 'columns', 'rows', 'rows_count'])
+
+# 表格的表头，延迟加载时使用
+# column_types: 和完整导入时一样用前INFER_SAMPLE_SIZE行推断的类型
+# rows_count: 预估的行数，不知道时为None
+SheetHeader = namedtuple('SheetHeader', ['name', 'columns', 'column_types', 'rows_count'])
+
+# csv文件的格式，用文件开头的样本检测
+# encoding: utf-8-sig（兼容有BOM和没有BOM的utf-8）或者gb18030（兼容GBK）
+CsvFormat = namedtuple('CsvFormat', ['encoding', 'delimiter'])
+
+# 导入支持的文件类型，csv/tsv文件整个文件是一个表格，表格名称是文件名
+CSV_SUFFIXES = ('.csv', '.tsv')
+IMPORT_SUFFIXES = ('.xlsx', '.xls') + CSV_SUFFIXES
+CSV_SAMPLE_SIZE = 64 * 1024 # 检测编码和分隔符时读取的字节数
+CSV_READ_BUFFER = 1024 ** 2 # 读取csv文件的缓冲区大小
+_CSV_ENCODINGS = ('utf-8-sig', 'gb18030')
+_CSV_DELIMITERS = ',\t;|'
+_CSV_FIELD_SIZE_LIMIT = 2 ** 31 - 1 # 默认单个字段最长128K，导出的长文本会超过
+
+
+def make_columns_name(header: Iterable) -> list[str]:
+    '''
+    和pandas.read_excel保持一致：空的列名为 Unnamed: n，重复的列名加 .1 .2 后缀
+    '''
+    columns = []
+    used = set()
+    for index, value in enumerate(header):
+        name = f'Unnamed: {index}' if value is None or str(value).strip() == '' else str(value)
+        new_name = name
+        dup_index = 1
+        while new_name in used:
+            new_name = f'{name}.{dup_index}'
+            dup_index += 1
+        used.add(new_name)
+        columns.append(new_name)
+    return columns
+
+
+def _iter_xlsx_rows(ws, width: int) -> Iterator[tuple]:
+    for row in ws.iter_rows(min_row=2, values_only=True):
+        if all(value is None for value in row):
+            continue
+        if len(row) < width:
+            row = row + (None,) * (width - len(row))
+        yield row[:width]
+
+
+def _iter_xlsx_sheets(pname: Path, sheet_names: list[str] = None) -> Iterator[SheetReader]:
+    import openpyxl
+    # read_only模式按行流式解析xml，内存占用和表格大小无关
+    wb = openpyxl.load_workbook(pname, read_only=True, data_only=True)
+    try:
+        worksheets = wb.worksheets if sheet_names is None else [wb[name] for name in sheet_names]
+        for ws in worksheets:
+            header = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), None)
+            if not header:
+                continue
+            # 去掉表头末尾的空列
+            header = list(header)
+            while header and header[-1] is None:
+                header.pop()
+            if not header:
+                continue
+            columns = make_columns_name(header)
+            rows_count = ws.max_row - 1 if ws.max_row else None
+            yield SheetReader(ws.title, columns, _iter_xlsx_rows(ws, len(columns)), rows_count)
+    finally:
+        wb.close()
+
+
+def _xls_cell_value(xlrd, cell, datemode: int):
+    '''
+    和pandas.read_excel读取xls时保持一致：整数的浮点数转换成int，日期转换成datetime，只有时间的日期转换成time，错误值为空值
+    '''
+    if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+        return None
+    if cell.ctype == xlrd.XL_CELL_TEXT:
+        return cell.value if cell.value != '' else None
+    if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+        return bool(cell.value)
+    if cell.ctype == xlrd.XL_CELL_DATE:
+        try:
+            value = xlrd.xldate_as_datetime(cell.value, datemode)
+        except (ValueError, OverflowError):
+            return cell.value
+        return value.time() if 0 <= cell.value < 1 else value
+    value = cell.value
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+def _iter_xls_rows(xlrd, ws, width: int, datemode: int) -> Iterator[tuple]:
+    for row_index in range(1, ws.nrows):
+        row = tuple(_xls_cell_value(xlrd, cell, datemode) for cell in ws.row_slice(row_index, 0, width))
+        if all(value is None for value in row):
+            continue
+        if len(row) < width:
+            row = row + (None,) * (width - len(row))
+        yield row
+
+
+def _iter_xls_sheets(pname: Path, sheet_names: list[str] = None) -> Iterator[SheetReader]:
+    import xlrd
+    # on_demand只在用到时解析一个表格，读完就释放，不同时保留整个工作簿的数据，也不再转换成DataFrame
+    wb = xlrd.open_workbook(pname, on_demand=True)
+    try:
+        for sheet_name in wb.sheet_names() if sheet_names is None else sheet_names:
+            ws = wb.sheet_by_name(sheet_name)
+            try:
+                if ws.nrows == 0:
+                    continue
+                # 去掉表头末尾的空列，和xlsx文件一样
+                header = [_xls_cell_value(xlrd, cell, wb.datemode) for cell in ws.row(0)]
+                while header and header[-1] is None:
+                    header.pop()
+                if not header:
+                    continue
+                columns = make_columns_name(header)
+                yield SheetReader(sheet_name, columns, _iter_xls_rows(xlrd, ws, len(columns), wb.datemode), ws.nrows - 1)
+            finally:
+                wb.unload_sheet(sheet_name)
+    finally:
+        wb.release_resources()
+
+
+def _decode_sample(sample: bytes, encoding: str) -> str:
+    # 样本末尾可能截断了一个多字节字符，按没有结束的流解码
+    return codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+
+
+def detect_csv_format(pname: Path) -> CsvFormat:
+    '''
+    读取文件开头CSV_SAMPLE_SIZE字节检测编码和分隔符，不能用utf-8解码时按gb18030读取
+    样本之后才出现不能用utf-8解码的内容时，读取过程中再改用gb18030（见_iter_csv_records）
+    tsv文件的分隔符固定是tab，csv文件用csv.Sniffer在逗号、tab、分号、竖线中检测，检测不出来时用逗号
+    '''
+    pname = Path(pname)
+    with open(pname, 'rb') as f:
+        sample = f.read(CSV_SAMPLE_SIZE)
+    for encoding in _CSV_ENCODINGS:
+        try:
+            text = _decode_sample(sample, encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        raise ValueError('无法识别文件的编码，只支持UTF-8和GBK编码的文件')
+    if pname.suffix.lower() == '.tsv':
+        return CsvFormat(encoding, '\t')
+    # 只用完整的行检测
+    lines = text.splitlines()
+    if len(sample) == CSV_SAMPLE_SIZE and len(lines) > 1:
+        lines = lines[:-1]
+    try:
+        delimiter = csv.Sniffer().sniff('\n'.join(lines), _CSV_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ','
+    return CsvFormat(encoding, delimiter)
+
+
+def _estimate_csv_rows(pname: Path) -> int:
+    '''
+    按样本中每行的平均字节数估算行数，只用于显示进度
+    '''
+    size = pname.stat().st_size
+    with open(pname, 'rb') as f:
+        sample = f.read(CSV_SAMPLE_SIZE)
+    lines = sample.count(b'\n')
+    return max(round(size * lines / len(sample)) - 1, 0) if lines else None
+
+
+def _iter_csv_records(pname: Path, csv_format: CsvFormat) -> Iterator[list]:
+    '''
+    逐条读取csv文件的记录，样本都是ASCII字符的GBK文件，读到后面的中文时才发现不能用utf-8解码，
+    这时改用gb18030从头读取，跳过已经读取的记录继续，已经读取的内容都是ASCII字符时两种编码读出来的相同
+    '''
+    with open(pname, encoding=csv_format.encoding, newline='', buffering=CSV_READ_BUFFER) as f:
+        reader = csv.reader(f, delimiter=csv_format.delimiter)
+        try:
+            yield from reader
+            return
+        except UnicodeDecodeError:
+            if csv_format.encoding == _CSV_ENCODINGS[-1]:
+                raise
+            # 出错的那一块文本没有交给csv模块，line_num之前的行都已经读取，跨过这一行的记录还没有返回
+            line_num = reader.line_num
+    with open(pname, encoding=_CSV_ENCODINGS[-1], newline='', buffering=CSV_READ_BUFFER) as f:
+        reader = csv.reader(f, delimiter=csv_format.delimiter)
+        for record in reader:
+            if reader.line_num > line_num:
+                yield record
+                break
+            if not ''.join(record).isascii():
+                raise ValueError('无法识别文件的编码，文件中同时有UTF-8和GBK编码的内容')
+        yield from reader
+
+
+def _iter_csv_rows(reader, width: int) -> Iterator[tuple]:
+    for row in reader:
+        if len(row) != width:
+            if not any(row):
+                continue
+            row = row[:width] if len(row) > width else row + [''] * (width - len(row))
+        elif not any(row):
+            continue
+        # 空字符串和Excel的空单元格一样是空值，in在C代码中完成，没有空字符串的行不用逐个转换
+        yield tuple([value or None for value in row]) if '' in row else tuple(row)
+
+
+def _iter_csv_sheets(pname: Path, sheet_names: list[str] = None) -> Iterator[SheetReader]:
+    '''
+    csv文件用C实现的csv模块流式解析，内存占用和文件大小无关，所有的值都是文本，由column_types推断类型
+    '''
+    if sheet_names is not None and pname.stem not in sheet_names:
+        return
+    csv_format = detect_csv_format(pname)
+    csv.field_size_limit(max(csv.field_size_limit(), _CSV_FIELD_SIZE_LIMIT))
+    records = _iter_csv_records(pname, csv_format)
+    try:
+        header = next(records, None)
+        if not header:
+            return
+        # 去掉表头末尾的空列，和xlsx文件一样
+        while header and header[-1] == '':
+            header.pop()
+        if not header:
+            return
+        columns = make_columns_name(header)
+        yield SheetReader(pname.stem, columns, _iter_csv_rows(records, len(columns)), _estimate_csv_rows(pname))
+    finally:
+        records.close()
+
+
+def iter_excel_sheets(pname: Path, sheet_names: list[str] = None) -> Iterator[SheetReader]:
+    '''
+    逐个表格、逐行读取Excel文件或者csv/tsv文件，没有数据的表格会被跳过
+    sheet_names: 只读取这些表格，为None时读取所有表格
+    '''
+    pname = Path(pname)
+    suffix = pname.suffix.lower()
+    if suffix in CSV_SUFFIXES:
+        yield from _iter_csv_sheets(pname, sheet_names)
+    elif suffix == '.xls':
+        yield from _iter_xls_sheets(pname, sheet_names)
+    else:
+        yield from _iter_xlsx_sheets(pname, sheet_names)
+
+
+def read_sheet_headers(pname: Path, sample_size: int = INFER_SAMPLE_SIZE) -> list[SheetHeader]:
+    '''
+    只读取每个表格的表头和推断类型用的前sample_size行，不读取其余的数据，没有数据的表格会被跳过
+    推断的类型和完整导入时（typed_rows）相同，数据可以直接插入到按表头创建的表中
+    '''
+    headers = []
+    for sheet in iter_excel_sheets(pname):
+        sample = list(itertools.islice(sheet.rows, sample_size))
+        headers.append(SheetHeader(sheet.name, sheet.columns, infer_column_types(len(sheet.columns), sample), sheet.rows_count))
+    return headers
+
+
+def list_sheet_names(pname: Path) -> list[str]:
+    '''
+    获取Excel文件中所有表格的名称，不解析表格内容，csv/tsv文件只有一个以文件名命名的表格
+    '''
+    pname = Path(pname)
+    suffix = pname.suffix.lower()
+    if suffix in CSV_SUFFIXES:
+        return [pname.stem]
+    if suffix == '.xls':
+        import xlrd
+        wb = xlrd.open_workbook(pname, on_demand=True)
+        try:
+            return list(wb.sheet_names())
+        finally:
+            wb.release_resources()
+    import openpyxl
+    wb = openpyxl.load_workbook(pname, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+# 多进程解析时，子进程把解析结果通过这个队列发送给写数据库的线程
+_result_queue = None
+
+def init_reader_process(result_queue) -> None:
+    '''
+    解析进程池的初始化函数
+    '''
+    global _result_queue
+    _result_queue = result_queue
+
+
+def read_sheet_to_queue(task_id: int, fname: str, sheet_name: str, chunk_size: int) -> None:
+    '''
+    在子进程中解析一个表格，按chunk_size分批把数据放到队列中，队列有长度上限，写数据库跟不上时会等待
+    发送的消息：
+        ('begin', task_id, columns, column_types, rows_count)
+        ('retype', task_id, column_types)  推断类型的样本之后有不符合类型的值，放宽后的类型，在这一批数据之前发送
+        ('rows', task_id, rows)
+        ('end', task_id, rows_count)  没有数据的表格只有end消息
+        ('error', task_id, error_info)
+    '''
+    try:
+        rows_count = 0
+        for sheet in iter_excel_sheets(fname, [sheet_name]):
+            # 在子进程中推断每一列的类型并转换数据
+            column_types, rows = typed_rows(sheet.columns, sheet.rows)
+            # 队列在后台线程中序列化消息，发送的类型列表是副本，转换数据时修改column_types不影响已经发送的消息
+            sent_types = list(column_types)
+            _result_queue.put(('begin', task_id, sheet.columns, sent_types, sheet.rows_count))
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                if column_types != sent_types:
+                    sent_types = list(column_types)
+                    _result_queue.put(('retype', task_id, sent_types))
+                _result_queue.put(('rows', task_id, chunk))
+                rows_count += len(chunk)
+        _result_queue.put(('end', task_id, rows_count))
+    except Exception as ex:
+        _result_queue.put(('error', task_id, str(ex)))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: export_worker.py
+# @Time: 2023/09/16 14:20:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import time
+from pathlib import Path
+from PyQt5.QtCore import QThread, pyqtSignal
+from sql_engine import SqlEngine, export_batches, iter_cursor_batches
+from result_store import ResultStore
+
+
+class ExportWorker(QThread):
+    '''
+    在后台线程中导出查询结果，数据分批写到文件中，内存占用和结果大小无关
+    store是已经完整获取的查询结果时直接分批遍历（order是界面上排序后的行号），否则用自己的连接重新执行sql分批获取
+    table_sheet_name不为空时，同时把导出的数据写到数据库的新表中（导出到Excel文件时在树上增加这个表）
+    '''
+    BATCH_SIZE = 5000
+    PROGRESS_INTERVAL = 0.3 # 进度通知的最小间隔，秒
+
+    export_progress = pyqtSignal(object) # dict 已导出的行数和百分比
+    export_finished = pyqtSignal(object) # dict 导出的行数、用时、新表的表名和列
+    export_failed = pyqtSignal(str)
+
+    def __init__(self, engine: SqlEngine, pname: Path, columns: list[str], sql: str = None, store: ResultStore = None, order=None,
+                 sheet_name: str = None, append: bool = False, table_sheet_name: str = None, parent=None) -> None:
+        super(__class__, self).__init__(parent)
+        self._engine = engine
+        self._tables_name = engine.catalog.table_names() # 新表名和已有的表不冲突
+        self._pname = Path(pname)
+        self._columns = columns
+        self._sql = sql
+        self._store = store
+        self._order = order
+        self._sheet_name = sheet_name
+        self._append = append
+        self._table_sheet_name = table_sheet_name
+        self._conn = None
+        self._cancelled = False
+        self._last_progress = 0.0
+
+    @property
+    def pname(self) -> Path:
+        return self._pname
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        conn = self._conn
+        if conn:
+            conn.interrupt()
+
+    def _iter_batches(self):
+        if self._store is not None:
+            yield from self._store.iter_batches(self.BATCH_SIZE, self._order)
+            return
+        yield from iter_cursor_batches(self._conn.execute(self._sql), self.BATCH_SIZE)
+
+    def _progress(self, rows_count: int) -> None:
+        now = time.time()
+        if now - self._last_progress < self.PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        percent = int(rows_count * 100 / len(self._store)) if self._store else 0
+        self.export_progress.emit({'rows': rows_count, 'percent': percent})
+
+    def run(self) -> None:
+        try:
+            self._conn = self._engine.connect()
+            result = export_batches(self._conn, self._iter_batches(), self._pname, self._columns, self._sheet_name,
+                                    self._append, self._table_sheet_name, self._progress, lambda: self._cancelled, self._tables_name)
+            self.export_finished.emit(result)
+        except Exception as ex:
+            self.export_failed.emit('已取消导出！' if self._cancelled else str(ex))
+        finally:
+            conn, self._conn = self._conn, None
+            if conn:
+                conn.close()
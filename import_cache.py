@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: import_cache.py
+# @Time: 2023/09/02 11:15:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import os
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+from collections import namedtuple
+from typing import Callable
+
+# 缓存中的一个表格
+# columns: list[(列名称, 类型)]
+CachedSheet = namedtuple('CachedSheet', ['sheet_index', 'sheet_name', 'table_name', 'columns', 'rows_count'])
+
+
+def default_cache_dir() -> Path:
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'sql_for_excel' / 'import_cache'
+
+
+class ImportCache:
+    '''
+    Excel导入缓存，每个Excel文件对应缓存目录中一个预先建好表的sqlite文件
+    缓存文件名是文件指纹：路径 + 大小 + 修改时间 + 内容采样的hash
+    命中时把缓存文件ATTACH到当前连接，在sqlite内部把表复制过去，不需要重新解析Excel
+    缓存目录超过max_bytes时按最近使用时间淘汰
+    '''
+    DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+    SAMPLE_BYTES = 1024 ** 2 # 内容hash每段采样的字节数，完整计算大文件的hash太慢
+    SHEETS_TABLE = '_sheets' # 缓存文件中记录表格信息的表
+
+    def __init__(self, cache_dir: Path = None, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self._cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self._max_bytes = max_bytes
+
+    @property
+    def cache_dir(self) -> Path:
+        return self._cache_dir
+
+    def fingerprint(self, pname: Path) -> str:
+        '''
+        文件指纹，内容hash只采样文件头、中间、尾部三段
+        '''
+        pname = Path(pname).resolve()
+        stat = pname.stat()
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f'{pname}|{stat.st_size}|{stat.st_mtime_ns}'.encode('utf-8'))
+        with open(pname, 'rb') as f:
+            for offset in (0, max(stat.st_size // 2 - self.SAMPLE_BYTES // 2, 0), max(stat.st_size - self.SAMPLE_BYTES, 0)):
+                f.seek(offset)
+                digest.update(f.read(self.SAMPLE_BYTES))
+        return digest.hexdigest()
+
+    def _cache_file(self, fingerprint: str) -> Path:
+        return self._cache_dir / f'{fingerprint}.sqlite'
+
+    def get(self, fingerprint: str) -> Path:
+        '''
+        返回文件指纹对应的缓存文件，没有命中返回None
+        '''
+        cache_file = self._cache_file(fingerprint)
+        if not cache_file.is_file():
+            return None
+        # 更新修改时间，用于LRU淘汰
+        os.utime(cache_file)
+        return cache_file
+
+    def load(self, conn: sqlite3.Connection, cache_file: Path, make_table_name: Callable[[str], str]) -> list[CachedSheet]:
+        '''
+        把缓存文件中的表复制到conn的main数据库，make_table_name(sheet_name) 分配不冲突的表名
+        '''
+        conn.execute('ATTACH DATABASE ? AS import_cache', (str(cache_file),))
+        try:
+            rows = conn.execute(f'SELECT sheet_index, sheet_name, cache_table, columns, rows_count FROM import_cache.{self.SHEETS_TABLE} ORDER BY sheet_index').fetchall()
+            sheets = []
+            conn.execute('BEGIN')
+            try:
+                for sheet_index, sheet_name, cache_table, columns, rows_count in rows:
+                    columns = [tuple(col) for col in json.loads(columns)]
+                    table_name = make_table_name(sheet_name)
+                    fields = ', '.join([f'"{col}" {col_type}' for col, col_type in columns])
+                    conn.execute(f'CREATE TABLE main.[{table_name}] ({fields})')
+                    conn.execute(f'INSERT INTO main.[{table_name}] SELECT * FROM import_cache.[{cache_table}]')
+                    sheets.append(CachedSheet(sheet_index, sheet_name, table_name, columns, rows_count))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return sheets
+        finally:
+            conn.execute('DETACH DATABASE import_cache')
+
+    def save(self, conn: sqlite3.Connection, fingerprint: str, sheets: list[CachedSheet]) -> None:
+        '''
+        把conn中已经导入的表格写到缓存文件，fingerprint是导入前计算的文件指纹
+        '''
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_file = self._cache_file(fingerprint)
+        tmp_file = cache_file.with_suffix('.tmp')
+        tmp_file.unlink(missing_ok=True)
+        conn.execute('ATTACH DATABASE ? AS import_cache', (str(tmp_file),))
+        try:
+            conn.execute('PRAGMA import_cache.journal_mode=OFF')
+            conn.execute('PRAGMA import_cache.synchronous=OFF')
+            conn.execute('BEGIN')
+            conn.execute(f'CREATE TABLE import_cache.{self.SHEETS_TABLE} (sheet_index INTEGER, sheet_name TEXT, cache_table TEXT, columns TEXT, rows_count INTEGER)')
+            for sheet in sheets:
+                cache_table = f'sheet_{sheet.sheet_index}'
+                fields = ', '.join([f'"{col}" {col_type}' for col, col_type in sheet.columns])
+                conn.execute(f'CREATE TABLE import_cache.[{cache_table}] ({fields})')
+                conn.execute(f'INSERT INTO import_cache.[{cache_table}] SELECT * FROM main.[{sheet.table_name}]')
+                conn.execute(f'INSERT INTO import_cache.{self.SHEETS_TABLE} VALUES (?, ?, ?, ?, ?)',
+                    (sheet.sheet_index, sheet.sheet_name, cache_table, json.dumps(sheet.columns, ensure_ascii=False), sheet.rows_count))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute('DETACH DATABASE import_cache')
+        os.replace(tmp_file, cache_file)
+        self.evict()
+
+    def evict(self) -> None:
+        '''
+        缓存目录超过大小上限时，删除最久没有使用的缓存文件
+        '''
+        files = [(f, f.stat()) for f in self._cache_dir.glob('*.sqlite')]
+        total_bytes = sum(stat.st_size for _, stat in files)
+        for f, stat in sorted(files, key=lambda item: item[1].st_mtime):
+            if total_bytes <= self._max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total_bytes -= stat.st_size
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: index_advisor.py
+# @Time: 2023/09/09 16:40:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import re
+import time
+import sqlite3
+from collections import namedtuple
+from sql_tokenizer import Token, significant_tokens, is_identifier, is_keyword, strip_trailing_semicolons
+
+# 索引建议
+# columns: 索引的列，等值条件的列在前
+# reason: 给用户看的原因
+IndexSuggestion = namedtuple('IndexSuggestion', ['table_name', 'columns', 'reason'])
+
+_COMPARE_OPS = ('=', '==', '<', '>', '<=', '>=')
+_COMPARE_KEYWORDS = ('IN', 'BETWEEN', 'IS', 'LIKE', 'GLOB')
+_RANGE_OPS = ('<', '>', '<=', '>=', 'BETWEEN', 'LIKE', 'GLOB')
+# 表名之后出现这些关键词时，说明没有别名
+_CLAUSE_KEYWORDS = ('WHERE', 'ON', 'USING', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'CROSS', 'NATURAL', 'OUTER',
+                    'GROUP', 'ORDER', 'LIMIT', 'HAVING', 'UNION', 'EXCEPT', 'INTERSECT', 'WINDOW', 'INDEXED', 'NOT')
+# 进入和离开 WHERE/ON 条件的关键词
+_PREDICATE_START = ('WHERE', 'ON')
+_PREDICATE_END = ('SELECT', 'FROM', 'JOIN', 'GROUP', 'ORDER', 'LIMIT', 'HAVING', 'UNION', 'EXCEPT', 'INTERSECT', 'WINDOW')
+
+# 外连接的内层表在执行计划的最后有 LEFT-JOIN 等后缀
+_JOIN_SUFFIX = r'(?: (?:LEFT|RIGHT|FULL)-JOIN)?'
+_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(.+?)(?: USING (?:COVERING )?INDEX .*?)?' + _JOIN_SUFFIX + '$')
+_AUTOMATIC_INDEX_PATTERN = re.compile(r'^SEARCH (?:TABLE )?(.+?) USING AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX \((.+)\)' + _JOIN_SUFFIX + '$')
+
+
+def index_name(table_name: str, columns: list[str]) -> str:
+    return '_'.join(['idx', table_name] + list(columns))
+
+
+def get_table_columns(conn: sqlite3.Connection, table_name: str) -> list[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info([{table_name}])')]
+
+
+def get_indexes(conn: sqlite3.Connection, table_name: str) -> list[tuple[str, list[str]]]:
+    '''
+    表上已有的索引 [(索引名称, 列名称的列表)]
+    '''
+    indexes = []
+    for row in conn.execute(f'PRAGMA index_list([{table_name}])').fetchall():
+        indexes.append((row[1], [info[2] for info in conn.execute(f'PRAGMA index_info([{row[1]}])')]))
+    return indexes
+
+
+def get_indexed_columns(conn: sqlite3.Connection, table_name: str) -> list[list[str]]:
+    '''
+    表上已有的索引，每个索引是列名称的列表
+    '''
+    return [columns for _, columns in get_indexes(conn, table_name)]
+
+
+def create_index(conn: sqlite3.Connection, table_name: str, columns: list[str]) -> str:
+    '''
+    创建索引，返回索引名称
+    '''
+    name = index_name(table_name, columns)
+    fields = ', '.join([f'"{col}"' for col in columns])
+    conn.execute(f'CREATE INDEX IF NOT EXISTS [{name}] ON [{table_name}] ({fields})')
+    conn.commit()
+    return name
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str) -> list[tuple[int, int, str]]:
+    '''
+    返回 [(id, parent, detail)]
+    '''
+    return [(row[0], row[1], row[3]) for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+
+
+def time_query(conn: sqlite3.Connection, sql: str) -> float:
+    '''
+    完整执行一次查询的用时，不把结果取到Python中
+    '''
+    t1 = time.time()
+    conn.execute(f'SELECT count(*) FROM ({strip_trailing_semicolons(sql)})').fetchall()
+    return time.time() - t1
+
+
+def _read_table_alias(tokens: list[Token], index: int, tables: dict, aliases: dict) -> None:
+    # tokens[index] 是 FROM/JOIN/, 之后的表名
+    if index >= len(tokens) or not is_identifier(tokens[index]):
+        return
+    if index + 2 < len(tokens) and tokens[index + 1].text == '.' and is_identifier(tokens[index + 2]):
+        index += 2 # schema.table
+    table_name = tables.get(tokens[index].value.lower())
+    if not table_name:
+        return
+    aliases[table_name.lower()] = table_name
+    index += 1
+    if index < len(tokens) and is_keyword(tokens[index], 'AS'):
+        index += 1
+    if index < len(tokens) and is_identifier(tokens[index]) and not is_keyword(tokens[index], *_CLAUSE_KEYWORDS):
+        aliases[tokens[index].value.lower()] = table_name
+
+
+def _find_table_aliases(tokens: list[Token], tables: dict) -> dict:
+    '''
+    别名(小写): 表名，表名本身也算别名
+    '''
+    aliases = {}
+    in_from = False
+    depth = 0
+    from_depth = 0
+    for index, token in enumerate(tokens):
+        if token.text == '(':
+            depth += 1
+        elif token.text == ')':
+            depth -= 1
+            if depth < from_depth:
+                in_from = False
+        elif is_keyword(token, 'FROM', 'JOIN'):
+            in_from = True
+            from_depth = depth
+            _read_table_alias(tokens, index + 1, tables, aliases)
+        elif token.text == ',' and in_from and depth == from_depth:
+            _read_table_alias(tokens, index + 1, tables, aliases)
+        elif is_keyword(token, 'WHERE', 'GROUP', 'ORDER', 'LIMIT', 'HAVING', 'ON', 'USING', 'SELECT'):
+            if depth == from_depth:
+                in_from = False
+    return aliases
+
+
+def find_table_aliases(sql: str, tables_name) -> dict:
+    '''
+    SQL中FROM/JOIN的表的别名(小写): 表名，所有的表名本身也算别名，执行计划中的表用别名表示
+    '''
+    tables_lower = {name.lower(): name for name in tables_name}
+    return tables_lower | _find_table_aliases(significant_tokens(sql), tables_lower)
+
+
+def plan_scanned_table(detail: str, aliases: dict) -> str:
+    '''
+    执行计划中SCAN（全表或者全索引扫描）的一行对应的表名，表名可以有空格，后面可以有 USING ... 和 LEFT-JOIN
+    不是SCAN或者不是数据库中的表（子查询、临时表）时返回None
+    '''
+    match = _SCAN_PATTERN.match(detail)
+    return aliases.get(match.group(1).lower()) if match else None
+
+
+def _column_before(tokens: list[Token], index: int):
+    # tokens[index] 之前的列引用，返回 (限定名 or None, 列名)
+    if index < 0 or not is_identifier(tokens[index]):
+        return None
+    if index >= 2 and tokens[index - 1].text == '.' and is_identifier(tokens[index - 2]):
+        return tokens[index - 2].value, tokens[index].value
+    return None, tokens[index].value
+
+
+def _column_after(tokens: list[Token], index: int):
+    # tokens[index] 开始的列引用，后面是 ( 的是函数
+    if index >= len(tokens) or not is_identifier(tokens[index]):
+        return None
+    if index + 2 < len(tokens) and tokens[index + 1].text == '.' and is_identifier(tokens[index + 2]):
+        return tokens[index].value, tokens[index + 2].value
+    if index + 1 < len(tokens) and tokens[index + 1].text == '(':
+        return None
+    return None, tokens[index].value
+
+
+def find_predicate_columns(sql: str, table_columns: dict[str, list[str]]) -> dict[str, list[tuple[str, str]]]:
+    '''
+    找出 WHERE/ON 条件中和常量或者其他列比较的列
+    table_columns: {表名: [列名称]}
+    返回 {表名: [(列名称, 条件类型)]}，条件类型：equal 等值过滤，range 范围过滤，join 和其他表的列比较
+    '''
+    tokens = significant_tokens(sql)
+    tables = {name.lower(): name for name in table_columns}
+    aliases = _find_table_aliases(tokens, tables)
+    referenced = set(aliases.values())
+    columns_lower = {name: {col.lower(): col for col in cols} for name, cols in table_columns.items()}
+
+    def resolve(reference):
+        if not reference:
+            return None
+        qualifier, column = reference
+        if qualifier is not None:
+            table_name = aliases.get(qualifier.lower())
+            candidates = [table_name] if table_name else []
+        else:
+            candidates = [name for name in referenced if column.lower() in columns_lower[name]]
+        if len(candidates) != 1 or column.lower() not in columns_lower[candidates[0]]:
+            return None
+        return candidates[0], columns_lower[candidates[0]][column.lower()]
+
+    result = {}
+    in_predicate = False
+    for index, token in enumerate(tokens):
+        if is_keyword(token, *_PREDICATE_START):
+            in_predicate = True
+            continue
+        if is_keyword(token, *_PREDICATE_END):
+            in_predicate = False
+            continue
+        if not in_predicate:
+            continue
+        op = token.text.upper() if token.kind == 'op' or token.kind == 'name' else ''
+        if op not in _COMPARE_OPS and op not in _COMPARE_KEYWORDS:
+            continue
+        left_index = index - 2 if index >= 1 and is_keyword(tokens[index - 1], 'NOT') else index - 1
+        left = resolve(_column_before(tokens, left_index))
+        right = resolve(_column_after(tokens, index + 1))
+        if left and right and left[0] != right[0]:
+            kind = 'join'
+        else:
+            kind = 'range' if op in _RANGE_OPS else 'equal'
+        for resolved in (left, right):
+            if resolved:
+                table_name, column = resolved
+                columns = result.setdefault(table_name, [])
+                if (column, kind) not in columns:
+                    columns.append((column, kind))
+    return result
+
+
+def _order_index_columns(columns: list[tuple[str, str]], inner: bool) -> list[str]:
+    # 等值条件的列在前，最多再加一个范围条件的列，没有过滤条件时用连接的列
+    # 连接中最外层循环的表每行只扫描一次，连接列上的索引用不到，只有内层循环的表（inner）才用连接的列
+    equal_columns = [col for col, kind in columns if kind == 'equal']
+    range_columns = [col for col, kind in columns if kind == 'range' and col not in equal_columns]
+    if equal_columns or range_columns:
+        return equal_columns + range_columns[:1]
+    if not inner:
+        return []
+    return [col for col, kind in columns if kind == 'join'][:1]
+
+
+def advise_indexes(conn: sqlite3.Connection, sql: str, table_columns: dict[str, list[str]] = None) -> list[IndexSuggestion]:
+    '''
+    用 EXPLAIN QUERY PLAN 分析SQL，对全表扫描的条件列和连接时使用临时自动索引的列给出索引建议
+    table_columns: {表名: 列名称列表}，为None时从数据库读取
+    '''
+    sql = strip_trailing_semicolons(sql)
+    if table_columns is None:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        table_columns = {name: get_table_columns(conn, name) for name in tables}
+    aliases = find_table_aliases(sql, table_columns)
+    predicate_columns = find_predicate_columns(sql, table_columns)
+    suggestions = []
+
+    def add(table_name: str, columns: list[str], reason: str) -> None:
+        if not columns:
+            return
+        for indexed in get_indexed_columns(conn, table_name):
+            if indexed[:len(columns)] == columns:
+                return
+        for suggestion in suggestions:
+            if suggestion.table_name == table_name and suggestion.columns == columns:
+                return
+        suggestions.append(IndexSuggestion(table_name, columns, reason))
+
+    loop_parents = set() # 已经有外层循环的节点，同一个节点下后面的SCAN/SEARCH是内层循环
+    for _, parent, detail in explain_query_plan(conn, sql):
+        inner = parent in loop_parents
+        if detail.startswith(('SCAN ', 'SEARCH ')):
+            loop_parents.add(parent)
+        match = _AUTOMATIC_INDEX_PATTERN.match(detail)
+        if match:
+            table_name = aliases.get(match.group(1).lower())
+            if table_name:
+                columns = [re.split(r'[=<>]', term, maxsplit=1)[0].strip() for term in match.group(2).split(' AND ')]
+                add(table_name, columns, f'连接时每次执行都要临时创建自动索引：{detail}')
+            continue
+        table_name = plan_scanned_table(detail, aliases) if ' USING ' not in detail else None
+        if table_name and table_name in predicate_columns:
+                columns = _order_index_columns(predicate_columns[table_name], inner)
+                add(table_name, columns, f'全表扫描，条件中使用了字段 {", ".join(columns)}：{detail}')
+    return suggestions
@@ -46,12 +46,30 @@ class Ui_MainWindow(object):
         self.gridLayout.setObjectName("gridLayout")
         spacerItem = QtWidgets.QSpacerItem(407, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.gridLayout.addItem(spacerItem, 0, 0, 1, 1)
+        self.checkBoxWatchFiles = QtWidgets.QCheckBox(self.groupBox)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.checkBoxWatchFiles.setFont(font)
+        self.checkBoxWatchFiles.setObjectName("checkBoxWatchFiles")
+        self.gridLayout.addWidget(self.checkBoxWatchFiles, 0, 1, 1, 1)
+        self.checkBoxLazyImport = QtWidgets.QCheckBox(self.groupBox)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.checkBoxLazyImport.setFont(font)
+        self.checkBoxLazyImport.setObjectName("checkBoxLazyImport")
+        self.gridLayout.addWidget(self.checkBoxLazyImport, 0, 2, 1, 1)
+        self.checkBoxBypassCache = QtWidgets.QCheckBox(self.groupBox)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.checkBoxBypassCache.setFont(font)
+        self.checkBoxBypassCache.setObjectName("checkBoxBypassCache")
+        self.gridLayout.addWidget(self.checkBoxBypassCache, 0, 3, 1, 1)
         self.pushButtonImportFile = QtWidgets.QPushButton(self.groupBox)
         font = QtGui.QFont()
         font.setPointSize(9)
         self.pushButtonImportFile.setFont(font)
         self.pushButtonImportFile.setObjectName("pushButtonImportFile")
-        self.gridLayout.addWidget(self.pushButtonImportFile, 0, 1, 1, 1)
+        self.gridLayout.addWidget(self.pushButtonImportFile, 0, 4, 1, 1)
         self.treeWidgetExcelsAndSheets = QtWidgets.QTreeWidget(self.groupBox)
         font = QtGui.QFont()
         font.setPointSize(9)
@@ -69,7 +87,7 @@ class Ui_MainWindow(object):
         self.treeWidgetExcelsAndSheets.headerItem().setText(0, "1")
         self.treeWidgetExcelsAndSheets.headerItem().setText(1, "2")
         self.treeWidgetExcelsAndSheets.header().setVisible(True)
-        self.gridLayout.addWidget(self.treeWidgetExcelsAndSheets, 1, 0, 1, 3)
+        self.gridLayout.addWidget(self.treeWidgetExcelsAndSheets, 1, 0, 1, 5)
         self.groupBox_2 = QtWidgets.QGroupBox(self.splitter)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Preferred)
         sizePolicy.setHorizontalStretch(0)
@@ -84,6 +102,23 @@ class Ui_MainWindow(object):
         self.gridLayout_2.setObjectName("gridLayout_2")
         spacerItem1 = QtWidgets.QSpacerItem(501, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.gridLayout_2.addItem(spacerItem1, 0, 0, 1, 1)
+        self.checkBoxAutoIndex = QtWidgets.QCheckBox(self.groupBox_2)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.checkBoxAutoIndex.setFont(font)
+        self.checkBoxAutoIndex.setObjectName("checkBoxAutoIndex")
+        self.gridLayout_2.addWidget(self.checkBoxAutoIndex, 0, 1, 1, 1)
+        self.pushButtonIndexAdvisor = QtWidgets.QPushButton(self.groupBox_2)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.pushButtonIndexAdvisor.sizePolicy().hasHeightForWidth())
+        self.pushButtonIndexAdvisor.setSizePolicy(sizePolicy)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.pushButtonIndexAdvisor.setFont(font)
+        self.pushButtonIndexAdvisor.setObjectName("pushButtonIndexAdvisor")
+        self.gridLayout_2.addWidget(self.pushButtonIndexAdvisor, 0, 2, 1, 1)
         self.pushButtonRunSql = QtWidgets.QPushButton(self.groupBox_2)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
         sizePolicy.setHorizontalStretch(0)
@@ -94,13 +129,25 @@ class Ui_MainWindow(object):
         font.setPointSize(9)
         self.pushButtonRunSql.setFont(font)
         self.pushButtonRunSql.setObjectName("pushButtonRunSql")
-        self.gridLayout_2.addWidget(self.pushButtonRunSql, 0, 1, 1, 1)
+        self.gridLayout_2.addWidget(self.pushButtonRunSql, 0, 3, 1, 1)
+        self.pushButtonCancelSql = QtWidgets.QPushButton(self.groupBox_2)
+        self.pushButtonCancelSql.setEnabled(False)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.pushButtonCancelSql.sizePolicy().hasHeightForWidth())
+        self.pushButtonCancelSql.setSizePolicy(sizePolicy)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.pushButtonCancelSql.setFont(font)
+        self.pushButtonCancelSql.setObjectName("pushButtonCancelSql")
+        self.gridLayout_2.addWidget(self.pushButtonCancelSql, 0, 4, 1, 1)
         self.plainTextSql = QtWidgets.QPlainTextEdit(self.groupBox_2)
         font = QtGui.QFont()
         font.setPointSize(9)
         self.plainTextSql.setFont(font)
         self.plainTextSql.setObjectName("plainTextSql")
-        self.gridLayout_2.addWidget(self.plainTextSql, 1, 0, 1, 2)
+        self.gridLayout_2.addWidget(self.plainTextSql, 1, 0, 1, 5)
         self.groupBox_3 = QtWidgets.QGroupBox(self.splitter_2)
         font = QtGui.QFont()
         font.setPointSize(9)
@@ -128,24 +175,105 @@ class Ui_MainWindow(object):
         self.pushButtonExportResult.setFont(font)
         self.pushButtonExportResult.setObjectName("pushButtonExportResult")
         self.gridLayout_3.addWidget(self.pushButtonExportResult, 0, 3, 1, 1)
-        self.tableWidgetSqlResult = QtWidgets.QTableWidget(self.groupBox_3)
+        self.pushButtonExportFile = QtWidgets.QPushButton(self.groupBox_3)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.pushButtonExportFile.setFont(font)
+        self.pushButtonExportFile.setObjectName("pushButtonExportFile")
+        self.gridLayout_3.addWidget(self.pushButtonExportFile, 0, 4, 1, 1)
+        self.pushButtonSaveAsTable = QtWidgets.QPushButton(self.groupBox_3)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.pushButtonSaveAsTable.setFont(font)
+        self.pushButtonSaveAsTable.setObjectName("pushButtonSaveAsTable")
+        self.gridLayout_3.addWidget(self.pushButtonSaveAsTable, 0, 5, 1, 1)
+        self.pushButtonSaveAsView = QtWidgets.QPushButton(self.groupBox_3)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.pushButtonSaveAsView.setFont(font)
+        self.pushButtonSaveAsView.setObjectName("pushButtonSaveAsView")
+        self.gridLayout_3.addWidget(self.pushButtonSaveAsView, 0, 6, 1, 1)
+        self.tabWidgetResult = QtWidgets.QTabWidget(self.groupBox_3)
+        font = QtGui.QFont()
+        font.setPointSize(9)
+        self.tabWidgetResult.setFont(font)
+        self.tabWidgetResult.setObjectName("tabWidgetResult")
+        self.tabResult = QtWidgets.QWidget()
+        self.tabResult.setObjectName("tabResult")
+        self.gridLayout_6 = QtWidgets.QGridLayout(self.tabResult)
+        self.gridLayout_6.setContentsMargins(0, 0, 0, 0)
+        self.gridLayout_6.setObjectName("gridLayout_6")
+        self.tableViewSqlResult = QtWidgets.QTableView(self.tabResult)
         font = QtGui.QFont()
         font.setPointSize(9)
-        self.tableWidgetSqlResult.setFont(font)
-        self.tableWidgetSqlResult.setObjectName("tableWidgetSqlResult")
-        self.tableWidgetSqlResult.setColumnCount(0)
-        self.tableWidgetSqlResult.setRowCount(0)
-        self.gridLayout_3.addWidget(self.tableWidgetSqlResult, 1, 0, 1, 4)
+        self.tableViewSqlResult.setFont(font)
+        self.tableViewSqlResult.setObjectName("tableViewSqlResult")
+        self.gridLayout_6.addWidget(self.tableViewSqlResult, 0, 0, 1, 1)
+        self.tabWidgetResult.addTab(self.tabResult, "")
+        self.tabProfiler = QtWidgets.QWidget()
+        self.tabProfiler.setObjectName("tabProfiler")
+        self.gridLayout_7 = QtWidgets.QGridLayout(self.tabProfiler)
+        self.gridLayout_7.setContentsMargins(0, 0, 0, 0)
+        self.gridLayout_7.setObjectName("gridLayout_7")
+        self.labelProfileSummary = QtWidgets.QLabel(self.tabProfiler)
+        self.labelProfileSummary.setWordWrap(True)
+        self.labelProfileSummary.setObjectName("labelProfileSummary")
+        self.gridLayout_7.addWidget(self.labelProfileSummary, 0, 0, 1, 1)
+        self.pushButtonExportProfile = QtWidgets.QPushButton(self.tabProfiler)
+        self.pushButtonExportProfile.setObjectName("pushButtonExportProfile")
+        self.gridLayout_7.addWidget(self.pushButtonExportProfile, 0, 1, 1, 1)
+        self.splitterProfiler = QtWidgets.QSplitter(self.tabProfiler)
+        self.splitterProfiler.setOrientation(QtCore.Qt.Horizontal)
+        self.splitterProfiler.setObjectName("splitterProfiler")
+        self.treeWidgetQueryPlan = QtWidgets.QTreeWidget(self.splitterProfiler)
+        self.treeWidgetQueryPlan.setObjectName("treeWidgetQueryPlan")
+        self.tableWidgetQueryHistory = QtWidgets.QTableWidget(self.splitterProfiler)
+        self.tableWidgetQueryHistory.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.tableWidgetQueryHistory.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.tableWidgetQueryHistory.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.tableWidgetQueryHistory.setObjectName("tableWidgetQueryHistory")
+        self.tableWidgetQueryHistory.setColumnCount(0)
+        self.tableWidgetQueryHistory.setRowCount(0)
+        self.gridLayout_7.addWidget(self.splitterProfiler, 1, 0, 1, 2)
+        self.tabWidgetResult.addTab(self.tabProfiler, "")
+        self.gridLayout_3.addWidget(self.tabWidgetResult, 1, 0, 1, 7)
         self.gridLayout_5.addWidget(self.splitter_2, 0, 0, 1, 1)
         MainWindow.setCentralWidget(self.centralwidget)
+        self.menubar = QtWidgets.QMenuBar(MainWindow)
+        self.menubar.setGeometry(QtCore.QRect(0, 0, 1066, 23))
+        self.menubar.setObjectName("menubar")
+        self.menuWorkspace = QtWidgets.QMenu(self.menubar)
+        self.menuWorkspace.setObjectName("menuWorkspace")
+        MainWindow.setMenuBar(self.menubar)
         self.statusbar = QtWidgets.QStatusBar(MainWindow)
         self.statusbar.setObjectName("statusbar")
         MainWindow.setStatusBar(self.statusbar)
+        self.actionOpenWorkspace = QtWidgets.QAction(MainWindow)
+        self.actionOpenWorkspace.setObjectName("actionOpenWorkspace")
+        self.actionSaveWorkspace = QtWidgets.QAction(MainWindow)
+        self.actionSaveWorkspace.setObjectName("actionSaveWorkspace")
+        self.actionAutosaveWorkspace = QtWidgets.QAction(MainWindow)
+        self.actionAutosaveWorkspace.setCheckable(True)
+        self.actionAutosaveWorkspace.setObjectName("actionAutosaveWorkspace")
+        self.menuWorkspace.addAction(self.actionOpenWorkspace)
+        self.menuWorkspace.addAction(self.actionSaveWorkspace)
+        self.menuWorkspace.addSeparator()
+        self.menuWorkspace.addAction(self.actionAutosaveWorkspace)
+        self.menubar.addAction(self.menuWorkspace.menuAction())
 
         self.retranslateUi(MainWindow)
+        self.tabWidgetResult.setCurrentIndex(0)
+        self.actionOpenWorkspace.triggered.connect(MainWindow.actionOpenWorkspace_triggered) # type: ignore
+        self.actionSaveWorkspace.triggered.connect(MainWindow.actionSaveWorkspace_triggered) # type: ignore
         self.pushButtonImportFile.clicked.connect(MainWindow.pushButtonImportFile_clicked) # type: ignore
         self.pushButtonRunSql.clicked.connect(MainWindow.pushButtonRunSql_clicked) # type: ignore
+        self.pushButtonCancelSql.clicked.connect(MainWindow.pushButtonCancelSql_clicked) # type: ignore
+        self.pushButtonIndexAdvisor.clicked.connect(MainWindow.pushButtonIndexAdvisor_clicked) # type: ignore
         self.pushButtonExportResult.clicked.connect(MainWindow.pushButtonExportResult_clicked) # type: ignore
+        self.pushButtonExportFile.clicked.connect(MainWindow.pushButtonExportFile_clicked) # type: ignore
+        self.pushButtonSaveAsTable.clicked.connect(MainWindow.pushButtonSaveAsTable_clicked) # type: ignore
+        self.pushButtonSaveAsView.clicked.connect(MainWindow.pushButtonSaveAsView_clicked) # type: ignore
+        self.pushButtonExportProfile.clicked.connect(MainWindow.pushButtonExportProfile_clicked) # type: ignore
         self.treeWidgetExcelsAndSheets.customContextMenuRequested['QPoint'].connect(MainWindow._treeWidgetItem_popContextMenu) # type: ignore
         QtCore.QMetaObject.connectSlotsByName(MainWindow)
 
@@ -153,11 +281,44 @@ class Ui_MainWindow(object):
         _translate = QtCore.QCoreApplication.translate
         MainWindow.setWindowTitle(_translate("MainWindow", "SQL for Excel v1.0"))
         self.groupBox.setTitle(_translate("MainWindow", "Excel文件和表"))
+        self.checkBoxWatchFiles.setToolTip(_translate("MainWindow", "Excel文件保存后自动重新加载内容变化的表格"))
+        self.checkBoxWatchFiles.setText(_translate("MainWindow", "自动重新加载"))
+        self.checkBoxLazyImport.setToolTip(_translate("MainWindow", "导入xlsx、csv文件时只读取表头，表格数据在SQL用到、查看数据或者空闲时再加载"))
+        self.checkBoxLazyImport.setText(_translate("MainWindow", "延迟加载"))
+        self.checkBoxBypassCache.setToolTip(_translate("MainWindow", "不使用导入缓存，重新解析Excel文件"))
+        self.checkBoxBypassCache.setText(_translate("MainWindow", "不使用缓存"))
         self.pushButtonImportFile.setText(_translate("MainWindow", "导入"))
         self.groupBox_2.setTitle(_translate("MainWindow", "SQL"))
+        self.checkBoxAutoIndex.setToolTip(_translate("MainWindow", "执行SQL前自动创建索引建议中的索引"))
+        self.checkBoxAutoIndex.setText(_translate("MainWindow", "自动创建索引"))
+        self.pushButtonIndexAdvisor.setToolTip(_translate("MainWindow", "分析SQL的执行计划，给出需要创建的索引"))
+        self.pushButtonIndexAdvisor.setText(_translate("MainWindow", "索引建议"))
         self.pushButtonRunSql.setText(_translate("MainWindow", "执行"))
+        self.pushButtonCancelSql.setToolTip(_translate("MainWindow", "取消正在执行的SQL"))
+        self.pushButtonCancelSql.setText(_translate("MainWindow", "取消"))
         self.groupBox_3.setTitle(_translate("MainWindow", "执行结果"))
         self.label.setText(_translate("MainWindow", "结果导出为新的Excel表格"))
         self.pushButtonExportResult.setToolTip(_translate("MainWindow", "导出SQL的查询结果，不对以下表格中的修改导出！"))
         self.pushButtonExportResult.setText(_translate("MainWindow", "导出"))
-        self.tableWidgetSqlResult.setToolTip(_translate("MainWindow", "注意：修改的内容不会被保存和导出！"))
+        self.pushButtonExportFile.setToolTip(_translate("MainWindow", "导出SQL的查询结果为新的xlsx、csv、tsv或parquet文件"))
+        self.pushButtonExportFile.setText(_translate("MainWindow", "另存为..."))
+        self.pushButtonSaveAsTable.setToolTip(_translate("MainWindow", "用当前的SQL在数据库中创建新表（CREATE TABLE ... AS），数据不经过Excel文件"))
+        self.pushButtonSaveAsTable.setText(_translate("MainWindow", "保存为表..."))
+        self.pushButtonSaveAsView.setToolTip(_translate("MainWindow", "用当前的SQL在数据库中创建视图（CREATE VIEW），查询时才读取引用的表"))
+        self.pushButtonSaveAsView.setText(_translate("MainWindow", "保存为视图..."))
+        self.tableViewSqlResult.setToolTip(_translate("MainWindow", "注意：修改的内容不会被保存和导出！"))
+        self.tabWidgetResult.setTabText(self.tabWidgetResult.indexOf(self.tabResult), _translate("MainWindow", "结果"))
+        self.labelProfileSummary.setText(_translate("MainWindow", "执行SQL后显示执行计划、虚拟机指令数、扫描行数和各阶段用时"))
+        self.pushButtonExportProfile.setToolTip(_translate("MainWindow", "导出最近执行的SQL的性能记录（json或csv）"))
+        self.pushButtonExportProfile.setText(_translate("MainWindow", "导出记录"))
+        self.treeWidgetQueryPlan.headerItem().setText(0, _translate("MainWindow", "执行计划"))
+        self.tabWidgetResult.setTabText(self.tabWidgetResult.indexOf(self.tabProfiler), _translate("MainWindow", "性能分析"))
+        self.menuWorkspace.setTitle(_translate("MainWindow", "工作区"))
+        self.actionOpenWorkspace.setText(_translate("MainWindow", "打开工作区..."))
+        self.actionOpenWorkspace.setToolTip(_translate("MainWindow", "打开保存的工作区，恢复所有的表、索引、文件列表和SQL，不需要重新导入Excel文件"))
+        self.actionOpenWorkspace.setShortcut(_translate("MainWindow", "Ctrl+O"))
+        self.actionSaveWorkspace.setText(_translate("MainWindow", "保存工作区..."))
+        self.actionSaveWorkspace.setToolTip(_translate("MainWindow", "把所有的表、索引、文件列表和SQL保存到一个文件"))
+        self.actionSaveWorkspace.setShortcut(_translate("MainWindow", "Ctrl+S"))
+        self.actionAutosaveWorkspace.setText(_translate("MainWindow", "退出时自动保存"))
+        self.actionAutosaveWorkspace.setToolTip(_translate("MainWindow", "退出时自动保存工作区，下次启动时恢复"))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: query_profiler.py
+# @Time: 2023/10/07 14:10:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import csv
+import json
+import sqlite3
+import datetime
+from pathlib import Path
+from collections import deque
+from index_advisor import explain_query_plan, find_table_aliases, plan_scanned_table
+
+# 导出csv时的列，执行计划按文本导出
+PROFILE_FIELDS = ('time', 'sql', 'execute', 'fetch', 'first_rows', 'display', 'rows_returned', 'rows_scanned',
+                  'vm_steps', 'memory_delta_mb', 'scanned_tables', 'plan', 'statements')
+
+
+def process_memory_mb() -> float:
+    '''
+    当前进程占用的内存，取不到时返回None
+    '''
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    except ImportError:
+        pass
+    try:
+        import os
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def get_query_plan(conn: sqlite3.Connection, sql: str) -> list[tuple[int, int, str]]:
+    '''
+    EXPLAIN QUERY PLAN 的结果 [(id, parent, detail)]，不能分析的SQL返回空列表
+    '''
+    try:
+        return explain_query_plan(conn, sql)
+    except sqlite3.Error:
+        return []
+
+
+def get_scanned_tables(plan: list[tuple[int, int, str]], tables_name: list[str], sql: str = '') -> list[str]:
+    '''
+    执行计划中全表扫描的表（不包括子查询和临时表），sql是plan对应的语句，用来把别名换成表名
+    '''
+    aliases = find_table_aliases(sql, tables_name)
+    scanned = []
+    for _, _, detail in plan:
+        table_name = plan_scanned_table(detail, aliases)
+        if table_name and table_name not in scanned:
+            scanned.append(table_name)
+    return scanned
+
+
+def estimate_rows_scanned(conn: sqlite3.Connection, scanned_tables: list[str]) -> int:
+    '''
+    估算扫描的行数：全表扫描的表的行数之和，连接时内层表被多次扫描的情况不计入
+    '''
+    return sum(conn.execute(f'SELECT count(*) FROM [{table_name}]').fetchone()[0] for table_name in scanned_tables)
+
+
+def format_plan(plan: list[tuple[int, int, str]]) -> str:
+    '''
+    执行计划按树形缩进成文本
+    '''
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, detail in plan:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return '\n'.join(lines)
+
+
+def format_statements(statements: list[dict]) -> str:
+    '''
+    脚本中每条语句的用时和行数，一行一条语句
+    '''
+    return '\n'.join([f'[{s["index"] + 1}] {s["time"]:.3f}s {"" if s["rows"] is None else s["rows"]} {" ".join(s["sql"].split())}' for s in statements])
+
+
+def new_profile(sql: str) -> dict:
+    return {field: None for field in PROFILE_FIELDS} | {'time': datetime.datetime.now().isoformat(timespec='seconds'), 'sql': sql}
+
+
+class ProfileHistory:
+    '''
+    最近执行的SQL的性能记录，超过max_count时丢弃最早的记录
+    '''
+    DEFAULT_MAX_COUNT = 100
+
+    def __init__(self, max_count: int = DEFAULT_MAX_COUNT) -> None:
+        self._profiles = deque(maxlen=max_count)
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def __getitem__(self, index: int) -> dict:
+        return self._profiles[index]
+
+    def add(self, profile: dict) -> None:
+        self._profiles.append(profile)
+
+    def export(self, pname: Path) -> None:
+        '''
+        导出为json或者csv文件，按文件后缀区分
+        '''
+        pname = Path(pname)
+        if pname.suffix.lower() == '.json':
+            pname.write_text(json.dumps(list(self._profiles), ensure_ascii=False, indent=2), encoding='utf-8')
+            return
+        with open(pname, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, PROFILE_FIELDS)
+            writer.writeheader()
+            for profile in self._profiles:
+                writer.writerow(profile | {'plan': format_plan(profile['plan'] or []), 'scanned_tables': ' '.join(profile['scanned_tables'] or []),
+                                           'statements': format_statements(profile['statements'] or [])})
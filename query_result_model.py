@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: query_result_model.py
+# @Time: 2023/08/02 20:10:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import sqlite3
+from array import array
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from result_store import ResultStore, ResultChunk
+
+
+def _sort_key(value):
+    '''
+    sqlite查询结果同一列中可能混有数字、文本、NULL，统一成可比较的key
+    '''
+    if value is None:
+        return (3, 0)
+    if isinstance(value, (int, float)):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    return (2, bytes(value))
+
+
+class QueryResultModel(QAbstractTableModel):
+    '''
+    查询结果的数据模型，配合QTableView使用，视图只会绘制可见的行
+    store和外部保存的查询结果是同一个ResultStore，不额外复制数据，排序只改变order，不改变store
+    替换store时关闭原来的store，释放暂存在临时文件中的行
+    如果传入cursor，滚动到底部时会通过fetchMore继续从cursor中分批获取数据
+    '''
+    FETCH_BATCH_SIZE = 1000
+    FETCH_ALL_BATCH_SIZE = 5000 # 全部取出时每批的行数，超过内存上限的部分写到临时表
+
+    def __init__(self, parent=None) -> None:
+        super(__class__, self).__init__(parent)
+        self._columns = []
+        self._store: ResultStore = ResultStore([])
+        self._order: array = None # 排序后每一行在store中的行号，没有排序时为None
+        self._loaded_count = 0 # 已经提供给视图的行数
+        self._cursor = None
+        self._edits = {} # 界面上修改的内容，只用于显示，不会被保存和导出
+
+    @property
+    def order(self) -> array:
+        return self._order
+
+    def set_result(self, columns: list[str], store: ResultStore, cursor: sqlite3.Cursor = None) -> None:
+        self.beginResetModel()
+        if self._store is not store:
+            self._store.close()
+        self._columns = columns
+        self._store = store
+        self._order = None
+        self._cursor = cursor
+        self._edits = {}
+        self._loaded_count = 0
+        if self._cursor and not len(self._store):
+            self._fetch_from_cursor(self.FETCH_BATCH_SIZE)
+        self._loaded_count = min(len(self._store), self.FETCH_BATCH_SIZE)
+        self.endResetModel()
+
+    def clear(self) -> None:
+        self.set_result([], ResultStore([]))
+
+    def _fetch_from_cursor(self, size: int) -> None:
+        rows = self._cursor.fetchmany(size)
+        self._store.append_rows(rows)
+        if len(rows) < size:
+            self._cursor = None
+
+    def append_chunk(self, chunk: ResultChunk) -> None:
+        '''
+        追加后台线程分批获取到的数据，第一批直接显示，其余的在滚动时通过fetchMore显示
+        '''
+        start = len(self._store)
+        self._store.append_chunk(chunk)
+        if self._order is not None:
+            # 执行过程中排序过时，新的行放在排序结果的末尾，导出时按order也不会漏掉
+            self._order.extend(range(start, len(self._store)))
+        new_count = min(len(self._store), max(self._loaded_count, self.FETCH_BATCH_SIZE))
+        if new_count > self._loaded_count:
+            self.beginInsertRows(QModelIndex(), self._loaded_count, new_count - 1)
+            self._loaded_count = new_count
+            self.endInsertRows()
+
+    def fetch_all(self) -> ResultStore:
+        '''
+        把cursor中剩余的数据全部取出来（导出、排序时需要完整的结果）
+        '''
+        while self._cursor:
+            self._fetch_from_cursor(self.FETCH_ALL_BATCH_SIZE)
+        return self._store
+
+    def has_pending_rows(self) -> bool:
+        '''
+        cursor中是否还有没有取出的数据
+        '''
+        return self._cursor is not None
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._loaded_count
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._columns)
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        if parent.isValid():
+            return False
+        return self._loaded_count < len(self._store) or self._cursor is not None
+
+    def fetchMore(self, parent=QModelIndex()) -> None:
+        if parent.isValid():
+            return
+        if self._loaded_count >= len(self._store) and self._cursor:
+            self._fetch_from_cursor(self.FETCH_BATCH_SIZE)
+        new_count = min(len(self._store), self._loaded_count + self.FETCH_BATCH_SIZE)
+        if new_count <= self._loaded_count:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded_count, new_count - 1)
+        self._loaded_count = new_count
+        self.endInsertRows()
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        key = (index.row(), index.column())
+        if key in self._edits:
+            return self._edits[key]
+        row = index.row()
+        if self._order is not None:
+            row = self._order[row]
+        value = self._store.value(row, index.column())
+        return '' if value is None else str(value)
+
+    def setData(self, index: QModelIndex, value, role=Qt.EditRole) -> bool:
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        self._edits[(index.row(), index.column())] = value
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def flags(self, index: QModelIndex):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section] if section < len(self._columns) else None
+        return str(section + 1)
+
+    def sort(self, column: int, order=Qt.AscendingOrder) -> None:
+        if column < 0 or column >= len(self._columns):
+            return
+        self.layoutAboutToBeChanged.emit()
+        self.fetch_all()
+        values = self._store.column(column)
+        # 在当前的顺序上排序，相同的值保持上一次排序的顺序
+        current = self._order if self._order is not None else range(len(values))
+        self._order = array('L', sorted(current, key=lambda row: _sort_key(values[row]), reverse=(order == Qt.DescendingOrder)))
+        self._edits = {}
+        self.layoutChanged.emit()
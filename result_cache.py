@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: result_cache.py
+# @Time: 2023/10/14 09:45:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import sys
+import itertools
+from collections import OrderedDict, namedtuple
+from sql_tokenizer import Token, significant_tokens, is_identifier, is_keyword
+from result_store import ResultStore
+
+# 缓存的查询结果
+# rows: ResultStore或者行的list，和界面显示的结果共用，不复制数据
+# size: 估算的内存占用，字节
+CachedResult = namedtuple('CachedResult', ['columns', 'rows', 'size'])
+
+_READ_ONLY_START = ('SELECT', 'VALUES', 'WITH')
+_WRITE_KEYWORDS = ('INSERT', 'UPDATE', 'DELETE', 'CREATE', 'DROP', 'ALTER')
+# 每次执行结果可能不同的函数和关键词
+_NONDETERMINISTIC_FUNCTIONS = ('RANDOM', 'RANDOMBLOB', 'CHANGES', 'TOTAL_CHANGES', 'LAST_INSERT_ROWID')
+_NONDETERMINISTIC_KEYWORDS = ('CURRENT_DATE', 'CURRENT_TIME', 'CURRENT_TIMESTAMP')
+_SIZE_SAMPLE_ROWS = 100 # 估算内存占用时采样的行数
+
+
+def normalize_sql(tokens: list[Token]) -> str:
+    '''
+    去掉注释、多余的空白和末尾的分号，关键词和没有引号的标识符不区分大小写
+    '''
+    while tokens and tokens[-1].text == ';':
+        tokens = tokens[:-1]
+    return ' '.join([token.text.upper() if token.kind == 'name' else token.text for token in tokens])
+
+
+def is_cacheable(tokens: list[Token]) -> bool:
+    '''
+    只读并且每次执行结果相同的查询才能缓存
+    '''
+    if not tokens or not is_keyword(tokens[0], *_READ_ONLY_START):
+        return False
+    for index, token in enumerate(tokens):
+        if token.text == ';' and index != len(tokens) - 1:
+            return False # 多条语句
+        if is_keyword(token, *_WRITE_KEYWORDS, *_NONDETERMINISTIC_KEYWORDS):
+            # WITH ... DELETE/INSERT/UPDATE
+            return False
+        if is_keyword(token, 'REPLACE') and index + 1 < len(tokens) and is_keyword(tokens[index + 1], 'INTO'):
+            # REPLACE INTO，replace()函数不算
+            return False
+        if is_keyword(token, *_NONDETERMINISTIC_FUNCTIONS) and index + 1 < len(tokens) and tokens[index + 1].text == '(':
+            return False
+        if token.kind == 'string' and token.text.lower() == "'now'":
+            return False
+    return True
+
+
+def referenced_tables(tokens: list[Token], tables_name: list[str]) -> list[str]:
+    '''
+    SQL中引用的表，和表名相同的标识符都算（多算不影响正确性）
+    '''
+    tables = {name.lower(): name for name in tables_name}
+    referenced = {tables[token.value.lower()] for token in tokens if is_identifier(token) and token.value.lower() in tables}
+    return sorted(referenced)
+
+
+def estimate_rows_size(rows: list) -> int:
+    '''
+    采样估算查询结果占用的内存
+    '''
+    if not rows:
+        return sys.getsizeof(rows)
+    sample = rows[:_SIZE_SAMPLE_ROWS]
+    sample_size = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample)
+    return sys.getsizeof(rows) + sample_size * len(rows) // len(sample)
+
+
+class TableVersions:
+    '''
+    每个表的版本号，表的数据或结构变化时加1，查询结果缓存的key中包含引用的表的版本号
+    '''
+    def __init__(self) -> None:
+        self._versions = {}
+        self._counter = itertools.count(1)
+
+    def get(self, table_name: str) -> int:
+        return self._versions.get(table_name.lower(), 0)
+
+    def bump(self, *tables_name: str) -> None:
+        for table_name in tables_name:
+            # 用全局递增的计数，删除后重新创建的同名表也不会和以前的版本重复
+            self._versions[table_name.lower()] = next(self._counter)
+
+    def bump_all(self) -> None:
+        self.bump(*self._versions.keys())
+        # 以后出现的表也和之前的版本区分开
+        self._versions[''] = next(self._counter)
+
+    def global_version(self) -> int:
+        return self._versions.get('', 0)
+
+
+class ResultCache:
+    '''
+    查询结果的LRU缓存，key是规范化的SQL和引用的表的版本号
+    所有结果的估算内存超过max_bytes时淘汰最久没有使用的结果，单个结果超过max_bytes时不缓存
+    部分行暂存在临时文件中的ResultStore不缓存，淘汰、失效的ResultStore调用close
+    '''
+    DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self._max_bytes = max_bytes
+        self._results = OrderedDict()
+        self._total_bytes = 0
+        self._versions = TableVersions()
+
+    @property
+    def versions(self) -> TableVersions:
+        return self._versions
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def make_key(self, sql: str, tables_name: list[str]):
+        '''
+        返回缓存的key，不能缓存的SQL返回None
+        '''
+        tokens = significant_tokens(sql)
+        if not is_cacheable(tokens):
+            return None
+        versions = tuple((name.lower(), self._versions.get(name)) for name in referenced_tables(tokens, tables_name))
+        return normalize_sql(tokens), versions, self._versions.global_version()
+
+    def get(self, key) -> CachedResult:
+        if key is None or key not in self._results:
+            return None
+        self._results.move_to_end(key)
+        return self._results[key]
+
+    def put(self, key, columns: list[str], rows, size: int = None) -> None:
+        '''
+        size是结果占用的内存，为None时按行的list估算
+        '''
+        if key is None:
+            return
+        if isinstance(rows, ResultStore) and rows.spilled_rows:
+            # 临时文件不计入内存，缓存后淘汰时界面可能还在显示
+            return
+        size = estimate_rows_size(rows) if size is None else size
+        if size > self._max_bytes:
+            return
+        if key in self._results:
+            self._release(self._results.pop(key))
+        self._results[key] = CachedResult(columns, rows, size)
+        self._total_bytes += size
+        while self._total_bytes > self._max_bytes:
+            _, result = self._results.popitem(last=False)
+            self._release(result)
+
+    def _release(self, result: CachedResult) -> None:
+        self._total_bytes -= result.size
+        if isinstance(result.rows, ResultStore):
+            result.rows.close()
+
+    def invalidate(self, *tables_name: str) -> None:
+        '''
+        表的数据或结构变化后调用，增加版本号，并且马上释放引用了这些表的结果
+        '''
+        self._versions.bump(*tables_name)
+        names = {name.lower() for name in tables_name}
+        for key in [key for key in self._results if any(name in names for name, _ in key[1])]:
+            self._release(self._results.pop(key))
+
+    def invalidate_all(self) -> None:
+        '''
+        执行了写数据库的SQL，不知道影响了哪些表，所有结果都失效
+        '''
+        self._versions.bump_all()
+        while self._results:
+            _, result = self._results.popitem()
+            self._release(result)
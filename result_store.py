@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: result_store.py
+# @Time: 2023/11/11 14:20:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import os
+import sys
+import bisect
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Iterator
+
+DEFAULT_MEMORY_LIMIT_MB = 512
+_TEXT_DICT_MAX_RATIO = 0.5 # 不重复的文本不超过行数的这个比例时用字典编码
+_SIZE_SAMPLE_VALUES = 100 # 估算Python对象占用的内存时采样的个数
+_SPILL_BLOCK_ROWS = 1000 # 从临时表中读取时每块的行数
+_SPILL_CACHE_BLOCKS = 8 # 缓存最近读取的块数，滚动表格时不用每一行都查询
+_SPILL_IN_CHUNK = 500 # 按rowid查询时每条SQL的参数个数
+
+
+def result_memory_limit_from_env() -> int:
+    '''
+    环境变量SQL_FOR_EXCEL_RESULT_MB：查询结果在内存中的上限，MB，0表示不限制
+    '''
+    return int(os.environ.get('SQL_FOR_EXCEL_RESULT_MB', DEFAULT_MEMORY_LIMIT_MB)) * 1024 ** 2
+
+
+def _objects_size(values) -> int:
+    if not values:
+        return sys.getsizeof(values)
+    sample = values[:_SIZE_SAMPLE_VALUES]
+    return sys.getsizeof(values) + sum(sys.getsizeof(value) for value in sample) * len(values) // len(sample)
+
+
+class _ArrayColumn:
+    '''
+    整数或浮点数列，用array保存，NULL在nulls中标记
+    '''
+    __slots__ = ('_values', '_nulls')
+
+    def __init__(self, values: array, nulls: bytearray = None) -> None:
+        self._values = values
+        self._nulls = nulls
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._values.itemsize * len(self._values) + (len(self._nulls) if self._nulls else 0)
+
+    def get(self, index: int):
+        return None if self._nulls and self._nulls[index] else self._values[index]
+
+    def values(self):
+        if not self._nulls:
+            return self._values
+        return [None if null else value for value, null in zip(self._values, self._nulls)]
+
+
+class _DictColumn:
+    '''
+    重复很多的文本列，每一行保存在不重复的文本中的编号，NULL也是一个文本
+    '''
+    __slots__ = ('_codes', '_strings')
+
+    def __init__(self, codes: array, strings: list) -> None:
+        self._codes = codes
+        self._strings = strings
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._codes.itemsize * len(self._codes) + sys.getsizeof(self._strings) + sum(sys.getsizeof(value) for value in self._strings)
+
+    def get(self, index: int):
+        return self._strings[self._codes[index]]
+
+    def values(self):
+        return list(map(self._strings.__getitem__, self._codes))
+
+
+class _ObjectColumn:
+    '''
+    混合类型、blob、重复很少的文本，直接保存Python对象
+    '''
+    __slots__ = ('_values',)
+
+    def __init__(self, values: tuple) -> None:
+        self._values = values
+
+    @property
+    def memory_bytes(self) -> int:
+        return _objects_size(self._values)
+
+    def get(self, index: int):
+        return self._values[index]
+
+    def values(self):
+        return self._values
+
+
+def _pack_column(values: tuple):
+    '''
+    根据这一列的数据类型选择紧凑的格式，转换都在C代码中完成（zip、set、array），只有数字列有NULL时逐个处理
+    '''
+    types = set(map(type, values))
+    has_null = type(None) in types
+    types.discard(type(None))
+    if types == {int} or types == {float}:
+        # 整数和浮点数混合的列不转换，转换后显示的内容会变
+        typecode, zero = ('q', 0) if types == {int} else ('d', 0.0)
+        try:
+            if not has_null:
+                return _ArrayColumn(array(typecode, values))
+            nulls = bytearray(value is None for value in values)
+            return _ArrayColumn(array(typecode, [zero if value is None else value for value in values]), nulls)
+        except OverflowError:
+            # 超过int64的整数
+            return _ObjectColumn(values)
+    if types <= {str}:
+        strings = list(dict.fromkeys(values))
+        if len(strings) <= len(values) * _TEXT_DICT_MAX_RATIO:
+            codes = {value: code for code, value in enumerate(strings)}
+            typecode = 'B' if len(strings) <= 0x100 else 'H' if len(strings) <= 0x10000 else 'I'
+            return _DictColumn(array(typecode, map(codes.__getitem__, values)), strings)
+    return _ObjectColumn(values)
+
+
+class ResultChunk:
+    '''
+    一批查询结果按列保存，每一列根据这一批的数据类型选择格式，比每行一个tuple节省几倍的内存
+    在后台线程中创建（转换的用时不占用界面线程），创建后只读
+    '''
+    __slots__ = ('_columns', '_count', 'memory_bytes')
+
+    def __init__(self, rows: list, column_count: int) -> None:
+        self._count = len(rows)
+        if rows:
+            self._columns = [_pack_column(values) for values in zip(*rows)]
+        else:
+            self._columns = [_ObjectColumn(()) for _ in range(column_count)]
+        self.memory_bytes = sum(column.memory_bytes for column in self._columns)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def value(self, row: int, column: int):
+        return self._columns[column].get(row)
+
+    def row(self, row: int) -> tuple:
+        return tuple(column.get(row) for column in self._columns)
+
+    def column(self, column: int):
+        return self._columns[column].values()
+
+    def rows(self) -> list[tuple]:
+        return list(zip(*[column.values() for column in self._columns]))
+
+
+class ResultStore:
+    '''
+    一次查询的完整结果，界面的表格和导出都直接读取，不复制数据
+    前面的行以ResultChunk的形式放在内存中，内存占用超过memory_limit后，
+    后面的行都写到sqlite的临时数据库中（关闭连接时自动删除），按rowid分块读取
+    追加数据只在界面线程中进行，导出线程只读取已经完整的结果
+    不再使用时调用close释放临时数据库
+    '''
+    def __init__(self, columns: list[str], memory_limit: int = 0) -> None:
+        self._columns = columns
+        self._memory_limit = memory_limit
+        self._chunks: list[ResultChunk] = []
+        self._starts: list[int] = [] # 每个chunk的第一行的行号
+        self._memory_count = 0 # 内存中的行数
+        self._memory_bytes = 0
+        self._spill_conn: sqlite3.Connection = None
+        self._spill_count = 0 # 临时表中的行数
+        self._spill_blocks = OrderedDict() # 块号: 行的list
+        self._lock = threading.Lock() # 界面线程和导出线程都可能读取临时表
+        self._readers = 0 # 正在用iter_batches分批读取的个数
+        self._closed = False
+
+    def __len__(self) -> int:
+        return self._memory_count + self._spill_count
+
+    @property
+    def columns(self) -> list[str]:
+        return self._columns
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    @property
+    def spilled_rows(self) -> int:
+        return self._spill_count
+
+    def close(self) -> None:
+        '''
+        关闭临时数据库，sqlite同时删除临时文件，内存中的行不受影响
+        导出线程正在分批读取时，等读取结束后再关闭
+        '''
+        with self._lock:
+            self._closed = True
+            if not self._readers:
+                self._close_spill()
+
+    def _close_spill(self) -> None:
+        conn, self._spill_conn = self._spill_conn, None
+        self._spill_blocks.clear()
+        if conn is not None:
+            conn.close()
+
+    def append_rows(self, rows: list) -> None:
+        if rows:
+            self.append_chunk(ResultChunk(rows, len(self._columns)))
+
+    def append_chunk(self, chunk: ResultChunk) -> None:
+        if not len(chunk):
+            return
+        if self._spill_conn is None and (not self._memory_limit or self._memory_bytes + chunk.memory_bytes <= self._memory_limit):
+            self._starts.append(self._memory_count)
+            self._chunks.append(chunk)
+            self._memory_count += len(chunk)
+            self._memory_bytes += chunk.memory_bytes
+            return
+        # 超过上限后的行都写到临时表，保证行号连续
+        self._spill(chunk.rows())
+
+    def _spill(self, rows: list) -> None:
+        with self._lock:
+            if self._spill_conn is None:
+                # 空文件名是sqlite的临时数据库，页缓存满了才写到磁盘上的临时文件，关闭时自动删除
+                self._spill_conn = sqlite3.connect('', check_same_thread=False)
+                self._spill_conn.execute('PRAGMA journal_mode=OFF')
+                self._spill_conn.execute('PRAGMA synchronous=OFF')
+                fields = ', '.join([f'c{index}' for index in range(len(self._columns))])
+                self._spill_conn.execute(f'CREATE TABLE spill ({fields})')
+            placeholders = ', '.join(['?'] * len(self._columns))
+            self._spill_conn.executemany(f'INSERT INTO spill VALUES ({placeholders})', rows)
+            self._spill_conn.commit()
+            self._spill_count += len(rows)
+
+    def _spill_block(self, block: int) -> list:
+        with self._lock:
+            if block in self._spill_blocks:
+                self._spill_blocks.move_to_end(block)
+                return self._spill_blocks[block]
+            # rowid从1开始，和写入的顺序一致
+            rows = self._spill_conn.execute('SELECT * FROM spill WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                                            (block * _SPILL_BLOCK_ROWS, _SPILL_BLOCK_ROWS)).fetchall()
+            self._spill_blocks[block] = rows
+            if len(self._spill_blocks) > _SPILL_CACHE_BLOCKS:
+                self._spill_blocks.popitem(last=False)
+            return rows
+
+    def _locate(self, row: int) -> tuple[ResultChunk, int]:
+        index = bisect.bisect_right(self._starts, row) - 1
+        return self._chunks[index], row - self._starts[index]
+
+    def value(self, row: int, column: int):
+        if row < self._memory_count:
+            chunk, offset = self._locate(row)
+            return chunk.value(offset, column)
+        return self.row(row)[column]
+
+    def row(self, row: int) -> tuple:
+        if row < self._memory_count:
+            chunk, offset = self._locate(row)
+            return chunk.row(offset)
+        spill_row = row - self._memory_count
+        return self._spill_block(spill_row // _SPILL_BLOCK_ROWS)[spill_row % _SPILL_BLOCK_ROWS]
+
+    def rows(self, indexes: list[int]) -> list[tuple]:
+        '''
+        按行号取出多行（排序后的顺序），临时表中的行一次查询多行
+        '''
+        spilled = {}
+        spill_rowids = sorted({index - self._memory_count + 1 for index in indexes if index >= self._memory_count})
+        with self._lock:
+            for start in range(0, len(spill_rowids), _SPILL_IN_CHUNK):
+                rowids = spill_rowids[start:start + _SPILL_IN_CHUNK]
+                placeholders = ', '.join(['?'] * len(rowids))
+                for rowid, *values in self._spill_conn.execute(f'SELECT rowid, * FROM spill WHERE rowid IN ({placeholders})', rowids):
+                    spilled[rowid] = tuple(values)
+        return [self.row(index) if index < self._memory_count else spilled[index - self._memory_count + 1] for index in indexes]
+
+    def column(self, column: int) -> list:
+        '''
+        一整列的值，排序时用
+        '''
+        values = []
+        for chunk in self._chunks:
+            values.extend(chunk.column(column))
+        if self._spill_count:
+            with self._lock:
+                values.extend(value for (value,) in self._spill_conn.execute(f'SELECT c{column} FROM spill ORDER BY rowid'))
+        return values
+
+    def iter_batches(self, batch_size: int, order: list[int] = None) -> Iterator[list]:
+        '''
+        分批遍历所有的行，order是排序后的行号，每次只转换一批数据
+        '''
+        with self._lock:
+            self._readers += 1
+        try:
+            if order is not None:
+                for start in range(0, len(order), batch_size):
+                    yield self.rows(order[start:start + batch_size])
+                return
+            for chunk in self._chunks:
+                yield chunk.rows()
+            for start in range(0, self._spill_count, batch_size):
+                with self._lock:
+                    rows = self._spill_conn.execute('SELECT * FROM spill WHERE rowid > ? ORDER BY rowid LIMIT ?', (start, batch_size)).fetchall()
+                yield rows
+        finally:
+            with self._lock:
+                self._readers -= 1
+                if self._closed and not self._readers:
+                    self._close_spill()
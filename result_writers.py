@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: result_writers.py
+# @Time: 2023/09/16 10:30:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import io
+import os
+import re
+import csv
+import math
+import shutil
+import zipfile
+import tempfile
+import posixpath
+from pathlib import Path
+from xml.sax.saxutils import escape, unescape
+
+# 导出支持的文件类型
+EXPORT_SUFFIXES = ('.xlsx', '.csv', '.tsv', '.parquet')
+EXCEL_MAX_ROWS = 1048576
+
+_ILLEGAL_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_NS_PACKAGE_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_REL_TYPE_OFFICE_DOCUMENT = f'{_NS_REL}/officeDocument'
+_REL_TYPE_WORKSHEET = f'{_NS_REL}/worksheet'
+_CONTENT_TYPE_WORKSHEET = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+_CONTENT_TYPE_WORKBOOK = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml'
+
+
+def _escape_attr(value: str) -> str:
+    return escape(value, {'"': '&quot;'})
+
+
+def _column_letter(index: int) -> str:
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+class _SheetXmlWriter:
+    '''
+    流式写worksheet的xml，字符串用inlineStr写在单元格中，不需要修改sharedStrings.xml
+    '''
+    def __init__(self, stream: io.TextIOBase, columns: list[str]) -> None:
+        self._stream = stream
+        self._letters = [_column_letter(index) for index in range(len(columns))]
+        self._row_index = 0
+        self._stream.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                           f'<worksheet xmlns="{_NS_MAIN}"><sheetData>')
+        self.write_rows([columns])
+
+    def _cell(self, ref: str, value) -> str:
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)) and not (isinstance(value, float) and not math.isfinite(value)):
+            return f'<c r="{ref}"><v>{value!r}</v></c>'
+        if isinstance(value, bytes):
+            value = value.hex()
+        text = escape(_ILLEGAL_XML_CHARS.sub('', str(value)))
+        space = ' xml:space="preserve"' if text != text.strip() else ''
+        return f'<c r="{ref}" t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+    def write_rows(self, rows) -> None:
+        parts = []
+        for row in rows:
+            self._row_index += 1
+            if self._row_index > EXCEL_MAX_ROWS:
+                raise ValueError(f'超过Excel表格的最大行数[{EXCEL_MAX_ROWS}]！')
+            cells = ''.join([self._cell(f'{letter}{self._row_index}', value) for letter, value in zip(self._letters, row)])
+            parts.append(f'<row r="{self._row_index}">{cells}</row>')
+        self._stream.write(''.join(parts))
+
+    def close(self) -> None:
+        self._stream.write('</sheetData></worksheet>')
+        self._stream.close()
+
+
+class XlsxResultWriter:
+    '''
+    xlsx文件导出
+    append=True时在已有的工作簿中增加一个表格：其他部件按原样流式复制，只修改workbook.xml、
+    workbook.xml.rels、[Content_Types].xml这几个很小的索引文件，不用解析和重写已有的表格
+    append=False时新建只有这一个表格的工作簿
+    写到同一目录下的临时文件中，close()时替换目标文件，abort()时删除临时文件
+    '''
+    def __init__(self, pname: Path, columns: list[str], sheet_name: str, append: bool = True) -> None:
+        self._pname = Path(pname)
+        fd, tmp_name = tempfile.mkstemp(prefix='~$', suffix='.tmp', dir=self._pname.parent)
+        os.close(fd)
+        self._tmp_pname = Path(tmp_name)
+        self._zout = zipfile.ZipFile(self._tmp_pname, 'w', zipfile.ZIP_DEFLATED)
+        try:
+            if append:
+                sheet_part = self._copy_workbook_with_new_sheet(sheet_name)
+            else:
+                sheet_part = self._write_new_workbook(sheet_name)
+            stream = io.TextIOWrapper(self._zout.open(sheet_part, 'w', force_zip64=True), encoding='utf-8')
+            self._sheet = _SheetXmlWriter(stream, columns)
+        except Exception:
+            self.abort()
+            raise
+
+    def _write_new_workbook(self, sheet_name: str) -> str:
+        self._zout.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{_CONTENT_TYPE_WORKBOOK}"/>'
+            f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{_CONTENT_TYPE_WORKSHEET}"/></Types>')
+        self._zout.writestr('_rels/.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{_NS_PACKAGE_REL}">'
+            f'<Relationship Id="rId1" Type="{_REL_TYPE_OFFICE_DOCUMENT}" Target="xl/workbook.xml"/></Relationships>')
+        self._zout.writestr('xl/workbook.xml', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<workbook xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}"><sheets>'
+            f'<sheet name="{_escape_attr(sheet_name)}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        self._zout.writestr('xl/_rels/workbook.xml.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="{_NS_PACKAGE_REL}">'
+            f'<Relationship Id="rId1" Type="{_REL_TYPE_WORKSHEET}" Target="worksheets/sheet1.xml"/></Relationships>')
+        return 'xl/worksheets/sheet1.xml'
+
+    def _copy_workbook_with_new_sheet(self, sheet_name: str) -> str:
+        with zipfile.ZipFile(self._pname) as zin:
+            names = set(zin.namelist())
+            # 找到workbook.xml的位置
+            root_rels = zin.read('_rels/.rels').decode('utf-8')
+            match = re.search(r'<Relationship\b[^>]*Type="' + re.escape(_REL_TYPE_OFFICE_DOCUMENT) + r'"[^>]*/>', root_rels)
+            target = re.search(r'Target="([^"]+)"', match.group()).group(1) if match else 'xl/workbook.xml'
+            workbook_part = target.lstrip('/')
+            workbook_dir, workbook_file = posixpath.split(workbook_part)
+            rels_part = posixpath.join(workbook_dir, '_rels', f'{workbook_file}.rels')
+            workbook = zin.read(workbook_part).decode('utf-8')
+            rels = zin.read(rels_part).decode('utf-8')
+            content_types = zin.read('[Content_Types].xml').decode('utf-8')
+            # 表格名称不能重复（不区分大小写）
+            exists_names = [unescape(name, {'&quot;': '"', '&apos;': "'"}) for name in re.findall(r'<(?:\w+:)?sheet\b[^>]*?\bname="([^"]*)"', workbook)]
+            if sheet_name.lower() in [name.lower() for name in exists_names]:
+                raise ValueError(f'Excel文件中已存在表格[{sheet_name}]！')
+            # 新表格的部件名称、sheetId、关系Id
+            sheet_index = 1
+            while posixpath.join(workbook_dir, 'worksheets', f'sheet{sheet_index}.xml') in names:
+                sheet_index += 1
+            sheet_part = posixpath.join(workbook_dir, 'worksheets', f'sheet{sheet_index}.xml')
+            sheet_id = max([int(value) for value in re.findall(r'\bsheetId="(\d+)"', workbook)] + [0]) + 1
+            rel_ids = set(re.findall(r'\bId="([^"]+)"', rels))
+            rel_index = 1
+            while f'rId{rel_index}' in rel_ids:
+                rel_index += 1
+            rel_id = f'rId{rel_index}'
+            # 修改索引文件
+            prefix_match = re.search(r'xmlns:(\w+)="' + re.escape(_NS_REL) + '"', workbook)
+            if prefix_match:
+                rel_attr = f'{prefix_match.group(1)}:id'
+            else:
+                rel_attr = 'sfe_r:id'
+                workbook = re.sub(r'<((?:\w+:)?workbook)\b', rf'<\1 xmlns:sfe_r="{_NS_REL}"', workbook, count=1)
+            workbook = re.sub(r'(</(?:\w+:)?sheets>)',
+                lambda m: f'<sheet name="{_escape_attr(sheet_name)}" sheetId="{sheet_id}" {rel_attr}="{rel_id}"/>{m.group(1)}', workbook, count=1)
+            rels = rels.replace('</Relationships>',
+                f'<Relationship Id="{rel_id}" Type="{_REL_TYPE_WORKSHEET}" Target="worksheets/sheet{sheet_index}.xml"/></Relationships>')
+            content_types = content_types.replace('</Types>',
+                f'<Override PartName="/{sheet_part}" ContentType="{_CONTENT_TYPE_WORKSHEET}"/></Types>')
+            patched = {workbook_part: workbook, rels_part: rels, '[Content_Types].xml': content_types}
+            # 其他部件按原样复制
+            for info in zin.infolist():
+                if info.filename in patched:
+                    self._zout.writestr(info.filename, patched[info.filename])
+                    continue
+                new_info = zipfile.ZipInfo(info.filename, info.date_time)
+                new_info.compress_type = info.compress_type
+                new_info.external_attr = info.external_attr
+                with zin.open(info) as src, self._zout.open(new_info, 'w', force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as dst:
+                    shutil.copyfileobj(src, dst, 1024 ** 2)
+        return sheet_part
+
+    def write_rows(self, rows) -> None:
+        self._sheet.write_rows(rows)
+
+    def close(self) -> None:
+        self._sheet.close()
+        self._zout.close()
+        os.replace(self._tmp_pname, self._pname)
+
+    def abort(self) -> None:
+        try:
+            self._zout.close()
+        except Exception:
+            pass
+        self._tmp_pname.unlink(missing_ok=True)
+
+
+class CsvResultWriter:
+    '''
+    csv/tsv文件导出，用utf-8-sig编码，Excel可以直接打开
+    '''
+    def __init__(self, pname: Path, columns: list[str], delimiter: str = ',') -> None:
+        self._file = open(pname, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file, delimiter=delimiter)
+        self._writer.writerow(columns)
+
+    def write_rows(self, rows) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def abort(self) -> None:
+        self._file.close()
+
+
+class ParquetResultWriter:
+    '''
+    parquet文件导出，每批数据写一个row group，需要安装pyarrow
+    每一列的类型由第一批数据决定，全是空值或者类型不一致的列按文本导出
+    sqlite的列没有固定类型，后面的批次放不下时放宽这一列的类型（整数遇到小数为float64，其他为文本），
+    已经写出的row group按新的类型重写一遍，只在类型变化时发生
+    '''
+    def __init__(self, pname: Path, columns: list[str]) -> None:
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pname = Path(pname)
+        self._columns = columns
+        self._schema = None
+        self._writer = None
+        self._tmp_pname = self._pname.with_name(self._pname.name + '.tmp')
+        self._writer_pname = self._pname # 放宽类型重写后，正在写的文件可能是临时文件
+        self._parquet = pyarrow.parquet
+
+    def _make_array(self, values: list, index: int):
+        if self._schema is not None:
+            # 不符合已有类型时返回None
+            field_type = self._schema.field(index).type
+            if field_type == self._pa.string():
+                values = [None if value is None else str(value) for value in values]
+            elif self._pa.types.is_integer(field_type) and any(isinstance(value, float) for value in values):
+                # pyarrow会把小数截断成整数，不会报错
+                return None
+            try:
+                return self._pa.array(values, type=field_type)
+            except (self._pa.ArrowInvalid, self._pa.ArrowTypeError):
+                return None
+        try:
+            array = self._pa.array(values)
+        except (self._pa.ArrowInvalid, self._pa.ArrowTypeError):
+            array = None
+        if array is None or array.type == self._pa.null():
+            array = self._pa.array([None if value is None else str(value) for value in values], type=self._pa.string())
+        return array
+
+    def _widen_type(self, field_type, values: list):
+        if self._pa.types.is_integer(field_type) \
+                and all(value is None or isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+            return self._pa.float64()
+        return self._pa.string()
+
+    def _cast_column(self, column, field_type):
+        try:
+            return column.cast(field_type)
+        except (self._pa.ArrowInvalid, self._pa.ArrowTypeError, self._pa.ArrowNotImplementedError):
+            return self._pa.array([None if value is None else str(value) for value in column.to_pylist()], type=field_type)
+
+    def _widen_field(self, index: int, field_type) -> None:
+        '''
+        把第index列改成field_type，已经写出的数据逐个row group读出来转换后写到另一个文件，
+        parquet文件不能追加，新的writer保持打开继续写后面的数据，close时再改成导出的文件名
+        '''
+        self._writer.close()
+        old_pname = self._writer_pname
+        self._writer_pname = self._tmp_pname if old_pname == self._pname else self._pname
+        field = self._pa.field(self._columns[index], field_type)
+        self._schema = self._schema.set(index, field)
+        self._writer = self._parquet.ParquetWriter(self._writer_pname, self._schema)
+        with open(old_pname, 'rb') as f:
+            for batch in self._parquet.ParquetFile(f).iter_batches():
+                table = self._pa.Table.from_batches([batch])
+                self._writer.write_table(table.set_column(index, field, self._cast_column(table.column(index), field_type)))
+        old_pname.unlink()
+
+    def write_rows(self, rows) -> None:
+        rows = list(rows)
+        if not rows:
+            return
+        arrays = []
+        for index in range(len(self._columns)):
+            values = [row[index] for row in rows]
+            array = self._make_array(values, index)
+            if array is None:
+                self._widen_field(index, self._widen_type(self._schema.field(index).type, values))
+                array = self._make_array(values, index)
+            arrays.append(array)
+        if self._writer is None:
+            self._schema = self._pa.schema([self._pa.field(name, array.type) for name, array in zip(self._columns, arrays)])
+            self._writer = self._parquet.ParquetWriter(self._pname, self._schema)
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        if self._writer is None:
+            # 没有数据时也写一个只有表头的文件
+            schema = self._pa.schema([self._pa.field(name, self._pa.string()) for name in self._columns])
+            self._writer = self._parquet.ParquetWriter(self._pname, schema)
+        self._writer.close()
+        if self._writer_pname != self._pname:
+            os.replace(self._writer_pname, self._pname)
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._tmp_pname.unlink(missing_ok=True)
+        self._pname.unlink(missing_ok=True)
+
+
+def open_result_writer(pname: Path, columns: list[str], sheet_name: str = None, append: bool = False):
+    '''
+    根据文件后缀创建导出的writer，xlsx需要sheet_name，append=True时追加到已有的工作簿
+    '''
+    pname = Path(pname)
+    suffix = pname.suffix.lower()
+    if suffix == '.xlsx':
+        return XlsxResultWriter(pname, columns, sheet_name or pname.stem[:31], append)
+    if suffix == '.csv':
+        return CsvResultWriter(pname, columns)
+    if suffix == '.tsv':
+        return CsvResultWriter(pname, columns, '\t')
+    if suffix == '.parquet':
+        return ParquetResultWriter(pname, columns)
+    raise ValueError(f'不支持导出为{suffix}文件，支持的文件类型：{" ".join(EXPORT_SUFFIXES)}')
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: schema_catalog.py
+# @Time: 2023/10/28 09:20:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import sqlite3
+from pathlib import Path
+from collections import namedtuple
+from typing import Iterable, Iterator
+
+# 数据库中的一个表
+# columns: list[(列名称, 类型)]
+# rows_count: 行数，执行过修改数据的SQL后不知道行数时为None
+# source: (Excel文件路径, 表格名称)，不是从Excel导入的表为None
+# item: 界面上对应的树节点，没有时为None
+# loaded: 延迟加载的表只创建了空表，数据还没有加载时为False
+# is_view: 视图，查询时才从引用的表中读取数据，没有行数，不能修改字段类型、创建索引
+TableInfo = namedtuple('TableInfo', ['name', 'columns', 'rows_count', 'source', 'item', 'loaded', 'is_view'],
+                       defaults=[None, None, None, True, False])
+
+
+class TableNames:
+    '''
+    不区分大小写的表名集合（sqlite的表名不区分大小写），分配新表名时用
+    '''
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self._names = {name.lower() for name in names}
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self._names
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: str) -> None:
+        self._names.add(name.lower())
+
+    def discard(self, name: str) -> None:
+        self._names.discard(name.lower())
+
+
+class SchemaCatalog:
+    '''
+    数据库中所有表的目录，是表、列、行数、来源和树节点的唯一来源，
+    导入、删除、修改表时同步更新，界面上的操作不需要扫描sqlite_master
+    只有执行了用户的SQL（可能创建、删除了表）后才用refresh()重新读取一次
+    '''
+    def __init__(self) -> None:
+        self._tables: dict[str, TableInfo] = {} # 小写表名: TableInfo，保持创建顺序
+
+    def __contains__(self, table_name: str) -> bool:
+        return table_name.lower() in self._tables
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    def __iter__(self) -> Iterator[TableInfo]:
+        return iter(list(self._tables.values()))
+
+    def get(self, table_name: str) -> TableInfo:
+        return self._tables.get(table_name.lower())
+
+    def tables_name(self) -> list[str]:
+        return [table.name for table in self._tables.values()]
+
+    def table_names(self) -> TableNames:
+        '''
+        已有表名的副本，后台线程用它分配不冲突的表名
+        '''
+        return TableNames(self.tables_name())
+
+    def columns(self, table_name: str) -> list[str]:
+        table = self.get(table_name)
+        return [col for col, _ in table.columns] if table else []
+
+    def table_columns(self) -> dict[str, list[str]]:
+        return {table.name: [col for col, _ in table.columns] for table in self._tables.values()}
+
+    def add(self, table_name: str, columns: list[tuple[str, str]], rows_count: int = None, source: tuple[Path, str] = None, item=None,
+            loaded: bool = True, is_view: bool = False) -> TableInfo:
+        table = TableInfo(table_name, list(columns), rows_count, source, item, loaded, is_view)
+        self._tables[table_name.lower()] = table
+        return table
+
+    def update(self, table_name: str, **fields) -> TableInfo:
+        '''
+        修改表的信息，fields是TableInfo的字段，表不存在时返回None
+        '''
+        table = self.get(table_name)
+        if table is None:
+            return None
+        table = table._replace(**fields)
+        self._tables[table_name.lower()] = table
+        return table
+
+    def remove(self, table_name: str) -> TableInfo:
+        return self._tables.pop(table_name.lower(), None)
+
+    def clear(self) -> None:
+        self._tables = {}
+
+    def refresh(self, conn: sqlite3.Connection) -> tuple[list[str], list[str]]:
+        '''
+        从数据库重新读取所有的表和视图，已有的表保留来源和树节点，执行的SQL可能修改了数据，行数都变成未知
+        返回 (新增的表, 删除的表)
+        '''
+        old_tables = self._tables
+        self._tables = {}
+        sql = "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'"
+        for table_name, table_type in conn.execute(sql).fetchall():
+            columns = [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info([{table_name}])')]
+            old = old_tables.get(table_name.lower())
+            if old is None:
+                self.add(table_name, columns, is_view=table_type == 'view')
+            else:
+                self._tables[table_name.lower()] = old._replace(name=table_name, columns=columns, rows_count=None, is_view=table_type == 'view')
+        added = [table.name for key, table in self._tables.items() if key not in old_tables]
+        removed = [table.name for key, table in old_tables.items() if key not in self._tables]
+        return added, removed
+
+    def lazy_tables(self) -> list[TableInfo]:
+        '''
+        数据还没有加载的表，按创建顺序
+        '''
+        return [table for table in self._tables.values() if not table.loaded]
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: sql_completer.py
+# @Time: 2023/12/09 15:20:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+from pathlib import Path
+from PyQt5.QtCore import Qt, QEvent, QModelIndex
+from PyQt5.QtGui import QIcon, QStandardItem, QStandardItemModel, QTextCursor
+from PyQt5.QtWidgets import QCompleter, QPlainTextEdit
+from completion_index import CompletionIndex
+
+# 超过这个长度的修改是粘贴或者打开工作区，不弹出补全
+_MAX_TYPED_CHARS = 8
+
+
+class SqlCompleter(QCompleter):
+    '''
+    SQL编辑器的自动补全，输入标识符时弹出候选列表，Ctrl+Space手动弹出，Enter/Tab插入选中的候选
+    候选由CompletionIndex在界面线程中查找（前缀树，不到1毫秒），不需要后台线程，也不会卡住输入
+    '''
+    def __init__(self, editor: QPlainTextEdit, index: CompletionIndex, icons_path: Path) -> None:
+        super(__class__, self).__init__(editor)
+        self._editor = editor
+        self._index = index
+        self._model = QStandardItemModel(self)
+        self._icons = {
+            'keyword': QIcon(),
+            'table': QIcon(str(icons_path / 'table.svg')),
+            'column': QIcon(str(icons_path / 'field.svg')),
+        }
+        self._start = 0 # 选中候选后替换的起始位置
+        self._inserting = False # 正在插入候选，文本的变化不触发补全
+        self.setModel(self._model)
+        self.setWidget(editor)
+        # 候选已经按上下文过滤好了，不再按输入的前缀过滤
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.setMaxVisibleItems(12)
+        self.activated[QModelIndex].connect(self._insert_completion)
+        editor.document().contentsChange.connect(self._document_contentsChange)
+        editor.installEventFilter(self)
+
+    def eventFilter(self, obj, event) -> bool:
+        if obj is self._editor and event.type() == QEvent.KeyPress \
+                and event.key() == Qt.Key_Space and event.modifiers() & Qt.ControlModifier:
+            self.show_completions(self._editor.textCursor().position(), True)
+            return True
+        return super(__class__, self).eventFilter(obj, event)
+
+    def _document_contentsChange(self, position: int, removed: int, added: int) -> None:
+        # 语法高亮修改格式时removed和added相同
+        if self._inserting or removed == added:
+            return
+        if 0 < added <= _MAX_TYPED_CHARS:
+            self.show_completions(position + added)
+        elif added == 0 and self.popup().isVisible():
+            # 删除字符时更新已经弹出的候选
+            self.show_completions(position)
+        else:
+            self.popup().hide()
+
+    def show_completions(self, position: int, force: bool = False) -> None:
+        '''
+        显示光标在position时的候选，没有候选时隐藏弹出的列表
+        '''
+        sql = self._editor.toPlainText()
+        self._start, completions = self._index.complete(sql, position, force)
+        typed = sql[self._start:position]
+        # 已经输入完整的唯一候选不再弹出
+        if not completions or len(completions) == 1 and completions[0].text.lower() == typed.lower():
+            self.popup().hide()
+            return
+        self._model.clear()
+        for completion in completions:
+            item = QStandardItem(self._icons[completion.kind], completion.name)
+            item.setData(completion.text, Qt.UserRole)
+            item.setToolTip(completion.kind)
+            self._model.appendRow(item)
+        popup = self.popup()
+        popup.setCurrentIndex(self._model.index(0, 0))
+        cursor = QTextCursor(self._editor.document())
+        cursor.setPosition(position)
+        rect = self._editor.cursorRect(cursor)
+        rect.setWidth(popup.sizeHintForColumn(0) + popup.verticalScrollBar().sizeHint().width())
+        self.complete(rect)
+
+    def _insert_completion(self, index: QModelIndex) -> None:
+        cursor = self._editor.textCursor()
+        end = cursor.position()
+        cursor.setPosition(min(self._start, end))
+        cursor.setPosition(end, QTextCursor.KeepAnchor)
+        self._inserting = True
+        try:
+            cursor.insertText(index.data(Qt.UserRole))
+        finally:
+            self._inserting = False
+        self._editor.setTextCursor(cursor)
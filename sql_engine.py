@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: sql_engine.py
+# @Time: 2023/09/23 10:10:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import os
+import time
+import sqlite3
+import logging
+import tempfile
+import itertools
+from pathlib import Path
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+from column_types import infer_column_types, convert_rows, typed_rows
+from excel_reader import iter_excel_sheets
+from result_writers import open_result_writer
+from sql_tokenizer import split_statements, strip_trailing_semicolons
+from schema_catalog import SchemaCatalog, TableNames
+from workspace_store import save_workspace, load_workspace
+
+# 导入到数据库中的表
+# columns: list[(列名称, 类型)]
+ImportedTable = namedtuple('ImportedTable', ['sheet_name', 'table_name', 'columns', 'rows_count'])
+
+# 数据库的存储配置
+# disk: 数据库放在临时文件中，数据量可以超过内存大小
+# temp_dir: 临时文件所在的目录，None时用系统的临时目录
+# cache_size_mb: 每个连接的页缓存大小
+# mmap_size_mb: 用内存映射读取临时文件的大小，0表示不用内存映射（只对临时文件有效）
+StorageProfile = namedtuple('StorageProfile', ['disk', 'temp_dir', 'cache_size_mb', 'mmap_size_mb'],
+                            defaults=[False, None, 64, 4096])
+BULK_CACHE_SIZE_MB = 256 # 批量导入时的页缓存大小
+_SAFE_JOURNAL_MODES = ('delete', 'truncate', 'persist') # 批量导入时可以临时改成MEMORY的日志模式
+_memory_db_ids = itertools.count(1) # 同一个进程中每个SqlEngine的内存数据库编号，共享缓存的内存数据库按名称共享
+
+
+def storage_profile_from_env() -> StorageProfile:
+    '''
+    从环境变量读取存储配置：
+    SQL_FOR_EXCEL_WORKSPACE=disk 使用临时文件，SQL_FOR_EXCEL_WORKSPACE_DIR 临时文件的目录，
+    SQL_FOR_EXCEL_CACHE_MB 页缓存大小，SQL_FOR_EXCEL_MMAP_MB 内存映射大小
+    '''
+    default = StorageProfile()
+    return StorageProfile(
+        os.environ.get('SQL_FOR_EXCEL_WORKSPACE', 'memory').lower() == 'disk',
+        os.environ.get('SQL_FOR_EXCEL_WORKSPACE_DIR') or None,
+        int(os.environ.get('SQL_FOR_EXCEL_CACHE_MB', default.cache_size_mb)),
+        int(os.environ.get('SQL_FOR_EXCEL_MMAP_MB', default.mmap_size_mb)))
+
+
+def apply_storage_pragmas(conn: sqlite3.Connection, profile: StorageProfile) -> None:
+    '''
+    设置连接的缓存、写盘方式和临时数据的位置，这些设置只对当前连接有效，每个连接都要设置
+    '''
+    conn.execute(f'PRAGMA cache_size=-{profile.cache_size_mb * 1024}')
+    if profile.disk:
+        conn.execute('PRAGMA synchronous=NORMAL')
+        # 大的排序、临时表也写到临时文件中，不占用内存
+        conn.execute('PRAGMA temp_store=FILE')
+        conn.execute(f'PRAGMA mmap_size={profile.mmap_size_mb * 1024 ** 2}')
+    else:
+        conn.execute('PRAGMA temp_store=MEMORY')
+
+
+@contextmanager
+def bulk_load(conn: sqlite3.Connection, profile: StorageProfile):
+    '''
+    批量导入数据时临时使用的设置：不等待写盘、回滚日志放在内存、更大的页缓存、临时数据放在内存，
+    结束后恢复成profile的设置
+    WAL模式下有其他连接时不能切换日志模式，WAL本身写入就很快，保持不变
+    '''
+    journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0].lower()
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute(f'PRAGMA cache_size=-{max(profile.cache_size_mb, BULK_CACHE_SIZE_MB) * 1024}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    if journal_mode in _SAFE_JOURNAL_MODES:
+        conn.execute('PRAGMA journal_mode=MEMORY')
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        if journal_mode in _SAFE_JOURNAL_MODES:
+            conn.execute(f'PRAGMA journal_mode={journal_mode}')
+        apply_storage_pragmas(conn, profile)
+
+
+def make_table_name(sheet_name: str, tables_name: set) -> str:
+    '''
+    表名冲突时加 _1 _2 后缀，tables_name可以是set、TableNames或者SchemaCatalog（不区分大小写）
+    '''
+    table_name = sheet_name
+    table_name_index = 1
+    while table_name in tables_name:
+        table_name = f'{sheet_name}_{table_name_index}'
+        table_name_index += 1
+    return table_name
+
+
+def get_tables_name(conn: sqlite3.Connection) -> list[str]:
+    return [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+
+
+def replace_table(conn: sqlite3.Connection, table_name: str, new_table_name: str) -> None:
+    '''
+    删除table_name，把new_table_name重命名为table_name，需要在事务中调用
+    默认的RENAME会检查所有视图，引用table_name的视图（保存为视图）在删除后会让RENAME失败，
+    legacy_alter_table模式不检查也不改写视图，重命名后视图按名称引用新表
+    '''
+    conn.execute('PRAGMA legacy_alter_table=ON')
+    try:
+        conn.execute(f'DROP TABLE [{table_name}]')
+        conn.execute(f'ALTER TABLE [{new_table_name}] RENAME TO [{table_name}]')
+    finally:
+        conn.execute('PRAGMA legacy_alter_table=OFF')
+
+
+def rebuild_table(conn: sqlite3.Connection, table_name: str, columns: list[tuple[str, str]], tables_name) -> None:
+    '''
+    按columns（列名称, 类型）重建表，sqlite不支持修改列的类型，新建一个表把数据复制过去，列的类型亲和性会自动转换数据
+    删除原来的表时索引也会删除，复制后用原来的语句重新创建，需要在事务中调用，不提交事务
+    '''
+    indexes_sql = [row[0] for row in conn.execute("SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+                                                  (table_name,))]
+    tmp_table_name = make_table_name(f'{table_name}_tmp', tables_name)
+    fields = ', '.join([f'"{col}" {col_type}' for col, col_type in columns])
+    conn.execute(f'CREATE TABLE [{tmp_table_name}] ({fields})')
+    conn.execute(f'INSERT INTO [{tmp_table_name}] SELECT * FROM [{table_name}]')
+    replace_table(conn, table_name, tmp_table_name)
+    for sql in indexes_sql:
+        conn.execute(sql)
+
+
+def materialize_query(conn: sqlite3.Connection, sql: str, name: str, as_view: bool = False) -> dict:
+    '''
+    用查询创建新表（CREATE TABLE ... AS）或视图，数据只在sqlite中复制，不经过Python
+    返回 {'name': 名称, 'columns': [(列名称, 类型)], 'rows': 行数（视图为None）, 'view': 是否视图, 'time': 用时}
+    '''
+    t1 = time.time()
+    conn.execute(f'CREATE {"VIEW" if as_view else "TABLE"} [{name}] AS {strip_trailing_semicolons(sql)}')
+    conn.commit()
+    columns = [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info([{name}])')]
+    rows = None if as_view else conn.execute(f'SELECT count(*) FROM [{name}]').fetchone()[0]
+    return {'name': name, 'columns': columns, 'rows': rows, 'view': as_view, 'time': time.time() - t1}
+
+
+def iter_cursor_batches(cursor: sqlite3.Cursor, batch_size: int) -> Iterator[list]:
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def export_batches(conn: sqlite3.Connection, batches: Iterable[list], pname: Path, columns: list[str],
+                   sheet_name: str = None, append: bool = False, table_sheet_name: str = None,
+                   progress: Callable[[int], None] = None, cancelled: Callable[[], bool] = None, tables_name: TableNames = None) -> dict:
+    '''
+    把分批的数据流式写到文件中，内存占用和数据大小无关
+    table_sheet_name不为空时，同时把数据写到conn中的新表（列类型用第一批数据推断），
+    新表名和tables_name中的表名不冲突，tables_name为None时从数据库读取
+    progress(已导出的行数) 每批数据写完后调用，cancelled() 返回True时中止导出并删除写了一半的文件
+    返回 {'rows': 行数, 'table_name': 新表名, 'columns': [(列名称, 类型)], 'time': 用时}
+    '''
+    t1 = time.time()
+    result = {'rows': 0, 'table_name': None, 'columns': None}
+    writer = open_result_writer(pname, columns, sheet_name, append)
+    try:
+        insert_sql = None
+        if table_sheet_name:
+            if tables_name is None:
+                tables_name = TableNames(get_tables_name(conn))
+            conn.execute('BEGIN')
+        for rows in batches:
+            if cancelled and cancelled():
+                raise sqlite3.OperationalError('interrupted')
+            writer.write_rows(rows)
+            if table_sheet_name:
+                if insert_sql is None:
+                    column_types = infer_column_types(len(columns), rows)
+                    result['table_name'], insert_sql = _create_table(conn, table_sheet_name, columns, column_types, tables_name)
+                    result['columns'] = list(zip(columns, column_types))
+                typed = list(convert_rows(column_types, rows))
+                if column_types != [col_type for _, col_type in result['columns']]:
+                    # 第一批之后有不符合类型的值，先放宽字段类型
+                    result['columns'] = list(zip(columns, column_types))
+                    rebuild_table(conn, result['table_name'], result['columns'], tables_name)
+                conn.executemany(insert_sql, typed)
+            result['rows'] += len(rows)
+            if progress:
+                progress(result['rows'])
+        if table_sheet_name and insert_sql is None:
+            # 没有数据时也创建表
+            column_types = ['TEXT'] * len(columns)
+            result['table_name'], _ = _create_table(conn, table_sheet_name, columns, column_types, tables_name)
+            result['columns'] = list(zip(columns, column_types))
+        writer.close()
+        writer = None
+        if table_sheet_name:
+            conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        if writer:
+            writer.abort()
+    result['time'] = time.time() - t1
+    return result
+
+
+def _create_table(conn: sqlite3.Connection, sheet_name: str, columns: list[str], column_types: list[str], tables_name) -> tuple[str, str]:
+    # 创建一个表，先判断表名是否冲突，如果冲突分配一个新名字，返回(表名, insert语句)
+    table_name = make_table_name(sheet_name, tables_name)
+    fields = ', '.join([f'"{col}" {col_type}' for col, col_type in zip(columns, column_types)])
+    conn.execute(f'CREATE TABLE [{table_name}] ({fields})')
+    return table_name, f'insert into [{table_name}] values({",".join(["?"] * len(columns))})'
+
+
+class SqlEngine:
+    '''
+    不依赖Qt的数据库操作：导入表格、执行SQL、导出结果
+    界面(MyApp)和命令行(sql_for_excel_cli.py)共用，数据库默认是共享缓存的内存数据库，
+    profile.disk为True时是关闭后自动删除的临时文件（WAL模式，后台线程写入时也可以查询），
+    后台线程通过connect()用自己的连接访问同一个数据库
+    '''
+    INSERT_CHUNK_SIZE = 5000 # 导入数据时每批插入的行数
+    FETCH_BATCH_SIZE = 5000 # 导出时每批获取的行数
+
+    def __init__(self, db_uri: str = None, profile: StorageProfile = None) -> None:
+        self._profile = profile or StorageProfile()
+        self._db_file = None
+        if db_uri is None and self._profile.disk:
+            fd, db_file = tempfile.mkstemp('.sqlite', 'sql_for_excel_', self._profile.temp_dir)
+            os.close(fd)
+            self._db_file = Path(db_file)
+            db_uri = self._db_file.as_uri()
+        self._db_uri = db_uri or f'file:sql_for_excel_{os.getpid()}_{next(_memory_db_ids)}?mode=memory&cache=shared'
+        self._conn = self.connect()
+        if self._db_file:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._catalog = SchemaCatalog()
+        self._catalog.refresh(self._conn)
+
+    @property
+    def db_uri(self) -> str:
+        return self._db_uri
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self._conn
+
+    @property
+    def catalog(self) -> SchemaCatalog:
+        return self._catalog
+
+    @property
+    def profile(self) -> StorageProfile:
+        return self._profile
+
+    @property
+    def db_file(self) -> Path:
+        '''
+        临时文件的路径，内存数据库时为None
+        '''
+        return self._db_file
+
+    def connect(self) -> sqlite3.Connection:
+        '''
+        打开同一个数据库的新连接，用于后台线程
+        '''
+        conn = sqlite3.connect(self._db_uri, uri=True)
+        apply_storage_pragmas(conn, self._profile)
+        return conn
+
+    def bulk_load(self, conn: sqlite3.Connection = None):
+        '''
+        with engine.bulk_load(conn): 批量导入数据，conn默认是engine自己的连接
+        '''
+        return bulk_load(conn or self._conn, self._profile)
+
+    def close(self) -> None:
+        self._conn.close()
+        if self._db_file is None:
+            return
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                Path(f'{self._db_file}{suffix}').unlink(missing_ok=True)
+            except OSError as ex:
+                # windows下还有连接没有关闭时不能删除
+                logging.warning(f'删除临时文件失败【{self._db_file}{suffix}】 {str(ex)}')
+
+    def get_tables_name(self) -> list[str]:
+        return self._catalog.tables_name()
+
+    def refresh_catalog(self) -> tuple[list[str], list[str]]:
+        '''
+        执行了可能创建、删除表的SQL后重新读取表目录，返回 (新增的表, 删除的表)
+        '''
+        return self._catalog.refresh(self._conn)
+
+    def save_workspace(self, pname: Path, metadata: dict = None) -> dict:
+        '''
+        把整个数据库（表、索引）保存到一个工作区文件，metadata是界面的状态（树、SQL），
+        表目录中的行数和来源也一起保存，返回 {'size': 文件大小, 'time': 用时}
+        '''
+        t1 = time.time()
+        metadata = dict(metadata or {})
+        metadata['tables'] = [{'name': table.name, 'rows_count': table.rows_count, 'loaded': table.loaded,
+                               'source': [str(table.source[0]), table.source[1]] if table.source else None} for table in self._catalog]
+        save_workspace(self._conn, Path(pname), metadata)
+        t2 = time.time()
+        return {'size': Path(pname).stat().st_size, 'time': t2 - t1}
+
+    def open_workspace(self, pname: Path) -> dict:
+        '''
+        打开工作区文件，替换当前数据库中所有的表，表目录按文件重新建立，返回保存时的metadata
+        后台线程不能同时访问数据库
+        '''
+        metadata = load_workspace(self._conn, Path(pname))
+        self._catalog.clear()
+        self._catalog.refresh(self._conn)
+        for table in metadata.get('tables', []):
+            source = (Path(table['source'][0]), table['source'][1]) if table['source'] else None
+            self._catalog.update(table['name'], rows_count=table['rows_count'], source=source, loaded=table.get('loaded', True))
+        return metadata
+
+    def import_sheet(self, sheet_name: str, columns: list[str], rows: Iterable[tuple], source: tuple[Path, str] = None) -> ImportedTable:
+        '''
+        创建表并导入数据，rows可以是任意的行迭代器，按INSERT_CHUNK_SIZE分批插入，内存占用和表格大小无关
+        每一列的类型根据前面的数据推断，不提交事务，source: (Excel文件路径, 表格名称)
+        '''
+        column_types, rows = typed_rows(columns, rows)
+        table_name, insert_sql = _create_table(self._conn, sheet_name, columns, column_types, self._catalog)
+        self._catalog.add(table_name, list(zip(columns, column_types)), source=source)
+        table_types = list(column_types)
+        rows_count = 0
+        while True:
+            chunk = list(itertools.islice(rows, self.INSERT_CHUNK_SIZE))
+            if not chunk:
+                break
+            if column_types != table_types:
+                # 推断类型的样本之后有不符合类型的值，先放宽字段类型
+                table_types = list(column_types)
+                rebuild_table(self._conn, table_name, list(zip(columns, column_types)), self._catalog)
+                self._catalog.update(table_name, columns=list(zip(columns, column_types)))
+            self._conn.executemany(insert_sql, chunk)
+            rows_count += len(chunk)
+        self._catalog.update(table_name, rows_count=rows_count)
+        return ImportedTable(sheet_name, table_name, list(zip(columns, column_types)), rows_count)
+
+    def import_excel(self, pname: Path) -> list[ImportedTable]:
+        '''
+        在当前线程中逐个表格导入Excel文件，整个文件在一个事务中完成
+        '''
+        tables = []
+        with self.bulk_load():
+            self._conn.execute('BEGIN')
+            try:
+                for sheet in iter_excel_sheets(pname):
+                    tables.append(self.import_sheet(sheet.name, sheet.columns, sheet.rows, (Path(pname), sheet.name)))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                for table in tables:
+                    self._catalog.remove(table.table_name)
+                raise
+        return tables
+
+    def drop_table(self, table_name: str) -> None:
+        table = self._catalog.get(table_name)
+        self._conn.execute(f'DROP {"VIEW" if table and table.is_view else "TABLE"} [{table_name}]')
+        self._catalog.remove(table_name)
+
+    def change_column_type(self, table_name: str, column_name: str, column_type: str) -> None:
+        '''
+        修改列的类型，重建表时表上的索引保留
+        '''
+        table_info = self._conn.execute(f'PRAGMA table_info([{table_name}])').fetchall()
+        columns = [(row[1], column_type if row[1] == column_name else row[2]) for row in table_info]
+        self._conn.execute('BEGIN')
+        try:
+            rebuild_table(self._conn, table_name, columns, self._catalog)
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        self._catalog.update(table_name, columns=columns)
+
+    def execute_script(self, sql: str) -> sqlite3.Cursor:
+        '''
+        依次执行多条SQL，返回最后一条语句的cursor，没有语句时返回None
+        执行了没有查询结果的语句（可能创建、删除了表）时重新读取表目录
+        '''
+        cursor = None
+        changed = False
+        try:
+            for statement in split_statements(sql):
+                cursor = self._conn.execute(statement)
+                changed = changed or not cursor.description
+            if self._conn.in_transaction:
+                self._conn.commit()
+        finally:
+            if changed:
+                self.refresh_catalog()
+        return cursor
+
+    def export_cursor(self, cursor: sqlite3.Cursor, pname: Path, sheet_name: str = None, append: bool = False,
+                      progress: Callable[[int], None] = None) -> dict:
+        '''
+        把查询结果分批导出到文件，返回值同export_batches
+        '''
+        if not cursor.description:
+            raise ValueError('SQL没有返回查询结果！')
+        columns = [desc[0] for desc in cursor.description]
+        return export_batches(self._conn, iter_cursor_batches(cursor, self.FETCH_BATCH_SIZE), pname, columns,
+                              sheet_name, append, progress=progress)
@@ -10,18 +10,39 @@
 
 import sys
 import os
-import pandas
 from pathlib import Path
 import sqlite3
 import logging
 import time
-from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog, QTreeWidgetItem, QTableWidgetItem, QMessageBox, QMenu, QAction
-from PyQt5.QtCore import Qt
+import multiprocessing
+from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog, QTreeWidgetItem, QHeaderView, QMessageBox, QMenu, QAction, QProgressBar, QInputDialog, QTableWidgetItem
+from PyQt5.QtCore import Qt, QTimer, QFileSystemWatcher
 from PyQt5.QtGui import QCursor, QIcon, QDragEnterEvent, QDropEvent
 from collections import namedtuple
 from enum import Enum
 from main_window import Ui_MainWindow
 from sql_highlighter import SqlHighlighter
+from sql_completer import SqlCompleter
+from completion_index import CompletionIndex
+from sql_worker import SqlWorker, IndexWorker, ProfileWorker, MaterializeWorker
+from sql_script import StatementResult, ScriptRunner
+from index_advisor import advise_indexes, create_index, get_indexes
+from excel_import_worker import ExcelImportWorker, ExcelReloadWorker, SheetLoadWorker
+from excel_reader import IMPORT_SUFFIXES
+from column_types import COLUMN_TYPES
+from import_cache import ImportCache
+from query_result_model import QueryResultModel
+from export_worker import ExportWorker
+from result_writers import EXPORT_SUFFIXES
+from sql_engine import SqlEngine, storage_profile_from_env, make_table_name
+from query_profiler import ProfileHistory, new_profile, process_memory_mb
+from result_cache import ResultCache, referenced_tables
+from sql_tokenizer import significant_tokens, split_statements, is_keyword
+from result_store import ResultStore, ResultChunk, result_memory_limit_from_env
+from workbook_fingerprint import fingerprint_to_json, fingerprint_from_json
+from workspace_store import WORKSPACE_SUFFIX, default_workspace_path
+from schema_catalog import TableInfo
+from column_profile import format_profile
 
 # 设置日志参数
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -31,28 +52,92 @@ class TreeNodeType(Enum):
     File = 0 # 文件
     Sheet = 1 # 表格
     Field = 2 # 字段
+    Results = 3 # 查询结果保存的表和视图，SQL创建的表
 
 # 挂在树节点中的自定义内容
 # node_type: TreeNodeType
-TreeNodeData = namedtuple('TreeNodeData', ['node_type', 'value'])
+# info: 文件节点是导入时的文件指纹，重新加载时使用
+TreeNodeData = namedtuple('TreeNodeData', ['node_type', 'value', 'info'], defaults=[None])
 
 class MyApp(QMainWindow, Ui_MainWindow):
+    EXCEL_SUFFIXES = IMPORT_SUFFIXES # 导入支持的文件类型，csv/tsv文件和Excel文件一样导入
+    RELOAD_DELAY_MS = 1000 # 文件变化后等待的时间，Excel保存文件时会连续触发多次变化
+    PREFETCH_DELAY_MS = 2000 # 空闲多久后在后台预加载延迟加载的表
+    LAZY_TABLE_TOOLTIP = '数据还没有加载，SQL用到、查看表格数据或者空闲时自动加载'
+    PREVIEW_ROWS = 1000 # 预览表格数据时显示的行数
+
     def __init__(self) -> None:
         super(__class__, self).__init__()
         self.setupUi(self)
         self._highlighter = SqlHighlighter(self.plainTextSql)
         self._base_path = Path(__file__).parent
         self._icons_path = self._base_path / 'icons'
+        # 自动补全的关键词、表名和列名，表变化时和高亮的表名一起更新
+        self._completion_index = CompletionIndex()
+        self._completer = SqlCompleter(self.plainTextSql, self._completion_index, self._icons_path)
         self._setup_ui_data()
-        # 创建数据库
-        self._conn = sqlite3.connect(':memory:')
-        # self._conn = sqlite3.connect(self._base_path / 'test.db') # 调试先用本地数据库好查看 debug
-        self._cursor = self._conn.cursor()
+        # 创建数据库，默认用共享缓存的内存数据库，环境变量SQL_FOR_EXCEL_WORKSPACE=disk时用临时文件，
+        # 后台执行SQL的线程用自己的连接访问同一个数据库
+        self._engine = SqlEngine(profile=storage_profile_from_env())
+        self._conn = self._engine.conn
         self._query_columns = None # 保存当前的查询结果的列，用于导出结果
-        self._query_result = None # 保存当前的查询结果，用于导出结果
+        self._query_result: ResultStore = None # 保存当前的查询结果，用于导出结果
+        self._result_memory_limit = result_memory_limit_from_env() # 查询结果超过这个大小后写到临时表
+        self._query_sql = None # 当前查询结果对应的SQL，结果没有完整获取时导出会重新执行
+        self._sql_worker: SqlWorker = None # 正在后台执行的SQL
+        self._import_worker: ExcelImportWorker = None # 正在后台导入的Excel文件
+        self._export_worker: ExportWorker = None # 正在后台导出的查询结果
+        self._profile_worker: ProfileWorker = None # 正在后台统计字段信息的表
+        self._results_node: QTreeWidgetItem = None # 查询结果保存的表和视图的父节点，用到时才创建
+        self._import_cache = ImportCache() # 导入缓存，再次导入相同的文件时不需要重新解析
+        self._query_times = {} # 当前查询各阶段的用时
+        self._profile_history = ProfileHistory() # 最近执行的SQL的性能记录
+        self._result_cache = ResultCache() # 查询结果缓存
+        self._query_cache_key = None # 正在执行的SQL的缓存key，不能缓存时为None
+        # 自动重新加载变化的Excel文件
+        self._changed_files = set() # 等待重新加载的文件
+        self._file_watcher = QFileSystemWatcher(self)
+        self._file_watcher.fileChanged.connect(self._file_watcher_fileChanged)
+        self._reload_timer = QTimer(self)
+        self._reload_timer.setSingleShot(True)
+        self._reload_timer.timeout.connect(self._reload_changed_files)
+        # 延迟加载的表
+        self._pending_actions = [] # 等待当前的导入线程结束后执行的操作
+        self._load_failed = set() # 加载失败的表，预加载时跳过
+        self._prefetch_timer = QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.timeout.connect(self._prefetch_lazy_tables)
+        if self._engine.db_file:
+            self.statusbar.showMessage(f'工作区使用临时文件【{self._engine.db_file}】，数据量可以超过内存大小')
+        # 上次退出时自动保存了工作区，启动后恢复
+        self._autosave_pname = default_workspace_path()
+        if self._autosave_pname.is_file():
+            self.actionAutosaveWorkspace.setChecked(True)
+            QTimer.singleShot(0, lambda: self._open_workspace(self._autosave_pname))
     
     def __del__(self) -> None:
-        self._conn.close()
+        self._engine.close()
+
+    def closeEvent(self, e) -> None:
+        '''关闭窗口前先停止后台正在执行的SQL'''
+        if self._is_sql_running():
+            self._sql_worker.cancel()
+            self._sql_worker.wait()
+        if self._is_importing():
+            self._import_worker.cancel()
+            self._import_worker.wait()
+        if self._is_exporting():
+            self._export_worker.cancel()
+            self._export_worker.wait()
+        self._stop_profile_worker()
+        if self.actionAutosaveWorkspace.isChecked():
+            self._save_workspace(self._autosave_pname)
+        else:
+            try:
+                self._autosave_pname.unlink(missing_ok=True)
+            except OSError as ex:
+                logging.warning(f'删除自动保存的工作区失败【{self._autosave_pname}】 {str(ex)}')
+        super(__class__, self).closeEvent(e)
     
     def _setup_ui_data(self) -> None:
         # 窗口图标
@@ -65,18 +150,46 @@ class MyApp(QMainWindow, Ui_MainWindow):
         self._contextMenu = {
             TreeNodeType.File: [
                 ('在文件夹中查看文件', self._treeWidgetItem_popContextMenu_ShowInDir),
+                ('重新加载此文件', self._treeWidgetItem_popContextMenu_ReloadFile),
                 ('从列表中移除此文件', self._treeWidgetItem_popContextMenu_RemoveFileFromTree),
             ],
             TreeNodeType.Sheet: [
                 ('[表名] 插入到SQL', self._treeWidgetItem_popContextMenu_InsertSheetName),
                 ('查看表格数据', self._treeWidgetItem_popContextMenu_ShowSheetData),
+                ('预览表格数据并统计字段', self._treeWidgetItem_popContextMenu_PreviewSheetData),
                 ('从列表中移除此表', self._treeWidgetItem_popContextMenu_RemoveSheetFromTree),
             ],
             TreeNodeType.Field: [
                 ('"字段名称" 插入到SQL', self._treeWidgetItem_popContextMenu_InsertFieldName),
                 ('"字段名称", 插入到SQL', self._treeWidgetItem_popContextMenu_InsertFieldNameWithComma),
+                ('修改字段类型', self._treeWidgetItem_popContextMenu_ChangeFieldType),
+                ('创建索引', self._treeWidgetItem_popContextMenu_CreateIndex),
             ],
+            TreeNodeType.Results: [],
         }
+        # 执行结果，只绘制可见的行，大结果集也不会卡住界面
+        self._result_model = QueryResultModel(self)
+        self.tableViewSqlResult.setModel(self._result_model)
+        self.tableViewSqlResult.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.tableViewSqlResult.verticalHeader().setDefaultSectionSize(self.tableViewSqlResult.fontMetrics().height() + 6)
+        # 性能分析
+        self._profile_columns = [('time', '时间'), ('sql', 'SQL'), ('execute', '执行(s)'), ('fetch', '获取(s)'), ('display', '显示(s)'),
+            ('rows_returned', '返回行数'), ('rows_scanned', '扫描行数'), ('vm_steps', '指令数'), ('memory_delta_mb', '内存(MB)')]
+        self.tableWidgetQueryHistory.setColumnCount(len(self._profile_columns))
+        self.tableWidgetQueryHistory.setHorizontalHeaderLabels([label for _, label in self._profile_columns])
+        self.tableWidgetQueryHistory.itemSelectionChanged.connect(self._tableWidgetQueryHistory_itemSelectionChanged)
+        # 导入进度
+        self._progressBarImport = QProgressBar(self.statusbar)
+        self._progressBarImport.setRange(0, 100)
+        self._progressBarImport.setMaximumWidth(200)
+        self._progressBarImport.setVisible(False)
+        self.statusbar.addPermanentWidget(self._progressBarImport)
+        # 导出进度
+        self._progressBarExport = QProgressBar(self.statusbar)
+        self._progressBarExport.setRange(0, 100)
+        self._progressBarExport.setMaximumWidth(200)
+        self._progressBarExport.setVisible(False)
+        self.statusbar.addPermanentWidget(self._progressBarExport)
 
     def _treeWidgetItem_popContextMenu_ShowInDir(self, currentItem) -> None:
             '''在文件夹中查看文件'''
@@ -84,12 +197,17 @@ class MyApp(QMainWindow, Ui_MainWindow):
             self._show_file_in_folder(pname)
 
     def _remove_excel_node(self, currentItem) -> None:
-        for index in range(currentItem.childCount()):
+        # 从后往前删除，删除最后一个表时会隐藏文件节点
+        for index in reversed(range(currentItem.childCount())):
             child = currentItem.child(index)
             self._remove_sheet_node(child)
 
     def _treeWidgetItem_popContextMenu_RemoveFileFromTree(self, currentItem) -> None:
         '''从列表中移除此文件'''
+        if self._after_prefetch(lambda: self._treeWidgetItem_popContextMenu_RemoveFileFromTree(currentItem)):
+            return
+        if self._after_import(lambda: self._treeWidgetItem_popContextMenu_RemoveFileFromTree(currentItem), '移除文件'):
+            return
         file_name = currentItem.data(0, Qt.UserRole).value
         self._remove_excel_node(currentItem)
         self._update_tables_name()
@@ -102,18 +220,53 @@ class MyApp(QMainWindow, Ui_MainWindow):
     
     def _treeWidgetItem_popContextMenu_ShowSheetData(self, currentItem) -> None:
         '''查看表格数据'''
-        sheet_name = currentItem.data(0, Qt.UserRole).value
+        self._show_table_data(currentItem.text(0))
+
+    def _treeWidgetItem_popContextMenu_PreviewSheetData(self, currentItem) -> None:
+        '''预览表格数据并统计字段'''
+        self._show_table_data(currentItem.text(0), preview=True)
+
+    def _show_table_data(self, table_name: str, preview: bool = False) -> None:
+        '''
+        查看表格数据，延迟加载的表先加载数据
+        preview为True时只显示前PREVIEW_ROWS行，同时在后台统计每个字段的信息，显示在字段节点的提示中
+        '''
+        if self._is_sql_running():
+            self.statusbar.showMessage('SQL正在执行中，请等待执行完成或者取消执行！')
+            return
+        if self._after_prefetch(lambda: self._show_table_data(table_name, preview), [table_name]):
+            return
+        if self._after_import(lambda: self._show_table_data(table_name, preview), '查看表格数据'):
+            return
+        table = self._engine.catalog.get(table_name)
+        if table is None:
+            return
+        if not table.loaded:
+            self._load_lazy_tables([table], lambda: self._show_table_data(table_name, preview))
+            return
+        sheet_name = f'[{table.name}]'
         sql = f'select * from {sheet_name}'
-        self._cursor.execute(sql)
-        self._query_columns = [desc[0] for desc in self._cursor.description]
-        self._query_result = self._cursor.fetchall()
-        self._show_query_result()
-        self.statusbar.showMessage(f'查看表格数据：{sheet_name}')
+        if preview:
+            sql += f' limit {self.PREVIEW_ROWS}'
+        cursor = self._conn.cursor()
+        cursor.execute(sql)
+        self._query_columns = [desc[0] for desc in cursor.description]
+        self._query_result = ResultStore(self._query_columns, self._result_memory_limit)
+        self._query_sql = sql
+        self._show_query_result(cursor)
+        rows_info = f'，共[{table.rows_count}行]' if table and table.rows_count is not None else ''
+        if not preview:
+            self.statusbar.showMessage(f'查看表格数据：{sheet_name}{rows_info}')
+            return
+        self._start_profile_worker(table.name)
+        self.statusbar.showMessage(f'预览表格数据：{sheet_name}前[{self.PREVIEW_ROWS}]行{rows_info}，正在后台统计字段信息...')
     
     def _remove_sheet_node(self, currentItem) -> None:
-        sheet_name = currentItem.data(0, Qt.UserRole).value
-        sql = f'drop table {sheet_name}'
-        self._cursor.execute(sql)
+        # 结果表格还在从cursor分批获取数据时不能drop表，先把数据取完
+        self._fetch_all_query_result()
+        self._stop_profile_worker()
+        self._engine.drop_table(currentItem.text(0))
+        self._result_cache.invalidate(currentItem.text(0))
         # 从树上删除
         parentItem = currentItem.parent()
         parentItem.removeChild(currentItem)
@@ -127,6 +280,10 @@ class MyApp(QMainWindow, Ui_MainWindow):
 
     def _treeWidgetItem_popContextMenu_RemoveSheetFromTree(self, currentItem) -> None:
         '''从列表中移除此表'''
+        if self._after_prefetch(lambda: self._treeWidgetItem_popContextMenu_RemoveSheetFromTree(currentItem)):
+            return
+        if self._after_import(lambda: self._treeWidgetItem_popContextMenu_RemoveSheetFromTree(currentItem), '移除表'):
+            return
         sheet_name = currentItem.data(0, Qt.UserRole).value
         self._remove_sheet_node(currentItem)
         self._update_tables_name()
@@ -142,6 +299,134 @@ class MyApp(QMainWindow, Ui_MainWindow):
         field_name = currentItem.data(0, Qt.UserRole).value
         self.plainTextSql.insertPlainText(f' {field_name}, ')
 
+    def _change_column_type(self, table_name: str, column_name: str, column_type: str) -> None:
+        # 复制表之前先把cursor中的数据取完
+        self._fetch_all_query_result()
+        self._stop_profile_worker()
+        self._engine.change_column_type(table_name, column_name, column_type)
+        self._result_cache.invalidate(table_name)
+
+    def _treeWidgetItem_popContextMenu_ChangeFieldType(self, currentItem) -> None:
+        '''修改字段类型'''
+        if self._after_prefetch(lambda: self._treeWidgetItem_popContextMenu_ChangeFieldType(currentItem)):
+            return
+        if self._after_import(lambda: self._treeWidgetItem_popContextMenu_ChangeFieldType(currentItem), '修改字段类型'):
+            return
+        table_name = currentItem.parent().text(0)
+        if self._is_view(table_name):
+            self.statusbar.showMessage(f'[{table_name}]是视图，不能修改字段类型！')
+            return
+        field_name = currentItem.text(0)
+        current_type = currentItem.text(1)
+        current_index = COLUMN_TYPES.index(current_type) if current_type in COLUMN_TYPES else 0
+        column_type, ok = QInputDialog.getItem(self, '修改字段类型', f'[{table_name}]."{field_name}" 的类型：', COLUMN_TYPES, current_index, False)
+        if not ok or column_type == current_type:
+            return
+        self._change_column_type(table_name, field_name, column_type)
+        currentItem.setText(1, column_type)
+        self.statusbar.showMessage(f'修改字段类型成功：[{table_name}]."{field_name}" {column_type}')
+
+    def _is_view(self, table_name: str) -> bool:
+        table = self._engine.catalog.get(table_name)
+        return table is not None and table.is_view
+
+    def _find_sheet_tree_node(self, table_name: str) -> QTreeWidgetItem:
+        table = self._engine.catalog.get(table_name)
+        return table.item if table else None
+
+    def _mark_indexed_fields(self, table_name: str, columns: list[str], index_name: str) -> None:
+        '''
+        在树上标记已经创建了索引的字段
+        '''
+        sheet_node = self._find_sheet_tree_node(table_name)
+        if not sheet_node:
+            return
+        for field_index in range(sheet_node.childCount()):
+            field_node = sheet_node.child(field_index)
+            if field_node.text(0) in columns:
+                self._set_field_tooltip(field_node, index_info=f'已创建索引 [{index_name}]')
+
+    def _set_field_tooltip(self, field_node: QTreeWidgetItem, index_info: str = None, profile_info: str = None) -> None:
+        '''
+        字段节点的提示由索引信息和统计信息组成，只更新其中一部分时保留另一部分
+        '''
+        old_index_info, old_profile_info = field_node.data(0, Qt.UserRole + 1) or ('', '')
+        index_info = old_index_info if index_info is None else index_info
+        profile_info = old_profile_info if profile_info is None else profile_info
+        field_node.setData(0, Qt.UserRole + 1, (index_info, profile_info))
+        field_node.setToolTip(0, '\n'.join([info for info in (index_info, profile_info) if info]))
+
+    def _is_profiling(self) -> bool:
+        return self._profile_worker is not None and self._profile_worker.isRunning()
+
+    def _start_profile_worker(self, table_name: str) -> None:
+        '''
+        在后台统计表的字段信息，正在统计其他表时取消，不需要等待
+        '''
+        if self._is_profiling():
+            self._profile_worker.cancel()
+        worker = ProfileWorker(self._engine, table_name, self)
+        self._profile_worker = worker
+        worker.profile_finished.connect(self._profile_worker_profile_finished)
+        worker.profile_failed.connect(lambda error: self._profile_worker_profile_failed(error, worker))
+        worker.finished.connect(lambda: self._profile_worker_finished(worker))
+        worker.start()
+
+    def _stop_profile_worker(self) -> None:
+        '''
+        修改数据库之前停止统计，共享缓存的内存数据库在读取期间不能创建、删除表和索引，也不能修改正在读取的表
+        '''
+        if not self._is_profiling():
+            return
+        self._profile_worker.cancel()
+        self._profile_worker.wait()
+
+    def _profile_worker_profile_finished(self, result: dict) -> None:
+        table = self._engine.catalog.get(result['table'])
+        if table is None or table.item is None:
+            return
+        profiles = {profile.name: profile for profile in result['profiles']}
+        for field_index in range(table.item.childCount()):
+            field_node = table.item.child(field_index)
+            if field_node.text(0) in profiles:
+                self._set_field_tooltip(field_node, profile_info=format_profile(profiles[field_node.text(0)]))
+        rows_count = result['profiles'][0].rows if result['profiles'] else 0
+        if table.rows_count is None:
+            self._engine.catalog.update(table.name, rows_count=rows_count)
+        self.statusbar.showMessage(f'统计字段信息成功！[{table.name}]共[{len(profiles)}]个字段[{rows_count}行]，'
+                                   f'用时[{result["time"]:.2f}s]，鼠标停在字段上查看')
+
+    def _profile_worker_profile_failed(self, error: str, worker: ProfileWorker) -> None:
+        if worker.cancelled:
+            logging.info(f'取消统计字段信息：[{worker.table_name}]')
+            return
+        error_info = f'统计字段信息失败！[{worker.table_name}] {error}'
+        logging.error(error_info)
+        self.statusbar.showMessage(error_info)
+
+    def _profile_worker_finished(self, worker: ProfileWorker) -> None:
+        worker.deleteLater()
+        if self._profile_worker is worker:
+            self._profile_worker = None
+
+    def _treeWidgetItem_popContextMenu_CreateIndex(self, currentItem) -> None:
+        '''创建索引'''
+        if self._after_prefetch(lambda: self._treeWidgetItem_popContextMenu_CreateIndex(currentItem)):
+            return
+        if self._after_import(lambda: self._treeWidgetItem_popContextMenu_CreateIndex(currentItem), '创建索引'):
+            return
+        table_name = currentItem.parent().text(0)
+        if self._is_view(table_name):
+            self.statusbar.showMessage(f'[{table_name}]是视图，不能创建索引！')
+            return
+        field_name = currentItem.text(0)
+        self._stop_profile_worker()
+        t1 = time.time()
+        name = create_index(self._conn, table_name, [field_name])
+        t2 = time.time()
+        self._mark_indexed_fields(table_name, [field_name], name)
+        self.statusbar.showMessage(f'创建索引成功：[{name}]，用时[{(t2 - t1):.2f}s]')
+
     def _treeWidgetItem_popContextMenu(self, pos) -> None:
         '''
         右键菜单响应
@@ -176,85 +461,512 @@ class MyApp(QMainWindow, Ui_MainWindow):
                 logging.error(error_info)
                 self.statusbar.showMessage(error_info)
     
-    def _add_excel_node(self, pname: Path) -> QTreeWidgetItem:
+    def _add_excel_node(self, pname: Path, fingerprint=None) -> QTreeWidgetItem:
         new_file_node = QTreeWidgetItem(self.treeWidgetExcelsAndSheets)
         new_file_node.setIcon(0, QIcon(str(self._icons_path / 'excel.svg')))
-        new_file_node.setData(0, Qt.UserRole, TreeNodeData(TreeNodeType.File, str(pname)))
+        new_file_node.setData(0, Qt.UserRole, TreeNodeData(TreeNodeType.File, str(pname), fingerprint))
         new_file_node.setText(0, pname.stem)
         new_file_node.setText(1, pname.suffix)
         new_file_node.setExpanded(True)
+        self._file_watcher.addPath(str(pname))
         return new_file_node
     
-    def _get_db_tables_name(self) -> list[str]:
-        tables_name = []
-        self._cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        query_result = self._cursor.fetchall()
-        if query_result:
-            tables_name = [row[0] for row in query_result]
-        return tables_name
-
     def _update_tables_name(self) -> None:
-        tables_name = self._get_db_tables_name()
+        tables_name = self._engine.catalog.tables_name()
         self._highlighter.update_tables_name(tables_name)
+        # 只增删变化了的表的表名和列名
+        self._completion_index.update_tables(self._engine.catalog.table_columns())
+
+    def _refresh_catalog(self) -> None:
+        '''
+        执行了可能创建、删除表的SQL后重新读取表目录，在SQL中删除了的表也从树上删除
+        '''
+        removed_items = [(table.name, table.item) for table in self._engine.catalog]
+        added, removed = self._engine.refresh_catalog()
+        for table_name, item in removed_items:
+            if table_name in removed and item is not None:
+                item.parent().removeChild(item)
+        # SQL创建的表和视图挂在“查询结果”节点下
+        for table_name in added:
+            self._add_sheet_tree_node(table_name, self._get_results_node(), self._engine.catalog.get(table_name).columns)
+        self._result_cache.invalidate(*added, *removed)
+        self._update_tables_name()
 
-    def _add_sheet_node(self, sheet_name, parent, df: pandas.DataFrame) -> None:
-        # 创建一个表，先判断表名是否冲突，如果冲突分配一个新名字
-        table_name = sheet_name
-        table_name_index = 1
-        db_tables_name = self._get_db_tables_name()
-        while table_name in db_tables_name:
-            table_name = f'{table_name}_{table_name_index}'
-        # 插入到树上
+    def _add_sheet_tree_node(self, table_name: str, parent, columns: list[tuple[str, str]]) -> QTreeWidgetItem:
+        '''
+        在树上增加表和字段节点，columns: [(列名称, 类型)]，表已经在表目录中
+        '''
         new_sheet_node = QTreeWidgetItem(parent)
         new_sheet_node.setIcon(0, QIcon(str(self._icons_path / 'table.svg')))
         new_sheet_node.setData(0, Qt.UserRole, TreeNodeData(TreeNodeType.Sheet, f'[{table_name}]'))
         new_sheet_node.setText(0, table_name)
         new_sheet_node.setExpanded(False)
-        # df = dfs[sheet]
-        # logging.info(df.dtypes)
-        # logging.info(list(df.dtypes))
-        db_colunms = []
-        for col in df.columns:
-            new_field_node = QTreeWidgetItem(new_sheet_node)
+        self._add_field_tree_nodes(new_sheet_node, columns)
+        table = self._engine.catalog.update(table_name, item=new_sheet_node)
+        if table and not table.loaded:
+            new_sheet_node.setToolTip(0, self.LAZY_TABLE_TOOLTIP)
+        if table and table.is_view:
+            new_sheet_node.setText(1, 'VIEW')
+        return new_sheet_node
+
+    def _get_results_node(self) -> QTreeWidgetItem:
+        '''
+        查询结果保存的表和视图、SQL创建的表都挂在这个节点下，没有时创建
+        '''
+        if self._results_node is None:
+            self._results_node = QTreeWidgetItem(self.treeWidgetExcelsAndSheets)
+            self._results_node.setIcon(0, QIcon(str(self._icons_path / 'database.svg')))
+            self._results_node.setData(0, Qt.UserRole, TreeNodeData(TreeNodeType.Results, ''))
+            self._results_node.setText(0, '查询结果')
+            self._results_node.setExpanded(True)
+        # 删除了所有的表后是隐藏的
+        self._results_node.setHidden(False)
+        return self._results_node
+
+    def _add_field_tree_nodes(self, sheet_node: QTreeWidgetItem, columns: list[tuple[str, str]]) -> None:
+        for col, col_dtype in columns:
+            new_field_node = QTreeWidgetItem(sheet_node)
             new_field_node.setIcon(0, QIcon(str(self._icons_path / 'field.svg')))
             new_field_node.setData(0, Qt.UserRole, TreeNodeData(TreeNodeType.Field, f'"{col}"'))
-            # new_field_node.setText(0, f'{col}: {df.dtypes[col]}')
-            col_dtype = 'TEXT'
             new_field_node.setText(0, col)
             new_field_node.setText(1, col_dtype)
-            db_colunms.append([f'"{col}"', col_dtype])
-        # 拼装sql 创建表
-        fields = ', '.join([f'{db_col[0]} {db_col[1]}' for db_col in db_colunms])
-        sql = f'''CREATE TABLE [{table_name}] ({fields})'''
-        self._cursor.execute(sql)
-        # 把数据加进去
-        sql = f'''insert into [{table_name}] values({','.join(['?'] * len(db_colunms))})'''
-        self._cursor.executemany(sql, df.values)
 
-    def pushButtonImportFile_clicked(self):
-        fname, *_ = QFileDialog.getOpenFileName(self, '导入Excel', '', 'Excel Files (*.xlsx *.xls)')
-        if fname:
+    def _is_importing(self) -> bool:
+        return self._import_worker is not None and self._import_worker.isRunning()
+
+    def _import_excel_files(self, pnames: list[Path]) -> None:
+        '''
+        在后台导入多个Excel文件，每个表格用进程池中的一个进程解析
+        '''
+        if self._after_prefetch(lambda: self._import_excel_files(pnames)):
+            return
+        if self._is_importing():
+            self.statusbar.showMessage('正在导入Excel文件，请等待导入完成！')
+            return
+        if self._is_sql_running() or self._is_exporting():
+            self.statusbar.showMessage('SQL正在执行或者正在导出，请等待完成后再导入Excel文件！')
+            return
+        # 导入在一个长事务中创建表，其他连接不能同时读取数据库，先把结果表格中cursor的数据取完
+        self._fetch_all_query_result()
+        self._stop_profile_worker()
+        self._import_t1 = time.time()
+        self._import_worker = ExcelImportWorker(self._engine, pnames, self._import_cache, self.checkBoxBypassCache.isChecked(),
+                                                self.checkBoxLazyImport.isChecked(), self)
+        self._import_worker.import_progress.connect(self._import_worker_progress)
+        self._import_worker.import_finished.connect(self._import_worker_import_finished)
+        self._import_worker.import_failed.connect(self._import_worker_import_failed)
+        self._import_worker.finished.connect(self._import_worker_finished)
+        self.pushButtonImportFile.setEnabled(False)
+        self._progressBarImport.setValue(0)
+        self._progressBarImport.setVisible(True)
+        self.statusbar.showMessage(f'正在导入[{len(pnames)}]个Excel文件...')
+        self._import_worker.start()
+
+    def _import_worker_progress(self, progress: dict) -> None:
+        self._progressBarImport.setValue(progress['percent'])
+        self.statusbar.showMessage(f'正在导入Excel文件：已完成[{progress["finished_sheets"]}/{progress["total_sheets"]}]个表，'
+            f'已导入[{progress["rows"]}行]，[{progress["rows_per_second"]:.0f}行/s]')
+
+    def _import_worker_import_finished(self, imported: list, errors: list[str]) -> None:
+        # 加到树上，同一个文件的表格挂在同一个文件节点下
+        file_nodes = {}
+        cached_files = set()
+        lazy_count = 0
+        total_rows = 0
+        fingerprints = self._import_worker.workbook_fingerprints
+        for sheet in imported:
+            if sheet.pname not in file_nodes:
+                file_nodes[sheet.pname] = self._add_excel_node(sheet.pname, fingerprints.get(sheet.pname))
+            self._engine.catalog.add(sheet.table_name, sheet.columns, sheet.rows_count, (sheet.pname, sheet.sheet_name), loaded=not sheet.lazy)
+            self._add_sheet_tree_node(sheet.table_name, file_nodes[sheet.pname], sheet.columns)
+            total_rows += sheet.rows_count or 0
+            lazy_count += sheet.lazy
+            if sheet.from_cache:
+                cached_files.add(sheet.pname)
+        # 同名的表删除后重新导入时，之前的查询结果不能再用
+        self._result_cache.invalidate(*[sheet.table_name for sheet in imported])
+        self._update_tables_name()
+        t2 = time.time()
+        info = f'导入[{len(file_nodes)}]个Excel文件成功！共[{len(imported)}]个表[{total_rows}行]，用时[{(t2 - self._import_t1):.2f}s]'
+        if cached_files:
+            info += f'，其中[{len(cached_files)}]个文件使用了导入缓存'
+        if lazy_count:
+            info += f'，[{lazy_count}]个表延迟加载（用到时再读取数据）'
+        if errors:
+            info += f'，失败[{len(errors)}]个：' + '；'.join(errors)
+            logging.error(info)
+        self.statusbar.showMessage(info)
+
+    def _import_worker_import_failed(self, error: str) -> None:
+        error_info = f'导入Excel文件失败！ {error}'
+        logging.error(error_info)
+        self.statusbar.showMessage(error_info)
+
+    def _import_worker_finished(self) -> None:
+        self._import_worker.deleteLater()
+        self._import_worker = None
+        self._progressBarImport.setVisible(False)
+        self.pushButtonImportFile.setEnabled(True)
+        if self._changed_files:
+            # 导入期间变化的文件
+            self._reload_timer.start(self.RELOAD_DELAY_MS)
+        # 排队的操作可能又启动了导入线程，剩下的等这个线程结束后再执行
+        while self._pending_actions and not self._is_importing():
+            action = self._pending_actions.pop(0)
             try:
-                t1 = time.time()
-                pname = Path(fname)
-                dfs = pandas.read_excel(pname, sheet_name=None, dtype=str)
-                sheet_names = list(dfs.keys())
-                # 加到树上
-                new_field_node = self._add_excel_node(pname)
-                for sheet in sheet_names:
-                    self._add_sheet_node(sheet, new_field_node, dfs[sheet])
-                self._conn.commit()
-                self._update_tables_name()
-                t2 = time.time()
-                self.statusbar.showMessage(f'导入Excel文件【{pname}】成功！用时[{(t2 - t1):.2f}s]')
+                action()
             except Exception as ex:
-                error_info = f'导入Excel文件【{pname}】失败！ {str(ex)}'
+                error_info = f'执行排队的操作发生异常！{str(ex)}'
                 logging.error(error_info)
                 self.statusbar.showMessage(error_info)
+        if not self._is_importing():
+            self._prefetch_timer.start(self.PREFETCH_DELAY_MS)
+
+    def _is_prefetching(self) -> bool:
+        return self._is_importing() and isinstance(self._import_worker, SheetLoadWorker) and self._import_worker.prefetch
+
+    def _after_prefetch(self, action, keep_tables: list[str] = ()) -> bool:
+        '''
+        后台正在预加载表时，action排队到预加载结束后执行，返回是否已经排队
+        预加载的不是action需要的表（keep_tables）时取消预加载，用户的操作不用等待
+        '''
+        if not self._is_prefetching():
+            return False
+        self._pending_actions.append(action)
+        if not set(self._import_worker.tables_name) & set(keep_tables):
+            self._import_worker.cancel()
+        self.statusbar.showMessage('正在结束后台加载表格数据，完成后继续...')
+        return True
+
+    def _after_import(self, action, title: str) -> bool:
+        '''
+        正在导入、加载、重新加载文件时，action排队到导入线程结束后执行，返回是否已经排队
+        导入在一个长事务中写数据库，共享缓存的内存数据库在这期间其他连接不能读取表结构，需要在_after_prefetch之后调用
+        '''
+        if not self._is_importing():
+            return False
+        self._pending_actions.append(action)
+        self.statusbar.showMessage(f'正在导入Excel文件，完成后再{title}...')
+        return True
+
+    def _lazy_tables(self, tables_name: list[str]) -> list[TableInfo]:
+        tables = [self._engine.catalog.get(table_name) for table_name in tables_name]
+        return [table for table in tables if table and not table.loaded and table.source]
+
+    def _load_lazy_tables(self, tables: list[TableInfo], after_load) -> None:
+        '''
+        在后台加载延迟加载的表，只等待用到的这些表，加载完成后调用after_load，正在导入文件时排队
+        '''
+        tables_name = [table.name for table in tables]
+        self.statusbar.showMessage('正在加载表格数据：' + ' '.join([f'[{name}]' for name in tables_name]) + '，加载完成后继续...')
+        if self._is_importing():
+            self._pending_actions.append(lambda: self._start_load_worker(tables_name, after_load))
+            return
+        self._start_load_worker(tables_name, after_load)
+
+    def _start_load_worker(self, tables_name: list[str], after_load=None, prefetch: bool = False) -> None:
+        tables = self._lazy_tables(tables_name)
+        if not tables:
+            # 排队期间已经加载完成
+            if after_load:
+                after_load()
+            return
+        self._stop_profile_worker()
+        self._import_t1 = time.time()
+        self._import_worker = SheetLoadWorker(self._engine, tables, prefetch, self)
+        worker = self._import_worker
+        self._import_worker.load_finished.connect(lambda result: self._load_worker_load_finished(result, worker, after_load))
+        self._import_worker.import_failed.connect(lambda error: self._load_worker_load_failed(error, worker))
+        self._import_worker.finished.connect(self._import_worker_finished)
+        if not prefetch:
+            # 预加载不显示进度，不影响导入文件
+            self._import_worker.import_progress.connect(self._import_worker_progress)
+            self.pushButtonImportFile.setEnabled(False)
+            self._progressBarImport.setValue(0)
+            self._progressBarImport.setVisible(True)
+        self._import_worker.start()
+
+    def _load_worker_load_finished(self, result: dict, worker: SheetLoadWorker, after_load) -> None:
+        catalog = self._engine.catalog
+        for sheet in result['loaded']:
+            # 注册时用前几行推断的类型，后面的数据不符合时加载过程中会放宽
+            table = catalog.update(sheet.table_name, columns=sheet.columns, rows_count=sheet.rows_count, loaded=True)
+            if table and table.item:
+                table.item.setToolTip(0, '')
+                column_types = dict(sheet.columns)
+                for field_index in range(table.item.childCount()):
+                    field_node = table.item.child(field_index)
+                    field_node.setText(1, column_types.get(field_node.text(0), field_node.text(1)))
+        self._load_failed.update(result['failed'])
+        self._result_cache.invalidate(*[sheet.table_name for sheet in result['loaded']])
+        info = f'加载表格数据成功！共[{len(result["loaded"])}]个表[{sum(sheet.rows_count for sheet in result["loaded"])}行]，' \
+            f'用时[{result["time"]:.2f}s]：' + ' '.join([f'[{sheet.table_name}]' for sheet in result['loaded']])
+        if result['failed']:
+            info += f'，失败[{len(result["failed"])}]个：' + '；'.join(result['errors'] or result['failed'])
+            logging.error(info)
+        if worker.prefetch:
+            logging.info(f'后台{info}')
+            return
+        self.statusbar.showMessage(info)
+        if after_load and not result['failed']:
+            # 加载线程结束后再继续
+            self._pending_actions.insert(0, after_load)
+
+    def _load_worker_load_failed(self, error: str, worker: SheetLoadWorker) -> None:
+        if worker.prefetch:
+            # 预加载被取消时不打扰用户，空闲时会重新开始，其他原因失败的表不再预加载
+            if not worker.cancelled:
+                self._load_failed.update(worker.tables_name)
+                logging.error(f'后台加载表格数据失败！ {error}')
+            return
+        error_info = f'加载表格数据失败！ {error}'
+        logging.error(error_info)
+        self.statusbar.showMessage(error_info)
+
+    def _prefetch_lazy_tables(self) -> None:
+        '''
+        空闲时在后台逐个加载延迟加载的表，每次只加载一个表，用户需要其他表时可以尽快取消
+        '''
+        if self._is_importing():
+            # 导入线程结束后会重新开始计时
+            return
+        if self._is_sql_running() or self._is_exporting() or self._is_profiling() or self._changed_files:
+            self._prefetch_timer.start(self.PREFETCH_DELAY_MS)
+            return
+        tables = [table for table in self._engine.catalog.lazy_tables() if table.name not in self._load_failed and table.source]
+        if tables:
+            self._start_load_worker([tables[0].name], prefetch=True)
+
+    def _find_excel_nodes(self, pname: str) -> list[QTreeWidgetItem]:
+        '''
+        同一个文件可能导入了多次，隐藏的是已经移除的文件
+        '''
+        nodes = []
+        for file_index in range(self.treeWidgetExcelsAndSheets.topLevelItemCount()):
+            file_node = self.treeWidgetExcelsAndSheets.topLevelItem(file_index)
+            if not file_node.isHidden() and file_node.data(0, Qt.UserRole).value == pname:
+                nodes.append(file_node)
+        return nodes
+
+    def _reload_excel_file(self, file_node: QTreeWidgetItem) -> None:
+        '''
+        在后台重新加载文件，只重新导入内容变化的表格，没有变化的表格、表名、索引、树的展开状态都不变
+        '''
+        if self._after_prefetch(lambda: self._reload_excel_file(file_node)):
+            return
+        if self._is_importing():
+            self.statusbar.showMessage('正在导入Excel文件，请等待导入完成！')
+            return
+        if self._is_sql_running() or self._is_exporting():
+            # 重新加载要删除、替换表，其他连接正在读取数据库时会失败
+            self.statusbar.showMessage('SQL正在执行或者正在导出，请等待完成后再重新加载文件！')
+            return
+        node_data: TreeNodeData = file_node.data(0, Qt.UserRole)
+        sheet_tables = {}
+        for index in range(file_node.childCount()):
+            table = self._engine.catalog.get(file_node.child(index).text(0))
+            if table and table.source:
+                sheet_tables[table.source[1]] = table.name
+        # 结果表格还在从cursor分批获取数据时不能drop表，先把数据取完
+        self._fetch_all_query_result()
+        self._stop_profile_worker()
+        self._import_t1 = time.time()
+        self._import_worker = ExcelReloadWorker(self._engine, Path(node_data.value), node_data.info, sheet_tables, self)
+        self._import_worker.import_progress.connect(self._import_worker_progress)
+        self._import_worker.reload_finished.connect(lambda result: self._reload_worker_reload_finished(result, file_node))
+        self._import_worker.import_failed.connect(self._import_worker_import_failed)
+        self._import_worker.finished.connect(self._import_worker_finished)
+        self.pushButtonImportFile.setEnabled(False)
+        self._progressBarImport.setValue(0)
+        self._progressBarImport.setVisible(True)
+        self.statusbar.showMessage(f'正在重新加载Excel文件【{node_data.value}】...')
+        self._import_worker.start()
+
+    def _reload_worker_reload_finished(self, result: dict, file_node: QTreeWidgetItem) -> None:
+        node_data: TreeNodeData = file_node.data(0, Qt.UserRole)
+        file_node.setData(0, Qt.UserRole, node_data._replace(info=result['fingerprint']))
+        catalog = self._engine.catalog
+        for sheet in result['replaced']:
+            # 只替换字段节点，表格节点的展开状态不变
+            table = catalog.update(sheet.table_name, columns=sheet.columns, rows_count=sheet.rows_count, loaded=True)
+            table.item.takeChildren()
+            table.item.setToolTip(0, '')
+            self._add_field_tree_nodes(table.item, sheet.columns)
+        for sheet in result['added']:
+            catalog.add(sheet.table_name, sheet.columns, sheet.rows_count, (sheet.pname, sheet.sheet_name))
+            self._add_sheet_tree_node(sheet.table_name, file_node, sheet.columns)
+        for table_name in result['removed']:
+            table = catalog.remove(table_name)
+            if table and table.item:
+                file_node.removeChild(table.item)
+        for table_name, columns, name in result['indexes']:
+            self._mark_indexed_fields(table_name, columns, name)
+        changed_tables = [sheet.table_name for sheet in result['replaced'] + result['added']] + result['removed']
+        self._result_cache.invalidate(*changed_tables)
+        self._update_tables_name()
+        info = f'重新加载Excel文件成功！【{Path(node_data.value).name}】替换[{len(result["replaced"])}]个表，新增[{len(result["added"])}]个，' \
+            f'删除[{len(result["removed"])}]个，[{result["unchanged"]}]个表没有变化，用时[{result["time"]:.2f}s]'
+        if result['errors']:
+            info += f'，失败[{len(result["errors"])}]个：' + '；'.join(result['errors'])
+            logging.error(info)
+        self.statusbar.showMessage(info)
+
+    def _treeWidgetItem_popContextMenu_ReloadFile(self, currentItem) -> None:
+        '''重新加载此文件'''
+        self._reload_excel_file(currentItem)
+
+    def _file_watcher_fileChanged(self, path: str) -> None:
+        if not self.checkBoxWatchFiles.isChecked():
+            return
+        self._changed_files.add(path)
+        self._reload_timer.start(self.RELOAD_DELAY_MS)
+
+    def _reload_changed_files(self) -> None:
+        if self._is_importing() and not self._is_prefetching():
+            # 导入完成后再处理，后台预加载会被取消
+            return
+        if self._is_sql_running() or self._is_exporting():
+            # 执行SQL、导出结束后再处理
+            return
+        while self._changed_files:
+            path = self._changed_files.pop()
+            if not Path(path).is_file():
+                continue
+            # 保存时先删除再重命名的文件会从监视列表中消失，重新加入
+            if path not in self._file_watcher.files():
+                self._file_watcher.addPath(path)
+            # 文件的大小和修改时间和导入时一样的不需要重新加载
+            stat = Path(path).stat()
+            file_nodes = [file_node for file_node in self._find_excel_nodes(path)
+                          if getattr(file_node.data(0, Qt.UserRole).info, 'mtime_ns', None) != stat.st_mtime_ns
+                          or file_node.data(0, Qt.UserRole).info.size != stat.st_size]
+            if not file_nodes:
+                continue
+            # 一次只能重新加载一个，剩下的在完成后继续
+            if len(file_nodes) > 1:
+                self._changed_files.add(path)
+            self._reload_excel_file(file_nodes[0])
+            return
+
+    def _workspace_metadata(self) -> dict:
+        '''
+        保存到工作区文件中的界面状态：文件列表（顺序、展开状态、指纹）、每个文件下的表和SQL编辑器的内容
+        '''
+        files = []
+        for file_index in range(self.treeWidgetExcelsAndSheets.topLevelItemCount()):
+            file_node = self.treeWidgetExcelsAndSheets.topLevelItem(file_index)
+            if file_node.isHidden() or file_node.data(0, Qt.UserRole).node_type != TreeNodeType.File:
+                continue
+            node_data: TreeNodeData = file_node.data(0, Qt.UserRole)
+            sheets = []
+            for sheet_index in range(file_node.childCount()):
+                sheet_node = file_node.child(sheet_index)
+                sheets.append({'table': sheet_node.text(0), 'expanded': sheet_node.isExpanded()})
+            files.append({'pname': node_data.value, 'expanded': file_node.isExpanded(),
+                          'fingerprint': fingerprint_to_json(node_data.info), 'sheets': sheets})
+        return {'files': files, 'sql': self.plainTextSql.toPlainText()}
+
+    def _check_workspace(self, title: str) -> bool:
+        if self._is_importing() or self._is_sql_running() or self._is_exporting():
+            self.statusbar.showMessage(f'正在导入、执行SQL或者导出，请等待完成后再{title}！')
+            return False
+        return True
+
+    def _save_workspace(self, pname: Path) -> bool:
+        '''
+        用sqlite的备份接口把整个数据库和界面状态保存到一个文件
+        '''
+        if self._after_prefetch(lambda: self._save_workspace(pname)):
+            return False
+        if not self._check_workspace('保存工作区'):
+            return False
+        try:
+            result = self._engine.save_workspace(pname, self._workspace_metadata())
+        except Exception as ex:
+            error_info = f'保存工作区失败！【{pname}】 {str(ex)}'
+            logging.error(error_info)
+            self.statusbar.showMessage(error_info)
+            return False
+        self.statusbar.showMessage(f'保存工作区成功！【{pname}】共[{len(self._engine.catalog)}]个表'
+                                   f'[{result["size"] / 1024 ** 2:.1f}MB]，用时[{result["time"]:.2f}s]')
+        return True
+
+    def _open_workspace(self, pname: Path) -> None:
+        '''
+        打开工作区文件，替换当前所有的表，按保存时的状态重建文件和表的树、索引标记和SQL，不读取Excel文件
+        '''
+        if self._after_prefetch(lambda: self._open_workspace(pname)):
+            return
+        if not self._check_workspace('打开工作区'):
+            return
+        # 结果表格还在从cursor分批获取数据时不能替换数据库，清空当前的结果
+        self._query_columns = None
+        self._query_result = None
+        self._query_sql = None
+        self._result_model.clear()
+        self._stop_profile_worker()
+        t1 = time.time()
+        try:
+            metadata = self._engine.open_workspace(pname)
+        except Exception as ex:
+            error_info = f'打开工作区失败！【{pname}】 {str(ex)}'
+            logging.error(error_info)
+            self.statusbar.showMessage(error_info)
+            return
+        self._result_cache.invalidate_all()
+        self._changed_files.clear()
+        self._load_failed.clear()
+        if self._file_watcher.files():
+            self._file_watcher.removePaths(self._file_watcher.files())
+        self.treeWidgetExcelsAndSheets.clear()
+        self._results_node = None
+        catalog = self._engine.catalog
+        for file_info in metadata.get('files', []):
+            file_node = self._add_excel_node(Path(file_info['pname']), fingerprint_from_json(file_info['fingerprint']))
+            for sheet_info in file_info['sheets']:
+                table = catalog.get(sheet_info['table'])
+                if table is None:
+                    continue
+                sheet_node = self._add_sheet_tree_node(table.name, file_node, table.columns)
+                sheet_node.setExpanded(sheet_info['expanded'])
+                for index_name, columns in get_indexes(self._conn, table.name):
+                    self._mark_indexed_fields(table.name, columns, index_name)
+            file_node.setExpanded(file_info['expanded'])
+            file_node.setHidden(file_node.childCount() == 0)
+        # 不是从Excel文件导入的表和视图
+        for table in catalog:
+            if table.item is None:
+                self._add_sheet_tree_node(table.name, self._get_results_node(), table.columns)
+                for index_name, columns in get_indexes(self._conn, table.name):
+                    self._mark_indexed_fields(table.name, columns, index_name)
+        self.plainTextSql.setPlainText(metadata.get('sql', ''))
+        self._update_tables_name()
+        t2 = time.time()
+        self.statusbar.showMessage(f'打开工作区成功！【{pname}】共[{len(catalog)}]个表，用时[{(t2 - t1):.2f}s]')
+        self._prefetch_timer.start(self.PREFETCH_DELAY_MS)
+
+    def actionOpenWorkspace_triggered(self):
+        fname, _ = QFileDialog.getOpenFileName(self, '打开工作区', '', f'工作区 (*{WORKSPACE_SUFFIX})')
+        if fname:
+            self._open_workspace(Path(fname))
+
+    def actionSaveWorkspace_triggered(self):
+        fname, _ = QFileDialog.getSaveFileName(self, '保存工作区', '', f'工作区 (*{WORKSPACE_SUFFIX})')
+        if not fname:
+            return
+        pname = Path(fname)
+        if pname.suffix.lower() != WORKSPACE_SUFFIX:
+            pname = pname.with_name(pname.name + WORKSPACE_SUFFIX)
+        self._save_workspace(pname)
+
+    def pushButtonImportFile_clicked(self):
+        fnames, *_ = QFileDialog.getOpenFileNames(self, '导入Excel', '',
+            'Excel/CSV Files (*.xlsx *.xls *.csv *.tsv);;Excel Files (*.xlsx *.xls);;CSV Files (*.csv *.tsv)')
+        if fnames:
+            self._import_excel_files([Path(fname) for fname in fnames])
         else:
             self.statusbar.showMessage(f'未选择有效的Excel文件！')
 
-
     def plainTextSql_textChanged(self):
         pass
 
@@ -265,47 +977,388 @@ class MyApp(QMainWindow, Ui_MainWindow):
     # def pushButtonFormatSql_clicked(self):
     #     self.statusbar.showMessage('todo') # todo
 
-    def _show_query_result(self) -> None:
-        self.tableWidgetSqlResult.setColumnCount(len(self._query_columns))
-        self.tableWidgetSqlResult.setRowCount(0)
-        self.tableWidgetSqlResult.setHorizontalHeaderLabels(self._query_columns)
-        for index, row in enumerate(self._query_result):
-            self.tableWidgetSqlResult.setRowCount(index + 1)
-            cells = [QTableWidgetItem(str(value) if value else '') for value in row]
-            [self.tableWidgetSqlResult.setItem(index, i, v) for i,v in enumerate(cells)]
+    def _show_query_result(self, cursor: sqlite3.Cursor = None) -> None:
+        '''
+        显示查询结果，传入cursor时剩余的数据在滚动时分批获取
+        '''
+        self._result_model.set_result(self._query_columns, self._query_result, cursor)
+
+    def _fetch_all_query_result(self) -> None:
+        '''
+        把cursor中还没有取出的数据全部取出来（导出、drop表之前需要）
+        '''
+        if self._query_result is not None:
+            self._query_result = self._result_model.fetch_all()
+
+    def _is_sql_running(self) -> bool:
+        return self._sql_worker is not None and self._sql_worker.isRunning()
 
     def pushButtonRunSql_clicked(self):
+        self._run_sql(self.plainTextSql.toPlainText().strip())
+
+    def _run_sql(self, sql: str) -> None:
+        '''
+        在后台执行SQL，用到的表还没有加载数据时先加载这些表，加载完成后再执行
+        '''
+        if self._is_sql_running():
+            self.statusbar.showMessage('SQL正在执行中，请等待执行完成或者取消执行！')
+            return
         self._query_columns = None
         self._query_result = None
-        self.tableWidgetSqlResult.clear()
-        self.tableWidgetSqlResult.setColumnCount(0)
-        self.tableWidgetSqlResult.setRowCount(0)
-        sql = self.plainTextSql.toPlainText().strip()
+        self._result_model.clear()
+        self._query_sql = sql
         if not sql:
             QMessageBox.information(self, '执行SQL', 'SQL内容为空！', QMessageBox.Yes, QMessageBox.Yes)
             return
-        t1, t2, t3, t4 = 0.0, 0.0, 0.0, 0.0
-        try:
-            t1 = time.time()
-            self._cursor.execute(sql)
-            t2 = time.time()
-        except sqlite3.OperationalError as ex:
-            error_info = f'执行SQL失败！ {str(ex)}'
-            self.statusbar.showMessage(error_info)
+        tables_name = referenced_tables(significant_tokens(sql), self._engine.catalog.tables_name())
+        if self._after_prefetch(lambda: self._run_sql(sql), tables_name):
             return
-        if not self._cursor.description:
-            self.statusbar.showMessage(f'执行SQL结果为空！')
+        if self._after_import(lambda: self._run_sql(sql), '执行SQL'):
             return
-        self._query_result = self._cursor.fetchall()
-        t3 = time.time()
-        self._query_columns = [desc[0] for desc in self._cursor.description]
+        lazy_tables = self._lazy_tables(tables_name)
+        if lazy_tables:
+            self._load_lazy_tables(lazy_tables, lambda: self._run_sql(sql))
+            return
+        t1 = time.time()
+        self._query_cache_key = self._result_cache.make_key(sql, self._engine.catalog.tables_name())
+        if any(self._is_view(table_name) for table_name in tables_name):
+            # 视图引用的表变化时视图的版本号不变，不能缓存
+            self._query_cache_key = None
+        cached = self._result_cache.get(self._query_cache_key)
+        if cached is not None:
+            # 表没有变化，直接显示上次的结果，排序只改变界面上的顺序，不改变缓存的结果
+            self._query_columns = cached.columns
+            self._query_result = cached.rows
+            self._show_query_result()
+            t2 = time.time()
+            self.statusbar.showMessage(f'执行SQL成功！使用了查询结果缓存，用时[{(t2 - t1):.2f}s]，共[{len(cached.rows)}行]')
+            return
+        indexes = []
+        if self.checkBoxAutoIndex.isChecked() and len(split_statements(sql)) == 1:
+            # 脚本中后面的语句可能用到前面的语句创建的表，不能提前分析
+            try:
+                indexes = advise_indexes(self._conn, sql, self._engine.catalog.table_columns())
+            except sqlite3.Error as ex:
+                # 分析失败不影响执行，执行时会报告具体的错误
+                logging.warning(f'索引建议失败！ {str(ex)}')
+        # 在后台线程中执行，界面不会卡住，结果分批显示
+        self._query_times = {'start': time.time(), 'first_rows': 0.0, 'display': 0.0, 'memory': process_memory_mb()}
+        # SQL可能修改数据库
+        self._stop_profile_worker()
+        self._sql_worker = SqlWorker(self._engine, sql, indexes, self)
+        self._sql_worker.columns_ready.connect(self._sql_worker_columns_ready)
+        self._sql_worker.rows_fetched.connect(self._sql_worker_rows_fetched)
+        self._sql_worker.query_finished.connect(self._sql_worker_query_finished)
+        self._sql_worker.query_failed.connect(self._sql_worker_query_failed)
+        self._sql_worker.statement_finished.connect(self._sql_worker_statement_finished)
+        self._sql_worker.finished.connect(self._sql_worker_finished)
+        self.pushButtonRunSql.setEnabled(False)
+        self.pushButtonCancelSql.setEnabled(True)
+        statements_count = self._sql_worker.statements_count
+        self.statusbar.showMessage(f'正在执行SQL脚本，共[{statements_count}]条语句...' if statements_count > 1 else '正在执行SQL...')
+        self._sql_worker.start()
+
+    def pushButtonCancelSql_clicked(self):
+        if self._is_sql_running():
+            self._sql_worker.cancel()
+            self.statusbar.showMessage('正在取消执行SQL...')
+
+    def _sql_worker_columns_ready(self, columns: list[str]) -> None:
+        self._query_columns = columns
+        self._query_result = ResultStore(columns, self._result_memory_limit)
         self._show_query_result()
+
+    def _sql_worker_rows_fetched(self, chunk: ResultChunk) -> None:
+        t3 = time.time()
+        if not self._query_times['first_rows']:
+            self._query_times['first_rows'] = t3 - self._query_times['start']
+        self._result_model.append_chunk(chunk)
         t4 = time.time()
-        self.statusbar.showMessage(f'执行SQL成功！执行用时[{(t2 - t1):.2f}s]，获取数据用时[{(t3 - t2):.2f}s]，显示数据用时[{(t4 - t3):.2f}s]')
+        self._query_times['display'] += t4 - t3
+
+    def _sql_worker_statement_finished(self, result: StatementResult) -> None:
+        statements_count = self._sql_worker.statements_count
+        if statements_count > 1:
+            rows_info = '' if result.rows is None else f'[{result.rows}行]'
+            self.statusbar.showMessage(f'正在执行SQL脚本，已完成[{result.index + 1}/{statements_count}]条语句，'
+                                       f'上一条用时[{result.time:.2f}s]{rows_info}...')
+
+    def _sql_worker_query_finished(self, timings: dict) -> None:
+        for name, suggestion in zip(timings['indexes'], self._sql_worker.indexes):
+            self._mark_indexed_fields(suggestion.table_name, suggestion.columns, name)
+        statements = timings['statements']
+        if self._query_columns is None or any(statement.kind in ('change', 'other') for statement in statements):
+            # 没有返回结果的SQL可能修改了数据，也可能创建、删除了表
+            self._result_cache.invalidate_all()
+            self._refresh_catalog()
+        if self._sql_worker.cancelled:
+            self.statusbar.showMessage(f'已取消执行SQL！已执行[{len(statements)}]条语句，已获取数据[{timings["rows"]}行]')
+            return
+        self._add_profile(timings)
+        script_info = ''
+        if len(statements) > 1:
+            changed_rows = sum(statement.rows for statement in statements if statement.kind == 'change')
+            script_info = f'共[{len(statements)}]条语句，修改数据[{changed_rows}行]，'
+        if self._query_columns is None:
+            if script_info:
+                self.statusbar.showMessage(f'执行SQL脚本成功！{script_info}用时[{timings["execute"]:.2f}s]，在性能分析中查看每条语句的用时')
+            else:
+                self.statusbar.showMessage(f'执行SQL结果为空！')
+            return
+        self._result_cache.put(self._query_cache_key, self._query_columns, self._query_result, self._query_result.memory_bytes)
+        info = f'执行SQL成功！{script_info}执行用时[{timings["execute"]:.2f}s]，获取数据用时[{timings["fetch"]:.2f}s]，' \
+            f'显示数据用时[{self._query_times["display"]:.2f}s]，首批数据用时[{self._query_times["first_rows"]:.2f}s]，共[{timings["rows"]}行]'
+        if self._query_result.spilled_rows:
+            info += f'，超过内存上限的[{self._query_result.spilled_rows}行]暂存在临时文件中'
+        if timings['indexes']:
+            info += f'，自动创建索引[{len(timings["indexes"])}]个用时[{timings["index"]:.2f}s]'
+        self.statusbar.showMessage(info)
+
+    def _sql_worker_query_failed(self, error: str) -> None:
+        # 多条语句时前面的语句可能已经修改了数据
+        self._result_cache.invalidate_all()
+        self._refresh_catalog()
+        error_info = f'执行SQL失败！ {error}'
+        self.statusbar.showMessage(error_info)
+
+    def _sql_worker_finished(self) -> None:
+        self._sql_worker.deleteLater()
+        self._sql_worker = None
+        self.pushButtonRunSql.setEnabled(True)
+        self.pushButtonIndexAdvisor.setEnabled(True)
+        self.pushButtonCancelSql.setEnabled(False)
+        if self._changed_files:
+            # 执行期间变化的文件
+            self._reload_timer.start(self.RELOAD_DELAY_MS)
+
+    def _add_profile(self, timings: dict) -> None:
+        '''
+        记录这次执行的性能数据，显示在性能分析中
+        '''
+        profile = new_profile(self._query_sql)
+        memory = process_memory_mb()
+        profile.update({
+            'execute': timings['execute'],
+            'fetch': timings['fetch'],
+            'first_rows': self._query_times['first_rows'],
+            'display': self._query_times['display'],
+            'rows_returned': timings['rows'],
+            'rows_scanned': timings['rows_scanned'],
+            'vm_steps': timings['vm_steps'],
+            'memory_delta_mb': None if memory is None or self._query_times['memory'] is None else memory - self._query_times['memory'],
+            'scanned_tables': timings['scanned_tables'],
+            'plan': timings['plan'],
+            'statements': [statement._asdict() for statement in timings['statements']],
+        })
+        self._profile_history.add(profile)
+        # 历史记录表格和ProfileHistory保持相同的长度
+        while self.tableWidgetQueryHistory.rowCount() >= len(self._profile_history):
+            self.tableWidgetQueryHistory.removeRow(0)
+        row = self.tableWidgetQueryHistory.rowCount()
+        self.tableWidgetQueryHistory.insertRow(row)
+        for column, (field, _) in enumerate(self._profile_columns):
+            value = profile[field]
+            text = '' if value is None else f'{value:.3f}' if isinstance(value, float) else str(value)
+            item = QTableWidgetItem(text.replace('\n', ' '))
+            item.setToolTip(str(value) if field == 'sql' else '')
+            self.tableWidgetQueryHistory.setItem(row, column, item)
+        self.tableWidgetQueryHistory.selectRow(row)
+
+    def _show_profile(self, profile: dict) -> None:
+        # 执行计划按id和parent显示成树，多条语句的脚本先显示每条语句的用时，执行计划显示在结果查询的下面
+        self.treeWidgetQueryPlan.clear()
+        plan_root = self.treeWidgetQueryPlan
+        statements = profile.get('statements') or []
+        if len(statements) > 1:
+            for statement in statements:
+                rows_info = '' if statement['rows'] is None else f' [{statement["rows"]}行]'
+                sql = ' '.join(statement['sql'].split())
+                node = QTreeWidgetItem(self.treeWidgetQueryPlan, [f'[{statement["index"] + 1}] [{statement["time"]:.3f}s]{rows_info} {sql}'])
+                node.setToolTip(0, statement['sql'])
+                if statement['kind'] == 'result':
+                    plan_root = node
+        plan_nodes = {}
+        for node_id, parent, detail in profile['plan'] or []:
+            parent_node = plan_nodes.get(parent, plan_root)
+            plan_nodes[node_id] = QTreeWidgetItem(parent_node, [detail])
+        self.treeWidgetQueryPlan.expandAll()
+        rows_scanned = '未知' if profile['rows_scanned'] is None else f'约[{profile["rows_scanned"]}行]'
+        scanned_tables = ' '.join([f'[{name}]' for name in profile['scanned_tables'] or []])
+        memory = '未知' if profile['memory_delta_mb'] is None else f'[{profile["memory_delta_mb"]:+.1f}MB]'
+        self.labelProfileSummary.setText(
+            f'执行用时[{profile["execute"]:.3f}s]，获取数据用时[{profile["fetch"]:.3f}s]，首批数据用时[{profile["first_rows"]:.3f}s]，'
+            f'显示数据用时[{profile["display"]:.3f}s]；返回[{profile["rows_returned"]}行]，扫描{rows_scanned}'
+            + (f'（全表扫描：{scanned_tables}）' if scanned_tables else '')
+            + f'；虚拟机指令约[{profile["vm_steps"]}]条；内存变化{memory}')
+
+    def _tableWidgetQueryHistory_itemSelectionChanged(self) -> None:
+        row = self.tableWidgetQueryHistory.currentRow()
+        if 0 <= row < len(self._profile_history):
+            self._show_profile(self._profile_history[row])
+
+    def pushButtonExportProfile_clicked(self):
+        if not len(self._profile_history):
+            QMessageBox.information(self, '导出性能记录', '当前没有性能记录！', QMessageBox.Yes, QMessageBox.Yes)
+            return
+        fname, _ = QFileDialog.getSaveFileName(self, '导出性能记录', '', 'JSON Files (*.json);;CSV Files (*.csv)')
+        if not fname:
+            return
+        try:
+            self._profile_history.export(Path(fname))
+            self.statusbar.showMessage(f'导出性能记录成功！共[{len(self._profile_history)}]条，已导出为文件【{fname}】')
+        except Exception as ex:
+            error_info = f'导出性能记录失败！异常信息：{str(ex)}'
+            logging.error(error_info)
+            self.statusbar.showMessage(error_info)
+
+    def pushButtonIndexAdvisor_clicked(self):
+        '''分析当前SQL的执行计划，给出索引建议'''
+        if self._is_sql_running():
+            self.statusbar.showMessage('SQL正在执行中，请等待执行完成或者取消执行！')
+            return
+        sql = self.plainTextSql.toPlainText().strip()
+        if not sql:
+            QMessageBox.information(self, '索引建议', 'SQL内容为空！', QMessageBox.Yes, QMessageBox.Yes)
+            return
+        try:
+            suggestions = advise_indexes(self._conn, sql, self._engine.catalog.table_columns())
+        except sqlite3.Error as ex:
+            self.statusbar.showMessage(f'分析SQL执行计划失败！ {str(ex)}')
+            return
+        if not suggestions:
+            self.statusbar.showMessage('没有发现需要创建的索引！')
+            return
+        info = '\n\n'.join([f'[{s.table_name}] ({", ".join(s.columns)})\n{s.reason}' for s in suggestions])
+        yes_or_no = QMessageBox.question(self, '索引建议', f'建议创建以下索引：\n\n{info}\n\n是否创建索引并对比执行用时？',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if yes_or_no != QMessageBox.Yes:
+            return
+        self._start_index_worker(sql, suggestions)
+
+    def _start_index_worker(self, sql: str, suggestions: list) -> None:
+        '''
+        创建索引并对比执行用时，空表的对比没有意义，先加载延迟加载的表
+        '''
+        if self._is_sql_running():
+            self.statusbar.showMessage('SQL正在执行中，请等待执行完成或者取消执行！')
+            return
+        tables_name = referenced_tables(significant_tokens(sql), self._engine.catalog.tables_name())
+        if self._after_prefetch(lambda: self._start_index_worker(sql, suggestions), tables_name):
+            return
+        if self._after_import(lambda: self._start_index_worker(sql, suggestions), '创建索引'):
+            return
+        lazy_tables = self._lazy_tables(tables_name)
+        if lazy_tables:
+            self._load_lazy_tables(lazy_tables, lambda: self._start_index_worker(sql, suggestions))
+            return
+        self._stop_profile_worker()
+        self._sql_worker = IndexWorker(self._engine, sql, suggestions, self)
+        self._sql_worker.index_finished.connect(lambda result: self._index_worker_index_finished(result, suggestions))
+        self._sql_worker.index_failed.connect(lambda error: self.statusbar.showMessage(f'创建索引失败！ {error}'))
+        self._sql_worker.finished.connect(self._sql_worker_finished)
+        self.pushButtonRunSql.setEnabled(False)
+        self.pushButtonIndexAdvisor.setEnabled(False)
+        self.pushButtonCancelSql.setEnabled(True)
+        self.statusbar.showMessage('正在创建索引并对比执行用时...')
+        self._sql_worker.start()
+
+    def _index_worker_index_finished(self, result: dict, suggestions: list) -> None:
+        for name, suggestion in zip(result['indexes'], suggestions):
+            self._mark_indexed_fields(suggestion.table_name, suggestion.columns, name)
+        info = f'创建索引[{len(result["indexes"])}]个成功！用时[{result["index"]:.2f}s]，' \
+            f'执行用时：创建索引前[{result["before"]:.2f}s]，创建索引后[{result["after"]:.2f}s]'
+        self.statusbar.showMessage(info)
+        QMessageBox.information(self, '索引建议', info, QMessageBox.Yes, QMessageBox.Yes)
+
+    def _is_exporting(self) -> bool:
+        return self._export_worker is not None and self._export_worker.isRunning()
+
+    def _check_export(self, title: str) -> bool:
+        '''检查当前是否可以导出执行结果'''
+        if self._is_sql_running():
+            QMessageBox.information(self, title, 'SQL正在执行中，请等待执行完成后再导出！', QMessageBox.Yes, QMessageBox.Yes)
+            return False
+        if self._is_exporting():
+            QMessageBox.information(self, title, '正在导出执行结果，请等待导出完成！', QMessageBox.Yes, QMessageBox.Yes)
+            return False
+        if not self._query_columns:
+            QMessageBox.information(self, title, '当前没有执行结果！', QMessageBox.Yes, QMessageBox.Yes)
+            return False
+        return True
+
+    def _export_query_result(self, pname: Path, sheet_name: str = None, append: bool = False, parent=None) -> None:
+        '''
+        在后台导出当前的查询结果，结果已经完整获取时直接分批写出，否则在后台重新执行SQL分批获取
+        parent不为空时，导出的数据同时写到数据库的新表中，挂在parent节点下
+        '''
+        if parent and self._after_prefetch(lambda: self._export_query_result(pname, sheet_name, append, parent)):
+            return
+        # 需要重新执行SQL或者创建表时才访问数据库
+        if (parent or self._result_model.has_pending_rows()) \
+                and self._after_import(lambda: self._export_query_result(pname, sheet_name, append, parent), '导出'):
+            return
+        if parent:
+            # 导出时创建表，其他连接不能正在读取数据库，先把结果表格中cursor的数据取完
+            self._fetch_all_query_result()
+            self._stop_profile_worker()
+        if self._result_model.has_pending_rows():
+            sql, store, order = self._query_sql, None, None
+        else:
+            sql, store, order = None, self._query_result, self._result_model.order
+        self._export_worker = ExportWorker(self._engine, pname, self._query_columns, sql, store, order, sheet_name, append,
+            sheet_name if parent else None, self)
+        self._export_worker.export_progress.connect(self._export_worker_progress)
+        self._export_worker.export_finished.connect(lambda result: self._export_worker_export_finished(result, sheet_name, parent))
+        self._export_worker.export_failed.connect(self._export_worker_export_failed)
+        self._export_worker.finished.connect(self._export_worker_finished)
+        self.pushButtonExportResult.setEnabled(False)
+        self.pushButtonExportFile.setEnabled(False)
+        self._progressBarExport.setValue(0)
+        self._progressBarExport.setVisible(True)
+        self.statusbar.showMessage(f'正在导出执行结果到文件【{pname}】...')
+        self._export_worker.start()
+
+    def _export_worker_progress(self, progress: dict) -> None:
+        self._progressBarExport.setValue(progress['percent'])
+        self.statusbar.showMessage(f'正在导出执行结果：已导出[{progress["rows"]}行]')
+
+    def _export_worker_export_finished(self, result: dict, sheet_name: str, parent) -> None:
+        pname = self._export_worker.pname
+        if parent and result['table_name']:
+            # 导出成功后，在文件树上增加这个表
+            self._engine.catalog.add(result['table_name'], result['columns'], result['rows'], (pname, sheet_name))
+            self._add_sheet_tree_node(result['table_name'], parent, result['columns'])
+            self._result_cache.invalidate(result['table_name'])
+            self._update_tables_name()
+            info = f'导出成功！已导出为文件【{pname}】的表[{sheet_name}]，共[{result["rows"]}行]，用时[{result["time"]:.2f}s]'
+        else:
+            info = f'导出成功！已导出为文件【{pname}】，共[{result["rows"]}行]，用时[{result["time"]:.2f}s]'
+        self.statusbar.showMessage(info)
+        # 弹窗提示
+        yes_or_no = QMessageBox.question(self, '导出执行结果', '导出成功！是否在文件夹中查看文件？', QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if yes_or_no == QMessageBox.Yes:
+            self._show_file_in_folder(pname)
+
+    def _export_worker_export_failed(self, error: str) -> None:
+        error_info = f'导出执行结果失败！异常信息：{error}'
+        logging.error(error_info)
+        self.statusbar.showMessage(error_info)
+
+    def _export_worker_finished(self) -> None:
+        self._export_worker.deleteLater()
+        self._export_worker = None
+        self._progressBarExport.setVisible(False)
+        self.pushButtonExportResult.setEnabled(True)
+        self.pushButtonExportFile.setEnabled(True)
+        if self._changed_files:
+            # 导出期间变化的文件
+            self._reload_timer.start(self.RELOAD_DELAY_MS)
+
+    def _is_valid_sheet_name(self, sheet_name: str) -> bool:
+        return sheet_name != '' and len(sheet_name.encode('gbk', errors='replace')) <= 31 and not any(x in ':\\/?*[]' for x in sheet_name)
 
     def pushButtonExportResult_clicked(self):
-        if not self._query_result:
-            QMessageBox.information(self, '导出执行结果', '当前没有执行结果！', QMessageBox.Yes, QMessageBox.Yes)
+        if not self._check_export('导出执行结果'):
             return
         currentItem = self.treeWidgetExcelsAndSheets.currentItem()
         if not currentItem:
@@ -314,31 +1367,108 @@ class MyApp(QMainWindow, Ui_MainWindow):
         while currentItem.parent():
             currentItem = currentItem.parent()
         pname = currentItem.data(0, Qt.UserRole).value
+        if Path(pname).suffix.lower() != '.xlsx':
+            QMessageBox.information(self, '导出执行结果', '只能追加表格到xlsx文件，请使用“另存为”导出为新文件！', QMessageBox.Yes, QMessageBox.Yes)
+            return
         new_sheet_name: str = self.lineEditNewSheetName.text()
-        if new_sheet_name in self._get_db_tables_name():
+        # Excel的表格名称不区分大小写
+        sheet_names = [table.source[1].lower() for table in self._engine.catalog if table.source and str(table.source[0]) == pname]
+        if new_sheet_name in self._engine.catalog or new_sheet_name.lower() in sheet_names:
             info = '已存在相同的表格名称，请填写不同的表格名称！'
             QMessageBox.information(self, 'Excel表格名称无效', info, QMessageBox.Yes, QMessageBox.Yes)
             return
-        if new_sheet_name == '' or len(new_sheet_name.encode('gbk')) > 31 or next(filter(lambda x: x in ['\/?*[]'], new_sheet_name), None):
+        if not self._is_valid_sheet_name(new_sheet_name):
             info = '请确保：\n\n名称不多于31个字符。\n名称不包含下列任一字符： : \\ / ? * [ 或 ]\n名称不为空。'
             QMessageBox.information(self, 'Excel表格名称无效', info, QMessageBox.Yes, QMessageBox.Yes)
             return
-        try:
-            excel_writer = pandas.ExcelWriter(pname, mode='a')
-            new_df = pandas.DataFrame(data=self._query_result, columns=self._query_columns)
-            new_df.to_excel(excel_writer, new_sheet_name, index=False)
-            excel_writer.close()
-            # 导出成功后，在文件树上增加这个表
-            self._add_sheet_node(new_sheet_name, currentItem, new_df)
-            # 弹窗提示
-            self.statusbar.showMessage(f'导出成功！已导出为文件【{pname}】的表[{new_sheet_name}]')
-            yes_or_no = QMessageBox.question(self, '导出执行结果', '导出成功！是否在文件夹中查看文件？', QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
-            if yes_or_no == QMessageBox.Yes:
-                self._show_file_in_folder(pname)
-        except Exception as ex:
-            error_info = f'导出执行结果失败！异常信息：{str(ex)}'
-            logging.error(error_info)
-            self.statusbar.showMessage(error_info)
+        self._export_query_result(pname, new_sheet_name, True, currentItem)
+
+    def pushButtonExportFile_clicked(self):
+        if not self._check_export('另存为'):
+            return
+        fname, _ = QFileDialog.getSaveFileName(self, '另存为', '',
+            'Excel Files (*.xlsx);;CSV Files (*.csv);;TSV Files (*.tsv);;Parquet Files (*.parquet)')
+        if not fname:
+            return
+        pname = Path(fname)
+        if pname.suffix.lower() not in EXPORT_SUFFIXES:
+            QMessageBox.information(self, '另存为', f'不支持的文件类型！支持的文件类型：{" ".join(EXPORT_SUFFIXES)}', QMessageBox.Yes, QMessageBox.Yes)
+            return
+        # xlsx文件中表格的名称，没有填写有效的名称时用Sheet1
+        sheet_name = self.lineEditNewSheetName.text()
+        if not self._is_valid_sheet_name(sheet_name):
+            sheet_name = 'Sheet1'
+        self._export_query_result(pname, sheet_name)
+
+    def pushButtonSaveAsTable_clicked(self):
+        self._save_result_as('保存为表', False)
+
+    def pushButtonSaveAsView_clicked(self):
+        self._save_result_as('保存为视图', True)
+
+    def _save_result_as(self, title: str, as_view: bool) -> None:
+        '''
+        用当前结果的SQL在数据库中创建新表或视图，脚本只用显示结果的那条查询
+        '''
+        if not self._check_export(title):
+            return
+        runner = ScriptRunner(self._query_sql or '')
+        sql = runner.statements[runner.result_index] if runner.statements else ''
+        first_token = next(iter(significant_tokens(sql)), None)
+        if not first_token or not is_keyword(first_token, 'SELECT', 'VALUES', 'WITH'):
+            QMessageBox.information(self, title, '只能保存SELECT查询的结果！', QMessageBox.Yes, QMessageBox.Yes)
+            return
+        default_name = make_table_name(self.lineEditNewSheetName.text().strip() or 'result', self._engine.catalog)
+        name, ok = QInputDialog.getText(self, title, '名称：', text=default_name)
+        name = name.strip()
+        if not ok or not name:
+            return
+        if name in self._engine.catalog or '[' in name or ']' in name:
+            QMessageBox.information(self, title, f'名称[{name}]已存在或者包含[]，请填写不同的名称！', QMessageBox.Yes, QMessageBox.Yes)
+            return
+        self._materialize_query(sql, name, as_view)
+
+    def _materialize_query(self, sql: str, name: str, as_view: bool) -> None:
+        '''
+        在后台执行CREATE TABLE ... AS 或者 CREATE VIEW，数据不经过Python，完成后挂在“查询结果”节点下
+        '''
+        if self._is_sql_running():
+            self.statusbar.showMessage('SQL正在执行中，请等待执行完成或者取消执行！')
+            return
+        tables_name = referenced_tables(significant_tokens(sql), self._engine.catalog.tables_name())
+        if self._after_prefetch(lambda: self._materialize_query(sql, name, as_view), tables_name):
+            return
+        if self._after_import(lambda: self._materialize_query(sql, name, as_view), '保存查询结果'):
+            return
+        lazy_tables = self._lazy_tables(tables_name)
+        if lazy_tables:
+            self._load_lazy_tables(lazy_tables, lambda: self._materialize_query(sql, name, as_view))
+            return
+        # 创建表时其他连接不能正在读取数据库
+        self._fetch_all_query_result()
+        self._stop_profile_worker()
+        self._sql_worker = MaterializeWorker(self._engine, sql, name, as_view, self)
+        self._sql_worker.materialize_finished.connect(self._materialize_worker_materialize_finished)
+        self._sql_worker.materialize_failed.connect(self._materialize_worker_materialize_failed)
+        self._sql_worker.finished.connect(self._sql_worker_finished)
+        self.pushButtonRunSql.setEnabled(False)
+        self.pushButtonCancelSql.setEnabled(True)
+        self.statusbar.showMessage(f'正在创建{"视图" if as_view else "表"}[{name}]...')
+        self._sql_worker.start()
+
+    def _materialize_worker_materialize_finished(self, result: dict) -> None:
+        name = result['name']
+        self._engine.catalog.add(name, result['columns'], result['rows'], is_view=result['view'])
+        self._add_sheet_tree_node(name, self._get_results_node(), result['columns'])
+        self._result_cache.invalidate(name)
+        self._update_tables_name()
+        rows_info = '' if result['rows'] is None else f'，共[{result["rows"]}行]'
+        self.statusbar.showMessage(f'{"保存为视图" if result["view"] else "保存为表"}成功！[{name}]{rows_info}，用时[{result["time"]:.2f}s]')
+
+    def _materialize_worker_materialize_failed(self, error: str) -> None:
+        error_info = f'保存查询结果失败！ {error}'
+        logging.error(error_info)
+        self.statusbar.showMessage(error_info)
 
     def _show_file_in_folder(self, fpath) -> None:
         cmd = f'explorer /select,"{Path(fpath)}"' # qt的path是/格式的，需要转换成windows的\格式
@@ -347,9 +1477,30 @@ class MyApp(QMainWindow, Ui_MainWindow):
     def dragEnterEvent(self, e: QDragEnterEvent) -> None:
         '''拖动事件'''
         e.accept()
-        
+
+    def _get_dropped_excel_files(self, e: QDropEvent) -> list[Path]:
+        '''从系统中拖进来的Excel、csv文件，文件夹会查找其中所有的Excel、csv文件'''
+        pnames = []
+        for url in e.mimeData().urls():
+            if not url.isLocalFile():
+                continue
+            pname = Path(url.toLocalFile())
+            candidates = sorted(pname.rglob('*')) if pname.is_dir() else [pname]
+            for candidate in candidates:
+                # ~$开头的是Excel打开文件时生成的临时文件
+                if candidate.is_file() and candidate.suffix.lower() in self.EXCEL_SUFFIXES and not candidate.name.startswith('~$'):
+                    pnames.append(candidate)
+        return pnames
+
     def dropEvent(self, e: QDropEvent) -> None:
         '''拖动释放事件'''
+        if e.mimeData().hasUrls():
+            pnames = self._get_dropped_excel_files(e)
+            if pnames:
+                self._import_excel_files(pnames)
+            else:
+                self.statusbar.showMessage('未选择有效的Excel文件！')
+            return
         currentItem = self.treeWidgetExcelsAndSheets.currentItem()
         if currentItem:
             node_data: TreeNodeData = currentItem.data(0, Qt.UserRole)
@@ -357,6 +1508,8 @@ class MyApp(QMainWindow, Ui_MainWindow):
                 self.plainTextSql.insertPlainText(f' {node_data.value} ')
 
 if __name__ == '__main__':
+    # pyinstaller打包后使用多进程需要
+    multiprocessing.freeze_support()
     qt_app = QApplication(sys.argv)
     my_app = MyApp()
     my_app.show()
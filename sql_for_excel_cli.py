@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: sql_for_excel_cli.py
+# @Time: 2023/09/23 15:30:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+'''
+命令行批处理，不依赖Qt，可以在没有图形界面的服务器上运行
+    python sql_for_excel_cli.py run script.sql -i a.xlsx -i b.xlsx -o out.csv
+导入所有的Excel文件，依次执行脚本中的SQL，最后一条语句的查询结果导出到-o指定的文件，
+没有-o时以csv格式输出到标准输出
+'''
+
+import sys
+import csv
+import time
+import logging
+import argparse
+from pathlib import Path
+from sql_engine import SqlEngine, StorageProfile, iter_cursor_batches, storage_profile_from_env
+from result_writers import EXPORT_SUFFIXES
+
+# 设置日志参数，日志输出到标准错误，不影响标准输出中的查询结果
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+
+def _make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='sql_for_excel', description='用SQL脚本操作Excel文件')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='导入Excel文件并执行SQL脚本')
+    run_parser.add_argument('script', help='SQL脚本文件，- 表示从标准输入读取')
+    run_parser.add_argument('-i', '--input', action='append', default=[], metavar='EXCEL', help='导入的Excel文件或者csv/tsv文件，可以指定多次')
+    run_parser.add_argument('-o', '--output', metavar='FILE', help=f'查询结果导出的文件，支持{" ".join(EXPORT_SUFFIXES)}')
+    run_parser.add_argument('--sheet', default='Sheet1', help='导出到xlsx文件时的表格名称')
+    run_parser.add_argument('--append', action='store_true', help='把表格追加到已有的xlsx文件中')
+    run_parser.add_argument('--encoding', default='utf-8-sig', help='SQL脚本文件的编码')
+    profile = storage_profile_from_env()
+    run_parser.add_argument('--workspace', choices=('memory', 'disk'), default='disk' if profile.disk else 'memory',
+                            help='数据库放在内存中，或者放在临时文件中（数据量可以超过内存大小）')
+    run_parser.add_argument('--workspace-dir', default=profile.temp_dir, help='临时文件的目录')
+    run_parser.add_argument('--cache-mb', type=int, default=profile.cache_size_mb, help='sqlite页缓存大小，MB')
+    run_parser.add_argument('--mmap-mb', type=int, default=profile.mmap_size_mb, help='内存映射读取临时文件的大小，MB，0表示不用')
+    run_parser.add_argument('--open', metavar='WORKSPACE', help='先打开保存的工作区文件，再导入-i指定的Excel文件')
+    run_parser.add_argument('--save', metavar='WORKSPACE', help='执行完脚本后把所有的表保存为工作区文件')
+    return parser
+
+
+def _read_script(script: str, encoding: str) -> str:
+    if script == '-':
+        return sys.stdin.read()
+    return Path(script).read_text(encoding=encoding)
+
+
+def run(args: argparse.Namespace) -> int:
+    engine = SqlEngine(profile=StorageProfile(args.workspace == 'disk', args.workspace_dir, args.cache_mb, args.mmap_mb))
+    try:
+        if args.open:
+            t1 = time.time()
+            engine.open_workspace(Path(args.open))
+            t2 = time.time()
+            logging.info(f'打开工作区成功！【{args.open}】共[{len(engine.catalog)}]个表，用时[{(t2 - t1):.2f}s]')
+        for fname in args.input:
+            t1 = time.time()
+            tables = engine.import_excel(Path(fname))
+            t2 = time.time()
+            logging.info(f'导入Excel文件成功！【{fname}】共[{len(tables)}]个表[{sum(table.rows_count for table in tables)}行]，用时[{(t2 - t1):.2f}s]：'
+                         + ' '.join([f'[{table.table_name}]' for table in tables]))
+        t1 = time.time()
+        cursor = engine.execute_script(_read_script(args.script, args.encoding))
+        t2 = time.time()
+        logging.info(f'执行SQL成功！执行用时[{(t2 - t1):.2f}s]')
+        if args.save:
+            result = engine.save_workspace(Path(args.save))
+            logging.info(f'保存工作区成功！【{args.save}】[{result["size"] / 1024 ** 2:.1f}MB]，用时[{result["time"]:.2f}s]')
+        if cursor is None or not cursor.description:
+            if args.output:
+                logging.warning('最后一条SQL没有返回查询结果，没有导出文件！')
+            return 0
+        if args.output:
+            result = engine.export_cursor(cursor, Path(args.output), args.sheet, args.append)
+            logging.info(f'导出成功！已导出为文件【{args.output}】，共[{result["rows"]}行]，用时[{result["time"]:.2f}s]')
+        else:
+            writer = csv.writer(sys.stdout)
+            writer.writerow([desc[0] for desc in cursor.description])
+            for rows in iter_cursor_batches(cursor, engine.FETCH_BATCH_SIZE):
+                writer.writerows(rows)
+        return 0
+    finally:
+        engine.close()
+
+
+def main(argv: list[str] = None) -> int:
+    args = _make_parser().parse_args(argv)
+    try:
+        return run(args)
+    except Exception as ex:
+        logging.error(f'执行失败！ {str(ex)}')
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,81 +12,132 @@ import re
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import (QColor, QFont, QFontDatabase,
                          QSyntaxHighlighter, QTextCharFormat)
+from sql_tokenizer import tokenize, KEYWORDS
+
+# 跨行的注释、字符串、标识符，用block state记录上一行结束时在哪种结构中
+STATE_NORMAL = 0
+STATE_COMMENT = 1 # /* */
+STATE_STRING = 2 # ''
+STATE_DOUBLE_QUOTED = 3 # ""
+STATE_BRACKET = 4 # []
+STATE_BACKTICK = 5 # ``
+
+# 上一行没有结束的结构，在这一行中结束的部分
+_CONTINUE_PATTERNS = {
+    STATE_COMMENT: re.compile(r'.*?\*/'),
+    STATE_STRING: re.compile(r"(?:[^']|'')*'"),
+    STATE_DOUBLE_QUOTED: re.compile(r'(?:[^"]|"")*"'),
+    STATE_BRACKET: re.compile(r'[^\]]*\]'),
+    STATE_BACKTICK: re.compile(r'(?:[^`]|``)*`'),
+}
+# 完整结束的结构
+_CLOSED_PATTERNS = {
+    STATE_COMMENT: re.compile(r'/\*.*\*/', re.DOTALL),
+    STATE_STRING: re.compile(r"[xX]?'(?:[^']|'')*'"),
+    STATE_DOUBLE_QUOTED: re.compile(r'"(?:[^"]|"")*"'),
+    STATE_BRACKET: re.compile(r'\[[^\]]*\]'),
+    STATE_BACKTICK: re.compile(r'`(?:[^`]|``)*`'),
+}
+
+
+def _token_state(kind: str, text: str) -> int:
+    '''
+    词法单元对应的跨行状态，单行的结构返回STATE_NORMAL
+    '''
+    if kind == 'comment' and text.startswith('/*'):
+        return STATE_COMMENT
+    if kind == 'string':
+        return STATE_STRING
+    if kind == 'quoted':
+        return {'"': STATE_DOUBLE_QUOTED, '[': STATE_BRACKET, '`': STATE_BACKTICK}[text[0]]
+    return STATE_NORMAL
 
 
 class SqlHighlighter(QSyntaxHighlighter):
+    '''
+    SQL语法高亮
+    每一行用sql_tokenizer分词，关键词和表名用集合查找，格式只在初始化时创建一次
+    没有结束的多行注释和字符串用block state传到下一行，修改一行时只有状态变化才会重新高亮后面的行
+    '''
     def __init__(self, editor, parent=None):
         QSyntaxHighlighter.__init__(self, parent)
-        self._keywords = ['ABORT', 'ACTION', 'ADD', 'AFTER', 'ALL',
-            'ALTER', 'ANALYZE', 'AND', 'AS', 'ASC', 'ATTACH', 'AUTOINCREMENT',
-            'BEFORE', 'BEGIN', 'BETWEEN', 'BY', 'CASCADE', 'CASE', 'CAST', 'CHECK',
-            'COLLATE', 'COLUMN', 'COMMIT', 'CONFLICT', 'CONSTRAINT', 'CREATE',
-            'CROSS', 'CURRENT_DATE', 'CURRENT_TIME', 'CURRENT_TIMESTAMP',
-            'DATABASE', 'DEFAULT', 'DEFERRABLE', 'DEFERRED', 'DELETE', 'DESC',
-            'DETACH', 'DISTINCT', 'DROP', 'EACH', 'ELSE', 'END', 'ESCAPE', 'EXCEPT',
-            'EXCLUSIVE', 'EXISTS', 'EXPLAIN', 'FAIL', 'FOR', 'FOREIGN', 'FROM',
-            'FULL', 'GLOB', 'GROUP', 'HAVING', 'IF', 'IGNORE', 'IMMEDIATE', 'IN', 'INDEX',
-            'INDEXED', 'INITIALLY', 'INNER', 'INSERT', 'INSTEAD',
-            'INTERSECT', 'INTO', 'IS', 'ISNULL', 'JOIN', 'KEY', 'LEFT', 'LIKE',
-            'LIMIT', 'MATCH', 'NATURAL', 'NO', 'NOT', 'NOTNULL', 'NULL', 'OF',
-            'OFFSET', 'ON', 'OR', 'ORDER', 'OUTER', 'PLAN', 'PRAGMA', 'PRIMARY', 
-            'QUERY', 'RAISE', 'RECURSIVE', 'REFERENCES', 'REGEXP', 'REINDEX', 'RELEASE',
-            'RENAME', 'REPLACE', 'RESTRICT', 'RIGHT', 'ROLLBACK', 'ROW', 'SAVEPOINT', 
-            'SELECT', 'SET', 'TABLE', 'TEMP', 'TEMPORARY', 'THEN', 'TO', 'TRANSACTION', 
-            'TRIGGER', 'UNION', 'UNIQUE', 'UPDATE', 'USING', 'VACUUM', 'VALUES', 
-            'VIEW', 'VIRTUAL', 'WHEN', 'WHERE', 'WITH', 'WITHOUT']
-        self._mappings = {}
-        self._tables_name = []
+        self._tables_name = frozenset() # 小写的表名，sqlite的表名不区分大小写
+        self._setup_formats()
         self._setup_editor(editor)
 
     def update_tables_name(self, tables_name: list[str]) -> None:
         '''
-        更新所有的tables表名，用于高亮显示
+        更新所有的tables表名，用于高亮显示，表名有变化时才重新高亮
         '''
-        self._tables_name = tables_name
+        tables_name = frozenset(name.lower() for name in tables_name)
+        if tables_name != self._tables_name:
+            self._tables_name = tables_name
+            self.rehighlight()
+
+    def _setup_formats(self) -> None:
+        # keywords
+        self._keyword_format = QTextCharFormat()
+        self._keyword_format.setFontWeight(QFont.Bold)
+        self._keyword_format.setForeground(Qt.darkRed)
+        # 表名和 [xxxx]
+        self._table_format = QTextCharFormat()
+        self._table_format.setForeground(Qt.blue)
+        # 'xxx' 和 "xxx"
+        self._string_format = QTextCharFormat()
+        self._string_format.setForeground(Qt.darkGreen)
+        # 注释
+        self._comment_format = QTextCharFormat()
+        self._comment_format.setForeground(QColor('#808080'))
+        self._comment_format.setFontItalic(True)
+        self._state_formats = {
+            STATE_COMMENT: self._comment_format,
+            STATE_STRING: self._string_format,
+            STATE_DOUBLE_QUOTED: self._string_format,
+            STATE_BRACKET: self._table_format,
+            STATE_BACKTICK: self._table_format,
+        }
 
-    def _add_mapping(self, pattern, format):
-        self._mappings[pattern] = format
+    def _token_format(self, kind: str, value: str, text: str) -> QTextCharFormat:
+        if kind == 'name':
+            if value.upper() in KEYWORDS:
+                return self._keyword_format
+            if value.lower() in self._tables_name:
+                return self._table_format
+            return None
+        if kind == 'quoted':
+            if value.lower() in self._tables_name:
+                return self._table_format
+            return self._state_formats[_token_state(kind, text)]
+        if kind == 'string':
+            return self._string_format
+        if kind == 'comment':
+            return self._comment_format
+        return None
 
     def highlightBlock(self, text):
-        # 关键词和固定格式高亮
-        for pattern, format in self._mappings.items():
-            for match in re.finditer(pattern, text):
-                start, end = match.span()
-                self.setFormat(start, end - start, format)
-        # 动态添加的表格名称高亮
-        tables_pattern = r'\b(?:{})\b'.format('|'.join(self._tables_name))
-        tables_format = QTextCharFormat()
-        tables_format.setForeground(Qt.blue)
-        for match in re.finditer(tables_pattern, text):
-            start, end = match.span()
-            self.setFormat(start, end - start, tables_format)
+        start = 0
+        state = self.previousBlockState()
+        if state in _CONTINUE_PATTERNS:
+            # 上一行没有结束的注释或字符串
+            match = _CONTINUE_PATTERNS[state].match(text)
+            if not match:
+                self.setFormat(0, len(text), self._state_formats[state])
+                self.setCurrentBlockState(state)
+                return
+            start = match.end()
+            self.setFormat(0, start, self._state_formats[state])
+        token = None
+        for token in tokenize(text[start:]):
+            format = self._token_format(token.kind, token.value, token.text)
+            if format is not None:
+                self.setFormat(start + token.start, len(token.text), format)
+        # 只有最后一个词法单元可能没有结束
+        state = _token_state(token.kind, token.text) if token else STATE_NORMAL
+        if state != STATE_NORMAL and _CLOSED_PATTERNS[state].fullmatch(token.text):
+            state = STATE_NORMAL
+        self.setCurrentBlockState(state)
 
     def _setup_editor(self, editor):
-        # keywords
-        class_format = QTextCharFormat()
-        class_format.setFontWeight(QFont.Bold)
-        class_format.setForeground(Qt.darkRed)
-        pattern = r'\b(?i:{})\b'.format('|'.join(self._keywords))
-        self._add_mapping(pattern, class_format)
-        # [xxxx]
-        function_format = QTextCharFormat()
-        # function_format.setFontItalic(True)
-        function_format.setForeground(Qt.blue)
-        pattern = r'\[([^\]]*)\]'
-        self._add_mapping(pattern, function_format)
-        # 'xxx' 和 "xxx"
-        function_format = QTextCharFormat()
-        # function_format.setFontItalic(False)
-        function_format.setForeground(Qt.darkGreen)
-        pattern = r'\'([^\]]*)\''
-        self._add_mapping(pattern, function_format)
-        pattern = r'\"([^\]]*)\"'
-        self._add_mapping(pattern, function_format)
-        # comment_format = QTextCharFormat()
-        # comment_format.setBackground(QColor("#77ff77"))
-        # self._add_mapping(r'^\s*#.*$', comment_format)
-
         font = QFontDatabase.systemFont(QFontDatabase.FixedFont)
         editor.setFont(font)
         self.setDocument(editor.document())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: sql_script.py
+# @Time: 2023/11/25 10:05:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import time
+import sqlite3
+from collections import namedtuple
+from typing import Callable
+from sql_tokenizer import significant_tokens, is_keyword, split_statements
+
+# 一条语句的执行结果
+# index: 在脚本中的序号，从0开始
+# time: 执行用时，返回结果的语句包括获取数据的用时
+# rows: 查询返回的行数、修改数据的语句影响的行数，其他语句（CREATE、DROP）为None
+# kind: result 显示结果的查询，query 其他查询，change 修改数据的语句，other 其他语句
+StatementResult = namedtuple('StatementResult', ['index', 'sql', 'time', 'rows', 'kind'])
+
+# 脚本自己控制事务的语句，以及不能在事务中执行的语句，有这些语句时不再包一层事务
+_TRANSACTION_KEYWORDS = ('BEGIN', 'COMMIT', 'END', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'VACUUM', 'ATTACH', 'DETACH')
+_QUERY_START = ('SELECT', 'VALUES', 'WITH')
+_SAVEPOINT_NAME = 'sql_for_excel_statement'
+_COUNT_BATCH_SIZE = 5000
+
+
+class ScriptError(Exception):
+    '''
+    一条语句执行失败，results是前面已经执行成功的语句，line、offset是这条语句在脚本中的行号（从1开始）和字符位置
+    rolled_back为True时整个事务已经回滚，前面的语句也没有保存
+    '''
+    def __init__(self, index: int, line: int, sql: str, error: Exception, results: list[StatementResult], rolled_back: bool,
+                 offset: int = None) -> None:
+        super(__class__, self).__init__(f'第[{index + 1}]条语句（第[{line}]行）执行失败：{str(error)}')
+        self.index = index
+        self.line = line
+        self.offset = offset
+        self.sql = sql
+        self.error = error
+        self.results = results
+        self.rolled_back = rolled_back
+
+
+def _count_rows(cursor: sqlite3.Cursor) -> int:
+    rows = 0
+    while True:
+        batch = cursor.fetchmany(_COUNT_BATCH_SIZE)
+        if not batch:
+            return rows
+        rows += len(batch)
+
+
+class ScriptRunner:
+    '''
+    执行编辑器中多条SQL组成的脚本，用词法分析按分号拆分语句，依次执行
+    所有语句在一个显式的事务中执行，一条语句失败时回滚整个事务，脚本停止执行，前面的语句也不保存；
+    每条语句一个保存点，取消执行时只回滚正在执行的语句，前面执行完成的语句提交
+    脚本中有BEGIN、COMMIT等语句时按脚本自己的事务执行
+    最后一条查询语句（SELECT/VALUES/WITH开头）的结果交给on_result显示，其他查询只统计行数
+    '''
+    def __init__(self, sql: str) -> None:
+        self._statements = split_statements(sql)
+        self._lines = []
+        self._offsets = []
+        position = 0
+        for statement in self._statements:
+            position = sql.find(statement, position)
+            self._lines.append(sql.count('\n', 0, position) + 1)
+            self._offsets.append(position)
+            position += len(statement)
+        first_tokens = [next(iter(significant_tokens(statement)), None) for statement in self._statements]
+        query_indexes = [index for index, token in enumerate(first_tokens) if token and is_keyword(token, *_QUERY_START)]
+        # 没有查询语句时最后一条语句有返回结果（INSERT ... RETURNING、PRAGMA）也显示
+        self._result_index = query_indexes[-1] if query_indexes else len(self._statements) - 1
+        self._managed = not any(token and is_keyword(token, *_TRANSACTION_KEYWORDS) for token in first_tokens)
+
+    @property
+    def statements(self) -> list[str]:
+        return self._statements
+
+    @property
+    def result_index(self) -> int:
+        return self._result_index
+
+    def run(self, conn: sqlite3.Connection, on_result: Callable[[sqlite3.Cursor], int] = None,
+            on_statement: Callable[[StatementResult], None] = None, cancelled: Callable[[], bool] = None) -> list[StatementResult]:
+        '''
+        执行所有语句，返回每条语句的执行结果，取消时停止执行后面的语句，已经执行完成的语句提交
+        on_result(cursor)获取显示结果的查询的数据，返回行数；on_statement在每条语句执行完成后调用
+        失败时抛出ScriptError
+        '''
+        results = []
+        managed = self._managed and not conn.in_transaction
+        if managed:
+            conn.execute('BEGIN')
+        try:
+            for index, statement in enumerate(self._statements):
+                if cancelled and cancelled():
+                    break
+                t1 = time.time()
+                if managed:
+                    conn.execute(f'SAVEPOINT {_SAVEPOINT_NAME}')
+                try:
+                    cursor = conn.execute(statement)
+                    if cursor.description is None:
+                        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+                        kind = 'other' if rows is None else 'change'
+                    elif index == self._result_index and on_result:
+                        rows, kind = on_result(cursor), 'result'
+                    else:
+                        rows, kind = _count_rows(cursor), 'query'
+                    cursor.close()
+                    if managed:
+                        conn.execute(f'RELEASE {_SAVEPOINT_NAME}')
+                except sqlite3.Error as ex:
+                    # 中断修改数据的语句时sqlite会自动回滚整个事务，保存点也不存在了
+                    if managed and conn.in_transaction:
+                        if cancelled and cancelled():
+                            conn.execute(f'ROLLBACK TO {_SAVEPOINT_NAME}')
+                            conn.execute(f'RELEASE {_SAVEPOINT_NAME}')
+                        else:
+                            conn.rollback()
+                    rolled_back = managed and not conn.in_transaction
+                    raise ScriptError(index, self._lines[index], statement, ex, results, rolled_back, self._offsets[index])
+                result = StatementResult(index, statement, time.time() - t1, rows, kind)
+                results.append(result)
+                if on_statement:
+                    on_statement(result)
+        finally:
+            if managed and conn.in_transaction:
+                conn.commit()
+        return results
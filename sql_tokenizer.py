@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: sql_tokenizer.py
+# @Time: 2023/09/09 14:25:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import re
+import sqlite3
+from collections import namedtuple
+from typing import Iterator
+
+# sqlite的关键词，语法高亮和自动补全使用
+KEYWORDS = frozenset(['ABORT', 'ACTION', 'ADD', 'AFTER', 'ALL',
+    'ALTER', 'ANALYZE', 'AND', 'AS', 'ASC', 'ATTACH', 'AUTOINCREMENT',
+    'BEFORE', 'BEGIN', 'BETWEEN', 'BY', 'CASCADE', 'CASE', 'CAST', 'CHECK',
+    'COLLATE', 'COLUMN', 'COMMIT', 'CONFLICT', 'CONSTRAINT', 'CREATE',
+    'CROSS', 'CURRENT_DATE', 'CURRENT_TIME', 'CURRENT_TIMESTAMP',
+    'DATABASE', 'DEFAULT', 'DEFERRABLE', 'DEFERRED', 'DELETE', 'DESC',
+    'DETACH', 'DISTINCT', 'DROP', 'EACH', 'ELSE', 'END', 'ESCAPE', 'EXCEPT',
+    'EXCLUSIVE', 'EXISTS', 'EXPLAIN', 'FAIL', 'FOR', 'FOREIGN', 'FROM',
+    'FULL', 'GLOB', 'GROUP', 'HAVING', 'IF', 'IGNORE', 'IMMEDIATE', 'IN', 'INDEX',
+    'INDEXED', 'INITIALLY', 'INNER', 'INSERT', 'INSTEAD',
+    'INTERSECT', 'INTO', 'IS', 'ISNULL', 'JOIN', 'KEY', 'LEFT', 'LIKE',
+    'LIMIT', 'MATCH', 'NATURAL', 'NO', 'NOT', 'NOTNULL', 'NULL', 'OF',
+    'OFFSET', 'ON', 'OR', 'ORDER', 'OUTER', 'PLAN', 'PRAGMA', 'PRIMARY', 
+    'QUERY', 'RAISE', 'RECURSIVE', 'REFERENCES', 'REGEXP', 'REINDEX', 'RELEASE',
+    'RENAME', 'REPLACE', 'RESTRICT', 'RIGHT', 'ROLLBACK', 'ROW', 'SAVEPOINT', 
+    'SELECT', 'SET', 'TABLE', 'TEMP', 'TEMPORARY', 'THEN', 'TO', 'TRANSACTION', 
+    'TRIGGER', 'UNION', 'UNIQUE', 'UPDATE', 'USING', 'VACUUM', 'VALUES', 
+    'VIEW', 'VIRTUAL', 'WHEN', 'WHERE', 'WITH', 'WITHOUT'])
+
+# SQL词法单元
+# kind: space comment string quoted name number param op
+#   quoted: 用 "" [] `` 括起来的标识符
+#   name: 没有括起来的标识符或者关键词
+# value: 标识符去掉引号后的名称，其他类型和text相同
+# text: 原始文本
+# start: 在原始SQL中的位置
+Token = namedtuple('Token', ['kind', 'value', 'text', 'start'])
+
+_TOKEN_PATTERN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>[xX]?'(?:[^']|'')*(?:'|\Z))
+  | (?P<quoted>"(?:[^"]|"")*(?:"|\Z)|\[[^\]]*(?:\]|\Z)|`(?:[^`]|``)*(?:`|\Z))
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_\u0080-\U0010ffff][\w$\u0080-\U0010ffff]*)
+  | (?P<param>\?\d*|[:@$][A-Za-z_\u0080-\U0010ffff][\w$\u0080-\U0010ffff]*)
+  | (?P<op>->>|->|\|\||<<|>>|<=|>=|==|!=|<>|.)
+''', re.VERBOSE | re.DOTALL)
+
+
+def _unquote(text: str) -> str:
+    if text[0] == '[':
+        return text[1:-1] if text.endswith(']') else text[1:]
+    quote = text[0]
+    body = text[1:-1] if len(text) > 1 and text.endswith(quote) else text[1:]
+    return body.replace(quote * 2, quote)
+
+
+def tokenize(sql: str) -> Iterator[Token]:
+    '''
+    把SQL拆分成词法单元，没有结束的字符串、注释、标识符一直延续到SQL末尾
+    '''
+    for match in _TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        text = match.group()
+        value = _unquote(text) if kind == 'quoted' else text
+        yield Token(kind, value, text, match.start())
+
+
+def significant_tokens(sql: str) -> list[Token]:
+    '''
+    去掉空白和注释后的词法单元
+    '''
+    return [token for token in tokenize(sql) if token.kind not in ('space', 'comment')]
+
+
+def is_identifier(token: Token) -> bool:
+    return token.kind in ('name', 'quoted')
+
+
+def is_keyword(token: Token, *keywords: str) -> bool:
+    return token.kind == 'name' and token.value.upper() in keywords
+
+
+def strip_trailing_semicolons(sql: str) -> str:
+    '''
+    去掉SQL末尾的分号、空白和注释，用于把SQL作为子查询
+    '''
+    end = 0
+    for token in tokenize(sql):
+        if token.kind not in ('space', 'comment') and token.text != ';':
+            end = token.start + len(token.text)
+    return sql[:end]
+
+
+def split_statements(sql: str) -> list[str]:
+    '''
+    按分号拆分多条SQL，字符串、注释、标识符中的分号不拆分
+    CREATE TRIGGER 的 BEGIN ... END 中的分号用sqlite3.complete_statement判断
+    返回去掉首尾空白的语句，只有空白和注释的部分会被忽略
+    '''
+    statements = []
+    start = 0
+
+    def add(end: int) -> None:
+        statement = sql[start:end].strip()
+        if any(token.kind not in ('space', 'comment') and token.text != ';' for token in tokenize(statement)):
+            statements.append(statement)
+
+    for token in tokenize(sql):
+        if token.text == ';' and sqlite3.complete_statement(sql[start:token.start + 1]):
+            add(token.start + 1)
+            start = token.start + 1
+    add(len(sql))
+    return statements
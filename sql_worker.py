@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: sql_worker.py
+# @Time: 2023/08/05 21:30:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import sqlite3
+import time
+from PyQt5.QtCore import QThread, pyqtSignal
+from index_advisor import IndexSuggestion, create_index, time_query
+from query_profiler import get_query_plan, get_scanned_tables, estimate_rows_scanned
+from sql_engine import SqlEngine, materialize_query
+from result_store import ResultChunk
+from column_profile import profile_table
+from sql_script import ScriptRunner, ScriptError
+
+
+class SqlWorker(QThread):
+    '''
+    在后台线程中执行SQL，使用独立的数据库连接（连接到engine的数据库）
+    多条语句组成的脚本用ScriptRunner在一个事务中依次执行，每条语句执行完成后发送执行结果
+    最后一条查询的结果用fetchmany分批获取，转换成列式的ResultChunk后发送给界面，第一批数据很小，保证能尽快显示出来
+    '''
+    FIRST_BATCH_SIZE = 200
+    BATCH_SIZE = 5000
+    PROGRESS_STEPS = 1000 # 每执行多少条sqlite虚拟机指令检查一次是否取消，同时用于统计执行的指令数
+
+    columns_ready = pyqtSignal(object) # list[str] 查询结果的列
+    rows_fetched = pyqtSignal(object) # ResultChunk 一批查询结果
+    query_finished = pyqtSignal(object) # dict 执行用时、获取数据用时、执行计划、指令数、扫描行数、每条语句的执行结果
+    query_failed = pyqtSignal(str)
+    statement_finished = pyqtSignal(object) # StatementResult 一条语句执行完成
+
+    def __init__(self, engine: SqlEngine, sql: str, indexes: list[IndexSuggestion] = None, parent=None) -> None:
+        super(__class__, self).__init__(parent)
+        self._engine = engine
+        self._tables_name = engine.catalog.tables_name() # 用于统计全表扫描的表
+        self._sql = sql
+        self._runner = ScriptRunner(sql)
+        self._indexes = indexes or [] # 执行前先创建的索引
+        self._conn = None
+        self._cancelled = False
+        self._vm_steps = 0
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    @property
+    def indexes(self) -> list[IndexSuggestion]:
+        return self._indexes
+
+    @property
+    def statements_count(self) -> int:
+        return len(self._runner.statements)
+
+    def cancel(self) -> None:
+        '''
+        取消执行，可以在界面线程中调用
+        '''
+        self._cancelled = True
+        conn = self._conn
+        if conn:
+            conn.interrupt()
+
+    def _progress_handler(self) -> int:
+        # 返回非0时sqlite会中止当前的语句
+        self._vm_steps += self.PROGRESS_STEPS
+        return 1 if self._cancelled else 0
+
+    def _profile(self, timings: dict) -> None:
+        # 执行完成后统计指令数，估算扫描的行数，不计入执行用时
+        timings['vm_steps'] = self._vm_steps
+        try:
+            timings['scanned_tables'] = get_scanned_tables(timings['plan'], self._tables_name,
+                                                           self._runner.statements[self._runner.result_index])
+            timings['rows_scanned'] = estimate_rows_scanned(self._conn, timings['scanned_tables'])
+        except sqlite3.Error:
+            pass
+
+    def _fetch_result(self, cursor: sqlite3.Cursor, timings: dict) -> int:
+        '''
+        分批获取显示结果的查询的数据，返回行数
+        '''
+        # 前面的语句可能创建了这条查询用到的表，执行到这里才能分析执行计划，分析的指令不计入
+        vm_steps = self._vm_steps
+        timings['plan'] = get_query_plan(self._conn, self._runner.statements[self._runner.result_index])
+        self._vm_steps = vm_steps
+        t2 = time.time()
+        columns = [desc[0] for desc in cursor.description]
+        self.columns_ready.emit(columns)
+        batch_size = self.FIRST_BATCH_SIZE
+        while not self._cancelled:
+            rows = cursor.fetchmany(batch_size)
+            if rows:
+                timings['rows'] += len(rows)
+                self.rows_fetched.emit(ResultChunk(rows, len(columns)))
+            if len(rows) < batch_size:
+                break
+            batch_size = self.BATCH_SIZE
+        timings['fetch'] = time.time() - t2
+        return timings['rows']
+
+    def run(self) -> None:
+        timings = {'execute': 0.0, 'fetch': 0.0, 'rows': 0, 'index': 0.0, 'indexes': [],
+                   'plan': [], 'vm_steps': None, 'scanned_tables': [], 'rows_scanned': None, 'statements': []}
+        try:
+            self._conn = self._engine.connect()
+            self._conn.set_progress_handler(self._progress_handler, self.PROGRESS_STEPS)
+            t0 = time.time()
+            for suggestion in self._indexes:
+                timings['indexes'].append(create_index(self._conn, suggestion.table_name, suggestion.columns))
+            timings['index'] = time.time() - t0
+            self._vm_steps = 0
+            t1 = time.time()
+            timings['statements'] = self._runner.run(self._conn, lambda cursor: self._fetch_result(cursor, timings),
+                                                     self.statement_finished.emit, lambda: self._cancelled)
+            timings['execute'] = time.time() - t1 - timings['fetch']
+            self._profile(timings)
+            self.query_finished.emit(timings)
+        except ScriptError as ex:
+            if self._cancelled:
+                error = '已取消执行！'
+            elif len(self._runner.statements) == 1:
+                error = str(ex.error)
+            else:
+                saved = '前面的语句也已经回滚' if ex.rolled_back else f'前面[{len(ex.results)}]条语句已经提交'
+                error = f'{str(ex)}，{saved}'
+            self.query_failed.emit(error)
+        except sqlite3.Error as ex:
+            self.query_failed.emit('已取消执行！' if self._cancelled else str(ex))
+        finally:
+            conn, self._conn = self._conn, None
+            if conn:
+                conn.close()
+
+
+class IndexWorker(QThread):
+    '''
+    在后台线程中创建索引，并对比创建索引前后执行SQL的用时
+    '''
+    index_finished = pyqtSignal(object) # dict 创建索引前后的用时和创建的索引
+    index_failed = pyqtSignal(str)
+
+    def __init__(self, engine: SqlEngine, sql: str, indexes: list[IndexSuggestion], parent=None) -> None:
+        super(__class__, self).__init__(parent)
+        self._engine = engine
+        self._sql = sql
+        self._indexes = indexes
+        self._conn = None
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        conn = self._conn
+        if conn:
+            conn.interrupt()
+
+    def run(self) -> None:
+        try:
+            self._conn = self._engine.connect()
+            conn = self._conn
+            result = {'before': time_query(conn, self._sql), 'indexes': []}
+            t1 = time.time()
+            for suggestion in self._indexes:
+                result['indexes'].append(create_index(conn, suggestion.table_name, suggestion.columns))
+            result['index'] = time.time() - t1
+            result['after'] = time_query(conn, self._sql)
+            self.index_finished.emit(result)
+        except sqlite3.Error as ex:
+            self.index_failed.emit('已取消！' if self._cancelled else str(ex))
+        finally:
+            conn, self._conn = self._conn, None
+            if conn:
+                conn.close()
+
+
+class MaterializeWorker(QThread):
+    '''
+    在后台线程中用查询结果创建新表或视图，大的中间结果不需要取到界面再导出
+    '''
+    materialize_finished = pyqtSignal(object) # dict 名称、列、行数、用时
+    materialize_failed = pyqtSignal(str)
+
+    def __init__(self, engine: SqlEngine, sql: str, name: str, as_view: bool = False, parent=None) -> None:
+        super(__class__, self).__init__(parent)
+        self._engine = engine
+        self._sql = sql
+        self._name = name
+        self._as_view = as_view
+        self._conn = None
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        conn = self._conn
+        if conn:
+            conn.interrupt()
+
+    def run(self) -> None:
+        try:
+            self._conn = self._engine.connect()
+            self.materialize_finished.emit(materialize_query(self._conn, self._sql, self._name, self._as_view))
+        except sqlite3.Error as ex:
+            self.materialize_failed.emit('已取消！' if self._cancelled else str(ex))
+        finally:
+            conn, self._conn = self._conn, None
+            if conn:
+                conn.close()
+
+
+class ProfileWorker(QThread):
+    '''
+    在后台线程中扫描一遍表，统计每一列的空值、最小值、最大值、不同值个数和常见值
+    '''
+    profile_finished = pyqtSignal(object) # dict 表名、每一列的ColumnProfile、用时
+    profile_failed = pyqtSignal(str)
+
+    def __init__(self, engine: SqlEngine, table_name: str, parent=None) -> None:
+        super(__class__, self).__init__(parent)
+        self._engine = engine
+        self._table_name = table_name
+        self._conn = None
+        self._cancelled = False
+
+    @property
+    def table_name(self) -> str:
+        return self._table_name
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        conn = self._conn
+        if conn:
+            conn.interrupt()
+
+    def run(self) -> None:
+        try:
+            t1 = time.time()
+            self._conn = self._engine.connect()
+            profiles = profile_table(self._conn, self._table_name, cancelled=lambda: self._cancelled)
+            if profiles is None:
+                self.profile_failed.emit('已取消！')
+                return
+            self.profile_finished.emit({'table': self._table_name, 'profiles': profiles, 'time': time.time() - t1})
+        except sqlite3.Error as ex:
+            self.profile_failed.emit('已取消！' if self._cancelled else str(ex))
+        finally:
+            conn, self._conn = self._conn, None
+            if conn:
+                conn.close()
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: conftest.py
+# @Time: 2023/12/16 10:00:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import sys
+import sqlite3
+from pathlib import Path
+import pytest
+
+# 模块都在仓库根目录下
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    yield conn
+    conn.close()
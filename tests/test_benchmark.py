@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_benchmark.py
+# @Time: 2023/12/17 17:10:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+from benchmark import compare_reports
+
+
+def _report(insert: float, peak: float) -> dict:
+    return {'results': {'1000': {'generate': 9.0, 'insert': insert, 'query_filter': 0.001, 'peak_rss_mb': peak}}}
+
+
+def test_compare_reports_thresholds():
+    base = _report(1.0, 100.0)
+    assert compare_reports(base, _report(1.05, 115.0), 0.1, 0.05, 0.2) == []
+    regressions = compare_reports(base, _report(1.2, 130.0), 0.1, 0.05, 0.2)
+    assert [regression.split(':')[0] for regression in regressions] == ['[1000行] insert', '[1000行] peak_rss_mb']
+    # 内存不受min_seconds影响
+    assert compare_reports(base, _report(1.0, 130.0), 0.1, 1000.0, 0.2) == ['[1000行] peak_rss_mb: 100.000 -> 130.000 (+30%)']
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_column_types.py
+# @Time: 2023/12/17 10:30:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import datetime
+from column_types import infer_column_types, widen_column_type, convert_rows, typed_rows
+
+
+def test_infer_column_types():
+    rows = [(1, '2.5', '2023-01-02', '0012', None, '123456789012345678', True),
+            ('3', 4, datetime.date(2023, 1, 3), '15', None, '1', False),
+            (5.0, '', '2023-01-04 10:00:00', 'x', None, '2', None)]
+    assert infer_column_types(7, rows) == ['INTEGER', 'REAL', 'DATE', 'TEXT', 'TEXT', 'TEXT', 'TEXT']
+
+
+def test_widen_column_type():
+    assert widen_column_type('INTEGER', ['1.5']) == 'REAL'
+    assert widen_column_type('INTEGER', ['0012']) == 'TEXT'
+    assert widen_column_type('REAL', [3, None, '']) == 'REAL'
+    assert widen_column_type('DATE', ['2023-01-01', 1]) == 'TEXT'
+    assert widen_column_type('TEXT', [1]) == 'TEXT'
+
+
+def test_convert_rows():
+    column_types = ['INTEGER', 'REAL', 'DATE', 'TEXT']
+    rows = [('1', '2.5', '2023-01-02 00:00:00', 3), (None, 4, datetime.datetime(2023, 1, 3, 8, 30), None)]
+    assert list(convert_rows(column_types, rows)) == [(1, 2.5, '2023-01-02', '3'), (None, 4.0, '2023-01-03 08:30:00', None)]
+    assert column_types == ['INTEGER', 'REAL', 'DATE', 'TEXT']
+
+
+def test_typed_rows_widens_after_sample():
+    # 样本之后出现0开头的编号，这一列放宽成TEXT，不会被sqlite转换成12
+    rows = [(str(index), str(index)) for index in range(1, 11)] + [('0012', '1.5')]
+    column_types, converted = typed_rows(['code', 'value'], rows, sample_size=10)
+    assert column_types == ['INTEGER', 'INTEGER']
+    converted = list(converted)
+    assert column_types == ['TEXT', 'REAL']
+    assert converted[-1] == ('0012', 1.5) and converted[0] == ('1', 1.0)
+
+
+def test_widen_keeps_converted_batches(monkeypatch):
+    import column_types as module
+    monkeypatch.setattr(module, '_CONVERT_BATCH_SIZE', 2)
+    column_types = ['INTEGER']
+    converted = list(convert_rows(column_types, [('1',), ('2',), ('x',)]))
+    # 前面的批已经按INTEGER转换，调用方按放宽后的类型修改表结构
+    assert converted == [(1,), (2,), ('x',)] and column_types == ['TEXT']
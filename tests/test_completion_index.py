@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_completion_index.py
+# @Time: 2023/12/17 10:50:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import random
+from completion_index import PrefixTrie, CompletionIndex, quote_identifier
+
+
+def test_trie_search_and_remove():
+    words = ['select', 'Selection', 'self', 'set', 'sum', 'Orders', 'order_id']
+    trie = PrefixTrie(words)
+    assert len(trie) == len(words)
+    assert trie.search('SEL') == ['select', 'Selection', 'self']
+    assert trie.search('sele', limit=1) == ['select']
+    assert trie.search('x') == [] and trie.search('selectx') == []
+    assert trie.search('') == sorted(words, key=str.lower)
+    assert trie.remove('self') and not trie.remove('self') and not trie.remove('sel')
+    assert trie.search('sel') == ['select', 'Selection']
+
+
+def test_trie_reference_count():
+    trie = PrefixTrie()
+    trie.add('id')
+    trie.add('id')
+    assert len(trie) == 1
+    trie.remove('id')
+    assert trie.search('i') == ['id']
+    trie.remove('id')
+    assert trie.search('i') == [] and len(trie) == 0
+
+
+def test_trie_matches_sorted_list():
+    rng = random.Random(7)
+    words = {''.join(rng.choice('abc') for _ in range(rng.randint(1, 6))) for _ in range(300)}
+    trie = PrefixTrie(words)
+    removed = set(rng.sample(sorted(words), 100))
+    for word in removed:
+        trie.remove(word)
+    remaining = sorted(words - removed)
+    for prefix in ('', 'a', 'ab', 'cab', 'bbbb'):
+        assert trie.search(prefix, limit=1000) == [word for word in remaining if word.startswith(prefix)]
+
+
+def test_quote_identifier():
+    assert quote_identifier('orders') == 'orders'
+    assert quote_identifier('Sheet 2') == '[Sheet 2]'
+    assert quote_identifier('order') == '[order]'
+    assert quote_identifier('a"b', '"') == '"a""b"'
+
+
+def _index() -> CompletionIndex:
+    index = CompletionIndex()
+    index.update_tables({'orders': ['id', 'amount', 'customer_id'], 'customers': ['id', 'name'], 'Sheet 2': ['total']})
+    return index
+
+
+def test_complete_table_after_from():
+    index = _index()
+    sql = 'select * from cu'
+    assert index.complete(sql, len(sql)) == (14, [('customers', 'table', 'customers')])
+    sql = 'select * from orders, '
+    assert [c.name for c in index.complete(sql, len(sql))[1]] == ['customers', 'orders', 'Sheet 2']
+    sql = 'select * from [Sh'
+    assert index.complete(sql, len(sql)) == (14, [('Sheet 2', 'table', '[Sheet 2]')])
+
+
+def test_complete_columns_by_alias():
+    index = _index()
+    sql = 'select o. from orders as o'
+    assert [c.name for c in index.complete(sql, 9)[1]] == ['id', 'amount', 'customer_id']
+    sql = 'select a from orders'
+    start, completions = index.complete(sql, 8)
+    assert start == 7 and completions[0] == ('amount', 'column', 'amount')
+    assert ('as', 'keyword', 'as') in completions
+
+
+def test_no_completion_in_strings_and_without_prefix():
+    index = _index()
+    sql = "select 'ord"
+    assert index.complete(sql, len(sql)) == (len(sql), [])
+    sql = 'select '
+    assert index.complete(sql, len(sql)) == (len(sql), [])
+    assert index.complete(sql, len(sql), force=True)[1]
+
+
+def test_update_tables_removes_columns():
+    index = _index()
+    index.update_tables({'orders': ['id', 'amount']})
+    sql = 'select cu'
+    assert [c for c in index.complete(sql, len(sql))[1] if c.kind != 'keyword'] == []
+    sql = 'select i'
+    assert ('id', 'column', 'id') in index.complete(sql, len(sql))[1]
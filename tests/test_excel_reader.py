@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_excel_reader.py
+# @Time: 2023/12/17 16:00:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import pytest
+from excel_reader import CSV_SAMPLE_SIZE, detect_csv_format, iter_excel_sheets
+
+
+def _read_csv(pname) -> tuple[list[str], list[tuple]]:
+    # 读取下一个表格前文件已经关闭，在循环中读取数据
+    for sheet in iter_excel_sheets(pname):
+        return sheet.columns, list(sheet.rows)
+
+
+def test_detect_csv_format(tmp_path):
+    pname = tmp_path / 'data.csv'
+    pname.write_bytes('名称;数量\n苹果;1\n'.encode('gbk'))
+    assert detect_csv_format(pname) == ('gb18030', ';')
+    pname.write_bytes('名称,数量\n苹果,1\n'.encode('utf-8-sig'))
+    assert detect_csv_format(pname) == ('utf-8-sig', ',')
+    assert _read_csv(pname) == (['名称', '数量'], [('苹果', '1')])
+
+
+def test_gbk_after_ascii_sample(tmp_path):
+    # 样本中只有ASCII字符，按utf-8读取，后面的GBK内容不能用utf-8解码
+    ascii_rows = [f'{index},"line\nbreak {index}",' for index in range(CSV_SAMPLE_SIZE // 10)]
+    text = 'id,note,extra\n' + '\n'.join(ascii_rows) + '\n' + '\n'.join(f'{index},中文{index},是' for index in range(5000)) + '\n'
+    pname = tmp_path / 'data.csv'
+    pname.write_bytes(text.encode('gbk'))
+    assert detect_csv_format(pname).encoding == 'utf-8-sig'
+    columns, rows = _read_csv(pname)
+    assert columns == ['id', 'note', 'extra']
+    assert len(rows) == len(ascii_rows) + 5000
+    assert rows[0] == ('0', 'line\nbreak 0', None) and rows[len(ascii_rows) - 1][0] == str(len(ascii_rows) - 1)
+    assert rows[len(ascii_rows)] == ('0', '中文0', '是') and rows[-1] == ('4999', '中文4999', '是')
+
+
+def test_mixed_utf8_and_gbk(tmp_path):
+    text = 'id,note\n' + '\n'.join(f'{index},x' for index in range(CSV_SAMPLE_SIZE // 4))
+    pname = tmp_path / 'data.csv'
+    pname.write_bytes(text.encode() + '\n1,中文\n'.encode('utf-8') + b'a' * (1024 ** 2) + '\n2,中文\n'.encode('gbk'))
+    with pytest.raises(ValueError):
+        _read_csv(pname)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_index_advisor.py
+# @Time: 2023/12/16 10:00:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import pytest
+from index_advisor import advise_indexes, create_index, find_predicate_columns
+
+
+@pytest.fixture
+def orders(conn):
+    conn.executescript('''
+        CREATE TABLE customers (customer_id INTEGER, region TEXT);
+        CREATE TABLE orders (customer_id INTEGER, amount REAL);
+        CREATE TABLE [Sheet 2] (a INTEGER, b TEXT);
+    ''')
+    return conn
+
+
+def _advise(conn, sql):
+    return [(s.table_name, s.columns) for s in advise_indexes(conn, sql)]
+
+
+def test_filter_on_full_scan(orders):
+    assert _advise(orders, 'select * from customers where region = \'east\'') == [('customers', ['region'])]
+
+
+def test_equal_columns_before_range(orders):
+    assert _advise(orders, 'select * from orders where amount > 5 and customer_id = 1') == [('orders', ['customer_id', 'amount'])]
+
+
+def test_existing_index_is_not_suggested(orders):
+    create_index(orders, 'customers', ['region'])
+    assert _advise(orders, 'select * from customers where region = \'east\'') == []
+
+
+def test_join_only_inner_table(orders):
+    sql = 'select * from customers c join orders o on c.customer_id = o.customer_id'
+    assert _advise(orders, sql) == [('orders', ['customer_id'])]
+
+
+def test_left_join_automatic_index(orders):
+    sql = 'select * from customers c left join orders o on c.customer_id = o.customer_id'
+    assert _advise(orders, sql) == [('orders', ['customer_id'])]
+
+
+def test_left_join_with_where(orders):
+    sql = 'select * from customers c left join orders o on c.customer_id = o.customer_id where c.region = \'east\''
+    assert sorted(_advise(orders, sql)) == [('customers', ['region']), ('orders', ['customer_id'])]
+
+
+def test_left_join_full_scan(orders):
+    orders.execute('PRAGMA automatic_index=OFF')
+    sql = 'select * from customers c left join orders o on c.customer_id = o.customer_id'
+    assert _advise(orders, sql) == [('orders', ['customer_id'])]
+
+
+def test_table_name_with_space(orders):
+    assert _advise(orders, 'select * from [Sheet 2] where a = 1') == [('Sheet 2', ['a'])]
+    assert _advise(orders, 'select * from [Sheet 2] s where s.b like \'x%\'') == [('Sheet 2', ['b'])]
+
+
+def test_predicate_columns(orders):
+    sql = 'select * from customers c join orders o on c.customer_id = o.customer_id where o.amount between 1 and 2'
+    table_columns = {'customers': ['customer_id', 'region'], 'orders': ['customer_id', 'amount']}
+    assert find_predicate_columns(sql, table_columns) == {
+        'customers': [('customer_id', 'join')],
+        'orders': [('customer_id', 'join'), ('amount', 'range')],
+    }
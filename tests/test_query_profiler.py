@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_query_profiler.py
+# @Time: 2023/12/16 11:00:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import pytest
+from query_profiler import get_query_plan, get_scanned_tables, estimate_rows_scanned
+
+
+@pytest.fixture
+def sheets(conn):
+    conn.executescript('''
+        CREATE TABLE [Sheet 2] (id INTEGER, name TEXT);
+        CREATE TABLE orders (customer_id INTEGER, amount REAL);
+        INSERT INTO [Sheet 2] VALUES (1, 'a'), (2, 'b'), (3, 'c');
+        INSERT INTO orders VALUES (1, 1.0), (2, 2.0);
+    ''')
+    return conn
+
+
+def _scanned(conn, sql):
+    return get_scanned_tables(get_query_plan(conn, sql), ['Sheet 2', 'orders'], sql)
+
+
+def test_table_name_with_space(sheets):
+    sql = 'select * from [Sheet 2]'
+    assert _scanned(sheets, sql) == ['Sheet 2']
+    assert estimate_rows_scanned(sheets, ['Sheet 2']) == 3
+
+
+def test_alias(sheets):
+    assert _scanned(sheets, 'select * from [Sheet 2] s where s.name = \'a\'') == ['Sheet 2']
+
+
+def test_left_join(sheets):
+    sheets.execute('PRAGMA automatic_index=OFF')
+    sql = 'select * from [Sheet 2] s left join orders o on s.id = o.customer_id'
+    assert _scanned(sheets, sql) == ['Sheet 2', 'orders']
+
+
+def test_subquery_is_not_a_table(sheets):
+    sql = 'select * from (select id from [Sheet 2] group by id) t'
+    assert _scanned(sheets, sql) == ['Sheet 2']
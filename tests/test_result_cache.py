@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_result_cache.py
+# @Time: 2023/12/17 09:50:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+from sql_tokenizer import significant_tokens
+from result_cache import ResultCache, normalize_sql, is_cacheable, referenced_tables
+
+
+def test_normalize_sql():
+    first = normalize_sql(significant_tokens('select  a, "B" -- comment\nfrom t where c = \'x\';'))
+    second = normalize_sql(significant_tokens('SELECT A,\n"B" FROM T /* other */ WHERE C = \'x\''))
+    assert first == second
+    # 字符串和加了引号的标识符区分大小写
+    assert normalize_sql(significant_tokens("select 'X'")) != normalize_sql(significant_tokens("select 'x'"))
+    assert normalize_sql(significant_tokens('select "b"')) != normalize_sql(significant_tokens('select "B"'))
+
+
+def test_is_cacheable():
+    for sql in ('select * from t', 'with x as (select 1) select * from x', 'values (1)', "select replace(a, 'x', 'y') from t"):
+        assert is_cacheable(significant_tokens(sql)), sql
+    for sql in ('delete from t', 'select 1; select 2', 'select random()', 'select current_date', "select date('now')",
+                'with x as (select 1) insert into t select * from x', 'replace into t values (1)', ''):
+        assert not is_cacheable(significant_tokens(sql)), sql
+
+
+def test_referenced_tables():
+    tokens = significant_tokens('select o.id from Orders o join [Sheet 2] s on o.id = s.id where o.note = \'customers\'')
+    assert referenced_tables(tokens, ['orders', 'Sheet 2', 'customers']) == ['Sheet 2', 'orders']
+
+
+def test_make_key_changes_with_table_version():
+    cache = ResultCache()
+    tables = ['orders', 'customers']
+    key = cache.make_key('select * from orders', tables)
+    assert cache.make_key('SELECT * FROM ORDERS;', tables) == key
+    assert cache.make_key('delete from orders', tables) is None
+    cache.put(key, ['id'], [(1,), (2,)])
+    assert cache.get(key).rows == [(1,), (2,)]
+    customers_key = cache.make_key('select * from customers', tables)
+    cache.put(customers_key, ['id'], [(3,)])
+    cache.invalidate('Orders')
+    assert cache.get(key) is None and cache.get(customers_key) is not None
+    assert cache.make_key('select * from orders', tables) != key
+    assert cache.make_key('select * from customers', tables) == customers_key
+    cache.invalidate_all()
+    assert len(cache) == 0 and cache.total_bytes == 0
+    assert cache.make_key('select * from customers', tables) != customers_key
+
+
+def test_lru_eviction_and_size_limit():
+    cache = ResultCache(max_bytes=100)
+    cache.put('a', ['x'], [], 40)
+    cache.put('b', ['x'], [], 40)
+    cache.get('a')
+    cache.put('c', ['x'], [], 40)
+    assert cache.get('b') is None and cache.get('a') is not None and cache.get('c') is not None
+    cache.put('d', ['x'], [], 101)
+    assert cache.get('d') is None and cache.total_bytes == 80
+    cache.put('a', ['x'], [], 10)
+    assert cache.total_bytes == 50
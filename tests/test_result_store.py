@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_result_store.py
+# @Time: 2023/12/16 15:40:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import sqlite3
+import pytest
+from result_store import ResultStore, ResultChunk
+from result_cache import ResultCache
+
+
+def _spilled_store(rows_count: int = 100) -> ResultStore:
+    # 第一块放在内存中，后面的都写到临时表
+    store = ResultStore(['id', 'name'], memory_limit=1)
+    store.append_rows([(index, f'name{index}') for index in range(rows_count)])
+    store.append_rows([(index, f'name{index}') for index in range(rows_count, rows_count * 2)])
+    return store
+
+
+def test_spill_keeps_row_order():
+    store = _spilled_store()
+    assert store.spilled_rows and len(store) == 200
+    assert store.row(150) == (150, 'name150')
+    assert store.rows([199, 0, 120]) == [(199, 'name199'), (0, 'name0'), (120, 'name120')]
+    assert [row for batch in store.iter_batches(30) for row in batch] == [(index, f'name{index}') for index in range(200)]
+
+
+def test_close_releases_spill_connection():
+    store = _spilled_store()
+    conn = store._spill_conn
+    store.close()
+    assert store._spill_conn is None
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+
+
+def test_close_waits_for_export():
+    store = _spilled_store()
+    batches = store.iter_batches(50)
+    next(batches)
+    store.close()
+    # 导出线程还在读取时不关闭，读完后关闭
+    assert [row for batch in batches for row in batch][-1] == (199, 'name199')
+    assert store._spill_conn is None
+
+
+def test_close_keeps_memory_rows():
+    store = ResultStore(['id'])
+    store.append_chunk(ResultChunk([(1,), (2,)], 1))
+    store.close()
+    assert store.rows([1, 0]) == [(2,), (1,)]
+
+
+def test_cache_skips_spilled_store():
+    cache = ResultCache()
+    store = _spilled_store()
+    cache.put('key', store.columns, store, store.memory_bytes)
+    assert cache.get('key') is None
+    assert store.row(199) == (199, 'name199')
+
+
+def test_cache_closes_evicted_store():
+    cache = ResultCache(max_bytes=100)
+    first, second = ResultStore(['id']), ResultStore(['id'])
+    cache.put('first', ['id'], first, 60)
+    cache.put('second', ['id'], second, 60)
+    assert cache.get('first') is None and cache.get('second').rows is second
+    assert first._closed and not second._closed and cache.total_bytes == 60
+    cache.invalidate_all()
+    assert second._closed and cache.total_bytes == 0
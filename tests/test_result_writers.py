@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_result_writers.py
+# @Time: 2023/12/16 10:30:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import csv
+import pytest
+from result_writers import open_result_writer
+
+
+def test_csv_writer(tmp_path):
+    pname = tmp_path / 'out.csv'
+    writer = open_result_writer(pname, ['a', 'b'])
+    writer.write_rows([(1, 'x'), (None, '中文')])
+    writer.close()
+    with open(pname, encoding='utf-8-sig', newline='') as f:
+        assert list(csv.reader(f)) == [['a', 'b'], ['1', 'x'], ['', '中文']]
+
+
+def _write_parquet(pname, batches):
+    writer = open_result_writer(pname, ['mixed', 'number', 'fixed'])
+    for batch in batches:
+        writer.write_rows(batch)
+    writer.close()
+    import pyarrow.parquet
+    return pyarrow.parquet.read_table(pname)
+
+
+def test_parquet_mixed_column(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    pname = tmp_path / 'out.parquet'
+    table = _write_parquet(pname, [
+        [(1, 1, 'a'), (2, 2, 'b')],
+        [('0012', 2.5, 'c')],
+        [(3, None, 'd'), (None, 4, 'e')],
+    ])
+    assert table.schema.field('mixed').type == pyarrow.string()
+    assert table.schema.field('number').type == pyarrow.float64()
+    assert table.schema.field('fixed').type == pyarrow.string()
+    assert table.column('mixed').to_pylist() == ['1', '2', '0012', '3', None]
+    assert table.column('number').to_pylist() == [1.0, 2.0, 2.5, None, 4.0]
+    assert table.num_rows == 5
+    assert not (tmp_path / 'out.parquet.tmp').exists()
+
+
+def test_parquet_widen_twice(tmp_path):
+    pyarrow = pytest.importorskip('pyarrow')
+    pname = tmp_path / 'out.parquet'
+    table = _write_parquet(pname, [
+        [(1, 1, 'a')],
+        [(1.5, 1, 'b')],
+        [('x', 1, 'c')],
+    ])
+    assert table.schema.field('mixed').type == pyarrow.string()
+    assert table.column('mixed').to_pylist() == ['1', '1.5', 'x']
+    assert [p.name for p in tmp_path.iterdir()] == ['out.parquet']
+
+
+def test_parquet_abort(tmp_path):
+    pytest.importorskip('pyarrow')
+    pname = tmp_path / 'out.parquet'
+    writer = open_result_writer(pname, ['a'])
+    writer.write_rows([(1,)])
+    writer.write_rows([('x',)])
+    writer.abort()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_schema_catalog.py
+# @Time: 2023/12/17 09:30:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+from schema_catalog import SchemaCatalog, TableNames
+
+
+def test_lookup_is_case_insensitive():
+    catalog = SchemaCatalog()
+    catalog.add('Orders', [('id', 'INTEGER'), ('amount', 'REAL')], 2)
+    assert 'orders' in catalog and catalog.get('ORDERS').name == 'Orders'
+    assert catalog.columns('orders') == ['id', 'amount']
+    assert catalog.columns('missing') == []
+    assert catalog.table_columns() == {'Orders': ['id', 'amount']}
+
+
+def test_update_and_remove():
+    catalog = SchemaCatalog()
+    catalog.add('a', [('x', 'TEXT')], loaded=False)
+    catalog.add('b', [('y', 'TEXT')])
+    assert [table.name for table in catalog.lazy_tables()] == ['a']
+    assert catalog.update('A', loaded=True, rows_count=3).rows_count == 3
+    assert catalog.update('missing', rows_count=1) is None
+    assert catalog.lazy_tables() == []
+    assert catalog.remove('B').name == 'b' and catalog.remove('b') is None
+    assert catalog.tables_name() == ['a']
+
+
+def test_table_names_copy():
+    catalog = SchemaCatalog()
+    catalog.add('Sheet1', [])
+    names = catalog.table_names()
+    names.add('Sheet2')
+    assert 'SHEET1' in names and 'sheet2' in names and 'Sheet2' not in catalog
+    names.discard('sheet1')
+    assert len(TableNames(['a', 'A'])) == 1 and 'Sheet1' not in names
+
+
+def test_refresh_keeps_source(conn):
+    catalog = SchemaCatalog()
+    conn.execute('CREATE TABLE orders (id INTEGER, amount REAL)')
+    conn.execute('CREATE TABLE old (id)')
+    catalog.add('orders', [('id', 'INTEGER')], 10, ('book.xlsx', 'orders'), item='node')
+    catalog.add('old', [('id', '')])
+    conn.execute('DROP TABLE old')
+    conn.execute('ALTER TABLE orders ADD COLUMN note TEXT')
+    conn.execute('CREATE VIEW big AS SELECT * FROM orders WHERE amount > 100')
+    added, removed = catalog.refresh(conn)
+    assert added == ['big'] and removed == ['old']
+    orders = catalog.get('orders')
+    assert orders.columns == [('id', 'INTEGER'), ('amount', 'REAL'), ('note', 'TEXT')]
+    assert orders.source == ('book.xlsx', 'orders') and orders.item == 'node' and orders.rows_count is None
+    assert catalog.get('big').is_view and not orders.is_view
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_sql_script.py
+# @Time: 2023/12/17 14:20:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import pytest
+from sql_script import ScriptRunner, ScriptError
+
+
+def _count(conn, table_name: str) -> int:
+    return conn.execute(f'SELECT count(*) FROM {table_name}').fetchone()[0]
+
+
+def test_run_script(conn):
+    runner = ScriptRunner('create table t (id);\ninsert into t values (1), (2);\nselect * from t; select count(*) from t;')
+    fetched = []
+    results = runner.run(conn, lambda cursor: len(fetched.extend(cursor.fetchall()) or fetched))
+    assert [(result.kind, result.rows) for result in results] == [('other', None), ('change', 2), ('query', 2), ('result', 1)]
+    assert fetched == [(2,)] and not conn.in_transaction
+
+
+def test_failing_statement_rolls_back_script(conn):
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY)')
+    sql = 'insert into t values (1);\ninsert into t values (2);\n  insert into t values (3), (1);\ninsert into t values (4);'
+    runner = ScriptRunner(sql)
+    with pytest.raises(ScriptError) as info:
+        runner.run(conn)
+    error = info.value
+    assert (error.index, error.line, error.offset) == (2, 3, sql.index('  insert into t values (3)') + 2)
+    assert sql[error.offset:].startswith(error.sql) and error.sql == 'insert into t values (3), (1);'
+    assert '第[3]条语句（第[3]行）' in str(error) and 'UNIQUE' in str(error.error)
+    assert [result.index for result in error.results] == [0, 1] and error.rolled_back
+    # 失败的语句插入的(3)和前面的语句都回滚了
+    assert _count(conn, 't') == 0 and not conn.in_transaction
+
+
+def test_cancel_keeps_finished_statements(conn):
+    conn.execute('CREATE TABLE t (id)')
+    conn.commit()
+    sql = ('insert into t values (1); insert into t values (2);\n'
+           'with recursive n(i) as (select 1 union all select i + 1 from n) select count(*) from n')
+    runner = ScriptRunner(sql)
+    results = []
+    interrupted = []
+
+    def progress_handler() -> int:
+        # 和SqlWorker一样在progress handler中中断正在执行的第三条语句
+        if len(results) == 2:
+            interrupted.append(True)
+        return 1 if interrupted else 0
+
+    conn.set_progress_handler(progress_handler, 1000)
+    with pytest.raises(ScriptError) as info:
+        runner.run(conn, on_statement=results.append, cancelled=lambda: bool(interrupted))
+    conn.set_progress_handler(None, 0)
+    assert (info.value.index, info.value.line) == (2, 2) and not info.value.rolled_back
+    # 只回滚到被中断的语句的保存点，前面的语句已经提交
+    assert _count(conn, 't') == 2 and not conn.in_transaction
+
+
+def test_script_managing_its_own_transaction(conn):
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY)')
+    conn.commit()
+    runner = ScriptRunner('begin; insert into t values (1); commit; insert into t values (1)')
+    with pytest.raises(ScriptError) as info:
+        runner.run(conn)
+    assert info.value.index == 3 and not info.value.rolled_back and _count(conn, 't') == 1
+
+
+def test_semicolons_inside_statements(conn):
+    sql = ("create table log (msg);\n"
+           "create table t (id, note);\n"
+           "-- a comment; not a statement\n"
+           "create trigger t_log after insert on t begin\n"
+           "  insert into log values ('added; ' || new.id);\n"
+           "  insert into log values (new.note);\n"
+           "end;\n"
+           "insert into t values (1, 'a;b'); /* ; */\n"
+           "select msg from log order by rowid")
+    runner = ScriptRunner(sql)
+    assert len(runner.statements) == 5 and runner.statements[2].endswith('end;') and runner.result_index == 4
+    rows = []
+    runner.run(conn, lambda cursor: len(rows.extend(cursor.fetchall()) or rows))
+    assert rows == [('added; 1',), ('a;b',)]
+
+
+def test_failing_trigger_body_reports_position(conn):
+    sql = ("create table t (id);\n"
+           "create trigger t_bad after insert on t begin\n"
+           "  insert into missing values (new.id);\n"
+           "end;\n"
+           "insert into t values (1);")
+    runner = ScriptRunner(sql)
+    with pytest.raises(ScriptError) as info:
+        runner.run(conn)
+    assert (info.value.index, info.value.line, info.value.offset) == (2, 5, sql.index('insert into t values (1)'))
+    assert conn.execute("SELECT count(*) FROM sqlite_master WHERE name IN ('t', 't_bad')").fetchone()[0] == 0
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_sql_tokenizer.py
+# @Time: 2023/12/17 10:10:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+from sql_tokenizer import tokenize, significant_tokens, split_statements, strip_trailing_semicolons
+
+
+def test_tokenize_kinds():
+    tokens = significant_tokens("select [a b], \"c\"\"d\", 'it''s', 1.5e3, :name from t -- done")
+    assert [(token.kind, token.value) for token in tokens] == [
+        ('name', 'select'), ('quoted', 'a b'), ('op', ','), ('quoted', 'c"d'), ('op', ','), ('string', "'it''s'"),
+        ('op', ','), ('number', '1.5e3'), ('op', ','), ('param', ':name'), ('name', 'from'), ('name', 't')]
+    sql = 'select 1 /* ; */ ;'
+    assert ''.join(token.text for token in tokenize(sql)) == sql
+
+
+def test_unterminated_tokens_run_to_end():
+    assert [token.kind for token in significant_tokens("select 'abc")] == ['name', 'string']
+    assert significant_tokens('select [abc')[-1].value == 'abc'
+
+
+def test_split_statements():
+    sql = "select 1; select ';' as a; -- comment ;\nselect \"x;y\" from [t;1];\n/* ; */\n;;select 4"
+    assert split_statements(sql) == ['select 1;', "select ';' as a;", '-- comment ;\nselect "x;y" from [t;1];', 'select 4']
+
+
+def test_split_statements_ignores_empty_parts():
+    assert split_statements('') == []
+    assert split_statements(' ; -- only comment\n; /* c */') == []
+    assert split_statements('select 1') == ['select 1']
+
+
+def test_split_trigger_body():
+    trigger = ('CREATE TRIGGER t_log AFTER INSERT ON t BEGIN\n'
+               '  INSERT INTO log VALUES (new.id, \'a;b\');\n'
+               '  UPDATE t SET n = n + 1 WHERE id = new.id;\n'
+               'END;')
+    assert split_statements(f'create table t (id, n);\n{trigger}\ninsert into t values (1, 0);') == \
+        ['create table t (id, n);', trigger, 'insert into t values (1, 0);']
+
+
+def test_strip_trailing_semicolons():
+    assert strip_trailing_semicolons('select 1 ; -- end\n;  ') == 'select 1'
+    assert strip_trailing_semicolons("select ';'") == "select ';'"
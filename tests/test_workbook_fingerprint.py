@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: test_workbook_fingerprint.py
+# @Time: 2023/12/17 11:10:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import os
+import json
+import pytest
+from workbook_fingerprint import fingerprint_workbook, diff_workbook, fingerprint_to_json, fingerprint_from_json
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+def _save(pname, sheets: dict) -> None:
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        for row in rows:
+            ws.append(row)
+    wb.save(pname)
+
+
+def test_diff_workbook(tmp_path):
+    pname = tmp_path / 'book.xlsx'
+    _save(pname, {'a': [('id', 'name'), (1, 'x')], 'b': [('v',), (2,)], 'c': [('w',)]})
+    old = fingerprint_from_json(json.loads(json.dumps(fingerprint_to_json(fingerprint_workbook(pname)))))
+    assert old == fingerprint_workbook(pname)
+    assert diff_workbook(old, fingerprint_workbook(pname), pname).changed == []
+    _save(pname, {'a': [('id', 'name'), (1, 'x')], 'b': [('v',), (3,)], 'd': [('z',)]})
+    stat = os.stat(pname)
+    os.utime(pname, ns=(stat.st_atime_ns, old.mtime_ns + 10 ** 9))
+    changes = diff_workbook(old, fingerprint_workbook(pname), pname)
+    assert changes.changed == ['b'] and changes.added == ['d'] and changes.removed == ['c'] and changes.unchanged == ['a']
+
+
+def test_csv_cannot_diff(tmp_path):
+    pname = tmp_path / 'data.csv'
+    pname.write_text('a\n1\n')
+    fingerprint = fingerprint_workbook(pname)
+    assert fingerprint.sheets is None and diff_workbook(fingerprint, fingerprint, pname) is None
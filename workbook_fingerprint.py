@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: workbook_fingerprint.py
+# @Time: 2023/10/21 10:30:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import zlib
+import zipfile
+import posixpath
+from pathlib import Path
+from collections import namedtuple
+from xml.etree import ElementTree
+
+_NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_NS_PACKAGE_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_WORKBOOK_PART = 'xl/workbook.xml'
+_WORKBOOK_RELS_PART = 'xl/_rels/workbook.xml.rels'
+
+# Excel文件的指纹，重新加载时和上次的指纹对比，找出内容变化的表格
+# size, mtime_ns: 文件大小和修改时间，都没变时认为文件没有变化
+# workbook: 影响所有表格的设置（1904日期系统），变化时所有表格都要重新导入
+# sheets: {表格名称: (xml文件名, crc32, 大小)}，xls、csv文件为None（不能按表格对比）
+# shared_strings: 共享字符串表中每个字符串的crc32
+# styles: 每个单元格样式的数字格式的crc32，数字格式决定读出来的是日期还是数字
+WorkbookFingerprint = namedtuple('WorkbookFingerprint', ['size', 'mtime_ns', 'workbook', 'sheets', 'shared_strings', 'styles'])
+
+# 对比的结果，都是表格名称的列表
+SheetChanges = namedtuple('SheetChanges', ['changed', 'added', 'removed', 'unchanged'])
+
+
+def _crc32(text: str) -> int:
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def _read_rels(zf: zipfile.ZipFile) -> dict[str, tuple[str, str]]:
+    '''
+    workbook的关系 {Id: (类型, zip中的文件名)}
+    '''
+    rels = {}
+    root = ElementTree.fromstring(zf.read(_WORKBOOK_RELS_PART))
+    for rel in root.iter(f'{_NS_PACKAGE_REL}Relationship'):
+        target = rel.get('Target', '')
+        # Target可能是相对xl/的路径，也可能是/开头的绝对路径
+        part = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+        rels[rel.get('Id')] = (rel.get('Type', ''), part)
+    return rels
+
+
+def _read_shared_strings(zf: zipfile.ZipFile, part: str) -> list[int]:
+    if part not in zf.namelist():
+        return []
+    digests = []
+    with zf.open(part) as f:
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag == f'{_NS_MAIN}si':
+                # 富文本有多个<r><t>，拼起来就是单元格的内容
+                digests.append(_crc32(''.join(elem.itertext())))
+                elem.clear()
+    return digests
+
+
+def _read_styles(zf: zipfile.ZipFile, part: str) -> list[int]:
+    if part not in zf.namelist():
+        return []
+    root = ElementTree.fromstring(zf.read(part))
+    formats = {fmt.get('numFmtId'): fmt.get('formatCode', '') for fmt in root.iter(f'{_NS_MAIN}numFmt')}
+    cell_xfs = root.find(f'{_NS_MAIN}cellXfs')
+    if cell_xfs is None:
+        return []
+    digests = []
+    for xf in cell_xfs.findall(f'{_NS_MAIN}xf'):
+        num_fmt_id = xf.get('numFmtId', '0')
+        digests.append(_crc32(f'{num_fmt_id}|{formats.get(num_fmt_id, "")}'))
+    return digests
+
+
+def fingerprint_workbook(pname: Path) -> WorkbookFingerprint:
+    '''
+    计算Excel文件的指纹，xlsx只读取zip目录、共享字符串和样式，不解析表格的内容，xls、csv文件只有大小和修改时间
+    '''
+    pname = Path(pname)
+    stat = pname.stat()
+    if pname.suffix.lower() != '.xlsx':
+        return WorkbookFingerprint(stat.st_size, stat.st_mtime_ns, None, None, None, None)
+    with zipfile.ZipFile(pname) as zf:
+        rels = _read_rels(zf)
+        workbook = ElementTree.fromstring(zf.read(_WORKBOOK_PART))
+        pr = workbook.find(f'{_NS_MAIN}workbookPr')
+        date1904 = pr.get('date1904', '0') if pr is not None else '0'
+        sheets = {}
+        for sheet in workbook.iter(f'{_NS_MAIN}sheet'):
+            rel_type, part = rels.get(sheet.get(f'{{{_NS_REL}}}id'), ('', ''))
+            # 图表页不是数据表格
+            if not rel_type.endswith('/worksheet') or part not in zf.namelist():
+                continue
+            info = zf.getinfo(part)
+            sheets[sheet.get('name')] = (part, info.CRC, info.file_size)
+        shared_strings_part = next((part for rel_type, part in rels.values() if rel_type.endswith('/sharedStrings')), '')
+        styles_part = next((part for rel_type, part in rels.values() if rel_type.endswith('/styles')), '')
+        return WorkbookFingerprint(stat.st_size, stat.st_mtime_ns, date1904, sheets,
+                                   _read_shared_strings(zf, shared_strings_part), _read_styles(zf, styles_part))
+
+
+def _changed_indexes(old: list[int], new: list[int]) -> set[int]:
+    '''
+    同一个位置内容不同的下标，新增在末尾的不算（没有变化的表格不会引用新增的字符串和样式）
+    '''
+    changed = {index for index, (old_digest, new_digest) in enumerate(zip(old, new)) if old_digest != new_digest}
+    changed.update(range(len(new), len(old)))
+    return changed
+
+
+def _references(zf: zipfile.ZipFile, part: str, strings: set[int], styles: set[int]) -> bool:
+    '''
+    表格的单元格是否引用了这些共享字符串或样式，找到第一个就返回
+    '''
+    with zf.open(part) as f:
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag != f'{_NS_MAIN}c':
+                continue
+            if styles and int(elem.get('s', '0')) in styles:
+                return True
+            if strings and elem.get('t') == 's':
+                value = elem.find(f'{_NS_MAIN}v')
+                if value is not None and value.text and int(value.text) in strings:
+                    return True
+            elem.clear()
+    return False
+
+
+def diff_workbook(old: WorkbookFingerprint, new: WorkbookFingerprint, pname: Path) -> SheetChanges:
+    '''
+    对比两次的指纹，找出需要重新导入的表格，不能按表格对比时（xls、csv文件，影响所有表格的设置变化了）返回None
+    xml没有变化的表格，只有引用的共享字符串或样式变化了才需要重新导入，这时才解析这个表格的xml
+    '''
+    if old is None or old.sheets is None or new.sheets is None or old.workbook != new.workbook:
+        return None
+    if (old.size, old.mtime_ns) == (new.size, new.mtime_ns):
+        return SheetChanges([], [], [], list(new.sheets))
+    strings = _changed_indexes(old.shared_strings, new.shared_strings)
+    styles = _changed_indexes(old.styles, new.styles)
+    changes = SheetChanges([], [], [name for name in old.sheets if name not in new.sheets], [])
+    with zipfile.ZipFile(pname) as zf:
+        for name, (part, crc, size) in new.sheets.items():
+            if name not in old.sheets:
+                changes.added.append(name)
+            elif old.sheets[name][1:] != (crc, size):
+                changes.changed.append(name)
+            elif (strings or styles) and _references(zf, part, strings, styles):
+                changes.changed.append(name)
+            else:
+                changes.unchanged.append(name)
+    return changes
+
+
+def fingerprint_to_json(fingerprint: WorkbookFingerprint) -> dict:
+    '''
+    转换成可以保存为json的dict，保存工作区时用
+    '''
+    return fingerprint._asdict() if fingerprint else None
+
+
+def fingerprint_from_json(data: dict) -> WorkbookFingerprint:
+    '''
+    json中的tuple都变成了list，还原成tuple，对比时才能和新的指纹相等
+    '''
+    if not data:
+        return None
+    sheets = {name: tuple(info) for name, info in data['sheets'].items()} if data.get('sheets') is not None else None
+    return WorkbookFingerprint(data['size'], data['mtime_ns'], data['workbook'], sheets, data['shared_strings'], data['styles'])
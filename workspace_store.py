@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# - *- coding: utf-8 -*-
+
+# @File: workspace_store.py
+# @Time: 2023/11/04 10:15:00
+# @Author: robertqian
+# @Contact: robertqian@live.com
+# @Licence: MIT
+# @Desc: None
+
+import os
+import json
+import sqlite3
+from pathlib import Path
+
+WORKSPACE_SUFFIX = '.sqlite'
+METADATA_TABLE = '_sql_for_excel_workspace' # 工作区文件中保存界面状态的表，打开后删除
+METADATA_VERSION = 1
+BACKUP_PAGES = 4096 # 每次备份的页数，-1表示一次全部复制
+
+
+class WorkspaceError(Exception):
+    pass
+
+
+def default_workspace_path() -> Path:
+    '''
+    退出时自动保存的工作区文件，和导入缓存放在同一个目录下
+    '''
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'sql_for_excel' / 'workspace' / f'autosave{WORKSPACE_SUFFIX}'
+
+
+def save_workspace(conn: sqlite3.Connection, pname: Path, metadata: dict) -> None:
+    '''
+    用sqlite的备份接口把整个数据库（表、索引）按页复制到文件，metadata(可以转换成json)写到文件中的METADATA_TABLE表
+    先写到临时文件再替换，保存失败时不会破坏已有的工作区文件
+    '''
+    pname = Path(pname)
+    pname.parent.mkdir(parents=True, exist_ok=True)
+    tmp_pname = pname.with_name(f'{pname.name}.tmp')
+    tmp_pname.unlink(missing_ok=True)
+    dst = sqlite3.connect(tmp_pname)
+    try:
+        conn.backup(dst, pages=BACKUP_PAGES)
+        # 备份的是内存数据库的页，文件用默认的日志模式，其他工具也可以直接打开
+        dst.execute('PRAGMA journal_mode=DELETE')
+        dst.execute(f'DROP TABLE IF EXISTS [{METADATA_TABLE}]')
+        dst.execute(f'CREATE TABLE [{METADATA_TABLE}] (version INTEGER, metadata TEXT)')
+        dst.execute(f'INSERT INTO [{METADATA_TABLE}] VALUES (?, ?)', (METADATA_VERSION, json.dumps(metadata, ensure_ascii=False)))
+        dst.commit()
+    except Exception:
+        dst.close()
+        tmp_pname.unlink(missing_ok=True)
+        raise
+    dst.close()
+    os.replace(tmp_pname, pname)
+
+
+def read_metadata(pname: Path) -> dict:
+    '''
+    只读取工作区文件中的界面状态，不是工作区文件时抛出WorkspaceError
+    '''
+    pname = Path(pname)
+    if not pname.is_file():
+        raise WorkspaceError(f'工作区文件不存在【{pname}】')
+    src = sqlite3.connect(f'{pname.resolve().as_uri()}?mode=ro', uri=True)
+    try:
+        row = src.execute(f'SELECT version, metadata FROM [{METADATA_TABLE}]').fetchone()
+    except sqlite3.DatabaseError as ex:
+        raise WorkspaceError(f'不是有效的工作区文件【{pname}】 {str(ex)}')
+    finally:
+        src.close()
+    if row is None or row[0] > METADATA_VERSION:
+        raise WorkspaceError(f'不支持的工作区文件版本【{pname}】')
+    return json.loads(row[1])
+
+
+def load_workspace(conn: sqlite3.Connection, pname: Path) -> dict:
+    '''
+    用sqlite的备份接口把工作区文件复制到conn的数据库，原来的表都被替换，不需要再读取Excel文件
+    返回保存时的metadata
+    '''
+    metadata = read_metadata(pname)
+    src = sqlite3.connect(f'{Path(pname).resolve().as_uri()}?mode=ro', uri=True)
+    try:
+        src.backup(conn, pages=BACKUP_PAGES)
+    finally:
+        src.close()
+    conn.execute(f'DROP TABLE IF EXISTS [{METADATA_TABLE}]')
+    conn.commit()
+    return metadata